@@ -0,0 +1,199 @@
+"""Tool for running many vehicle simulations in a single asyncio event loop.
+
+Unlike `dojo.py`, which spreads vehicles across worker processes, the
+`AsyncFleetCoordinator` steps thousands of lightweight vehicle instances
+cooperatively in one thread, interleaved with I/O bound coroutines e.g.
+telemetry sinks or twin model updates, which consume sim outputs through async
+iterators.
+"""
+
+import argparse
+import asyncio
+import time
+
+from telemetry import event_log
+from vehicle_model import vehicle
+
+
+# Constants.
+BATCH_SIZE = 256  # [], vehicles stepped between yields to the event loop.
+QUEUE_SIZE = 128  # [], sim outputs buffered per subscriber.
+
+
+class AsyncFleetCoordinator:
+  """Steps many vehicles cooperatively on a shared simulated clock.
+
+  Every tick, each vehicle is stepped by `period` simulated seconds, and its
+  sim outputs are published to its subscribers. The event loop gets control
+  back every `batch_size` vehicles, and between ticks. If `realtime`, ticks are
+  paced against the wall clock by awaiting, never sleeping, so other coroutines
+  keep running. Subscribers that fall behind apply backpressure: publishing
+  waits for room in their bounded queues.
+  """
+
+  def __init__(
+      self, vehicles=(), period=vehicle.DATA_RATE, realtime=False,
+      batch_size=BATCH_SIZE, queue_size=QUEUE_SIZE):
+    """Initializes an AsyncFleetCoordinator.
+
+    Args:
+      vehicles: iterable of `vehicle.Vehicle` instances to step.
+      period: float representing simulated time [s] per tick.
+      realtime: bool, if `True` each tick takes (at least) `period` seconds.
+      batch_size: int representing vehicles stepped between yields.
+      queue_size: int representing sim outputs buffered per subscriber.
+    """
+    self._vehicles = {}
+    self._subscribers = {}
+    self._period = period
+    self._realtime = realtime
+    self._batch_size = batch_size
+    self._queue_size = queue_size
+    self._num_ticks = 0
+
+    for vehicle_instance in vehicles:
+      self.add_vehicle(vehicle_instance)
+
+  def add_vehicle(self, vehicle_instance):
+    """Adds a vehicle, stepped from the next tick on."""
+    self._vehicles[vehicle_instance.get_vehicle_id()] = vehicle_instance
+    self._subscribers.setdefault(vehicle_instance.get_vehicle_id(), [])
+
+  def get_vehicle_ids(self):
+    """Returns the IDs of the coordinated vehicles."""
+    return list(self._vehicles)
+
+  def get_num_ticks(self):
+    """Returns the number of ticks run."""
+    return self._num_ticks
+
+  async def outputs(self, vehicle_id):
+    """Async iterator of a vehicle's sim outputs, one `SimOutput` per tick.
+
+    Iteration starts from the next tick after the first `__anext__` call, and
+    ends when the coordinator run ends.
+    """
+    queue = asyncio.Queue(self._queue_size)
+    self._subscribers[vehicle_id].append(queue)
+
+    try:
+      while True:
+        sim_outputs = await queue.get()
+        if sim_outputs is None:
+          return
+        yield sim_outputs
+    finally:
+      self._subscribers[vehicle_id].remove(queue)
+
+  async def _publish(self, vehicle_id, sim_outputs):
+    """Publishes a snapshot of sim outputs to a vehicle's subscribers."""
+    queues = self._subscribers[vehicle_id]
+    if not queues:
+      return
+
+    snapshot = sim_outputs.copy()
+    for queue in queues:
+      await queue.put(snapshot)
+
+  async def run(self, sim_seconds):
+    """Runs every vehicle for a span of simulated time.
+
+    Args:
+      sim_seconds: float representing simulated time [s] to run for.
+    Returns:
+      num_ticks: int representing the number of ticks run.
+    """
+    num_ticks = int(round(sim_seconds / self._period))
+    loop = asyncio.get_running_loop()
+    next_deadline = loop.time()
+
+    # Let subscribers started alongside the run register first.
+    await asyncio.sleep(0)
+
+    for _ in range(num_ticks):
+      vehicles = list(self._vehicles.items())
+      for start in range(0, len(vehicles), self._batch_size):
+        for vehicle_id, vehicle_instance in vehicles[
+            start:start + self._batch_size]:
+          vehicle_instance.step(self._period)
+          if self._subscribers[vehicle_id]:
+            await self._publish(vehicle_id, vehicle_instance.get_sim_outputs())
+        await asyncio.sleep(0)
+
+      self._num_ticks += 1
+
+      if self._realtime:
+        next_deadline += self._period
+        remaining = next_deadline - loop.time()
+        if remaining > 0:
+          await asyncio.sleep(remaining)
+        else:
+          # Running behind; re-anchor rather than bursting to catch up.
+          next_deadline = loop.time()
+
+    for queues in self._subscribers.values():
+      for queue in queues:
+        await queue.put(None)
+
+    return num_ticks
+
+
+async def _count_outputs(coordinator, vehicle_id, counts):
+  """Example telemetry sink, counting the sim outputs of a vehicle."""
+  async for _ in coordinator.outputs(vehicle_id):
+    counts[vehicle_id] = counts.get(vehicle_id, 0) + 1
+
+
+async def _main(args):
+  coordinator = AsyncFleetCoordinator(
+      (vehicle.Vehicle(
+          vehicle_id=i+1, fault_injection_mode=args.fault_injection_mode,
+          seed=args.seed) for i in range(args.num_vehicles)),
+      realtime=args.realtime)
+
+  counts = {}
+  sinks = [
+      asyncio.create_task(_count_outputs(coordinator, vehicle_id, counts))
+      for vehicle_id in coordinator.get_vehicle_ids()[:args.num_subscribed]]
+
+  start_time = time.perf_counter()
+  num_ticks = await coordinator.run(args.sim_run_time)
+  await asyncio.gather(*sinks)
+  wall_time = time.perf_counter() - start_time
+
+  print(f"Vehicles: {args.num_vehicles}, ticks: {num_ticks}, "
+        f"wall time: {wall_time:.2f} s, vehicle steps/s: "
+        f"{args.num_vehicles * num_ticks / wall_time:.0f}, "
+        f"outputs received: {sum(counts.values())}.")
+
+
+if __name__ == "__main__":
+  # Parse user input arguments.
+  parser = argparse.ArgumentParser()
+
+  parser.add_argument(
+      "--num_vehicles", type=int, required=True,
+      help="Number of vehicle instances to coordinate.")
+  parser.add_argument(
+      "--sim_run_time", type=float, required=True,
+      help="Number of seconds to run each vehicle simulation.")
+  parser.add_argument(
+      "--seed", type=int, default=None,
+      help="Seed for reproducible runs. Unseeded runs use fresh entropy.")
+  parser.add_argument(
+      "--fault_injection_mode", action=argparse.BooleanOptionalAction,
+      default=True, help="Random fault injection in the ECUs.")
+  parser.add_argument(
+      "--realtime", action="store_true",
+      help="Pace the simulation against the wall clock.")
+  parser.add_argument(
+      "--num_subscribed", type=int, default=10,
+      help="Number of vehicles whose sim outputs are consumed by a sink.")
+  parser.add_argument(
+      "--dtc_stdout", action="store_true",
+      help="Print DTC events and fault tree inference results to stdout.")
+
+  args = parser.parse_args()
+  event_log.set_default_stdout(args.dtc_stdout)
+
+  asyncio.run(_main(args))
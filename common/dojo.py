@@ -1,40 +1,188 @@
 """Tool for running multiple instances of a vehicle simulation.
 
 The purpose of `dojo.py` is to parallelize  online training of the digital twin
-model by wrapping each vehicle instance in its own process.
+model by running vehicle instances across a pool of worker processes.
 """
 
 import argparse
-import time
+import collections
+import functools
+import os
+import threading
 
 from multiprocessing.pool import Pool
 
-from vehicle_model import vehicle
+from telemetry import event_log, shm_ring, trace_file
+from vehicle_model import drive_cycle, vehicle
 
 
 # Constants.
 RUN_TIME = 2  # [Sec], simulation runtime.
+CHUNKS_PER_WORKER = 4  # [], vehicle spec chunks handed to each worker.
+RING_POLL_INTERVAL = 0.01  # [s], interval at which output rings are drained.
 
+# Lightweight description of a vehicle to simulate, cheap to create and pickle.
+# Vehicles are built from their spec inside the worker process that runs them.
+VehicleSpec = collections.namedtuple(
+    "VehicleSpec",
+    ["vehicle_id", "seed", "fault_injection_mode", "drive_cycle_path",
+     "cycle_offset"])
 
-def spawn_vehicles(num_vehicles):
-  """Creates multiple vehicle instances to run in parallel."""
-  vehicle_instances = [
-      vehicle.Vehicle(vehicle_id=i+1, fault_injection_mode=True) for i in range(num_vehicles)]
-  for vehicle_instance in vehicle_instances:
-    print(f"Created vehicle: {vehicle_instance.get_vehicle_id()}.")
 
-  return vehicle_instances
+def make_vehicle_specs(
+    num_vehicles, seed=None, fault_injection_mode=True, drive_cycle_path=None,
+    cycle_offset=0.0):
+  """Yields specs of multiple vehicles to run in parallel.
 
-def run_vehicle(vehicle_instance):
-  """Runs a standalone vehicle simulation i.e. without plotting."""
-  start_time = time.time()
+  Each vehicle draws from its own random streams, derived from `seed` and its
+  vehicle ID, so a seeded run is reproducible regardless of worker scheduling.
+  Vehicles on a drive cycle share its memory-mapped cycle file, each starting
+  `cycle_offset` seconds further into it than the previous vehicle.
+  """
+  for i in range(num_vehicles):
+    yield VehicleSpec(
+        vehicle_id=i+1, seed=seed, fault_injection_mode=fault_injection_mode,
+        drive_cycle_path=drive_cycle_path, cycle_offset=i * cycle_offset)
 
-  while (time.time() - start_time) <= RUN_TIME:
-    vehicle_instance.run_time_step(start_time)
-    msg = vehicle_instance.get_sim_outputs()
-    print(msg)
 
-  return vehicle_instance.get_vehicle_id()
+def build_vehicle(spec):
+  """Creates a vehicle instance from its spec."""
+  cycle = None
+  if spec.drive_cycle_path:
+    cycle = drive_cycle.get_drive_cycle(spec.drive_cycle_path)
+
+  return vehicle.Vehicle(
+      vehicle_id=spec.vehicle_id,
+      fault_injection_mode=spec.fault_injection_mode, seed=spec.seed,
+      drive_cycle=cycle, cycle_offset=spec.cycle_offset)
+
+
+@functools.lru_cache(maxsize=None)
+def _attach_ring_buffer(shm_name):
+  """Attaches to a shared ring buffer, once per worker process."""
+  return shm_ring.SharedRingBuffer(name=shm_name)
+
+
+def run_vehicle(
+    spec, sim_run_time=RUN_TIME, trace_dir=None, shm_name=None,
+    block_timeout=0.0):
+  """Builds and runs a standalone vehicle simulation i.e. without plotting.
+
+  The vehicle is stepped on its simulated clock, so `sim_run_time` seconds of
+  drive time complete as fast as the host allows. Sim outputs are archived to
+  a trace file in `trace_dir` if given, written to ring `vehicle_id - 1` of the
+  shared ring buffer `shm_name` if given, and printed otherwise.
+
+  Args:
+    spec: `VehicleSpec` of the vehicle to run.
+    sim_run_time: float representing simulated time [s] to run for.
+    trace_dir: optional string representing directory to write traces to.
+    shm_name: optional string representing name of a shared ring buffer.
+    block_timeout: float representing the time [s] to wait on a full ring
+      before dropping a row.
+  Returns:
+    vehicle_id: int representing the ID of the vehicle that was run.
+  """
+  vehicle_instance = build_vehicle(spec)
+  vehicle_id = vehicle_instance.get_vehicle_id()
+
+  # Pool workers exit without running `atexit` handlers, so the vehicle's DTC
+  # events are written before it is reported done.
+  try:
+    if shm_name and not trace_dir:
+      writer = _attach_ring_buffer(shm_name).writer(
+          vehicle_id - 1, block_timeout)
+      vehicle_instance.attach_recorder(writer)
+      vehicle_instance.run_for(sim_run_time)
+      writer.close()
+      return vehicle_id
+
+    if not trace_dir:
+      vehicle_instance.run_for(sim_run_time, callback=print)
+      return vehicle_id
+
+    trace_path = os.path.join(trace_dir, f"vehicle_{vehicle_id}.trace")
+    max_samples = int(round(sim_run_time / vehicle.DATA_RATE))
+
+    with trace_file.TraceWriter(
+        trace_path, max_samples, vehicle_ids=(vehicle_id,),
+        parameters={"sim_run_time": sim_run_time},
+        seed=vehicle_instance.get_seed()) as writer:
+      vehicle_instance.attach_recorder(writer)
+      vehicle_instance.run_for(sim_run_time)
+
+    return vehicle_id
+  finally:
+    event_log.flush_default_log()
+
+
+def _drain_rings(ring_buffer, indices, on_rows):
+  """Passes the unread rows of rings to `on_rows(vehicle_id, rows)`."""
+  for index in indices:
+    ring_buffer.drain(index, functools.partial(on_rows, int(index) + 1))
+
+
+def run_vehicles(
+    specs, num_vehicles, sim_run_time=RUN_TIME, trace_dir=None, processes=None,
+    ring_buffer=None, on_rows=None, block_timeout=0.0):
+  """Runs vehicles across a pool of workers, yielding results as they finish.
+
+  Only the specs are sent to the workers, in chunks, and each worker builds and
+  runs many vehicles in turn, so start up cost scales with the number of
+  workers rather than vehicles.
+
+  With a `ring_buffer`, workers write sim outputs to the ring of each vehicle
+  and a thread of this process drains them into `on_rows` while the vehicles
+  run. Rows are passed as views of shared memory, valid only during the call.
+
+  Args:
+    specs: iterable of `VehicleSpec`s.
+    num_vehicles: int representing the number of specs, to size the chunks.
+    sim_run_time: float representing simulated time [s] to run each for.
+    trace_dir: optional string representing directory to write traces to.
+    processes: optional int representing number of worker processes.
+    ring_buffer: optional `shm_ring.SharedRingBuffer` with a ring per vehicle.
+    on_rows: callable invoked as `on_rows(vehicle_id, rows)` for each block of
+      rows drained from `ring_buffer`.
+    block_timeout: float representing the time [s] workers wait on a full ring
+      before dropping a row.
+  Yields:
+    The ID of each vehicle, in completion order, once its rows are drained.
+  """
+  processes = processes or os.cpu_count()
+  chunksize = max(1, num_vehicles // (processes * CHUNKS_PER_WORKER))
+  shm_name = ring_buffer.get_name() if ring_buffer else None
+
+  with Pool(processes) as pool:
+    run_vehicle_for = functools.partial(
+        run_vehicle, sim_run_time=sim_run_time, trace_dir=trace_dir,
+        shm_name=shm_name, block_timeout=block_timeout)
+    results = pool.imap_unordered(run_vehicle_for, specs, chunksize)
+
+    if not shm_name:
+      yield from results
+      return
+
+    # Rings are drained in the background while waiting on results, and the
+    # ring of each finished vehicle is emptied before yielding it.
+    drain_lock = threading.Lock()
+    stop_draining = threading.Event()
+
+    def drain_pending():
+      while not stop_draining.wait(RING_POLL_INTERVAL):
+        with drain_lock:
+          _drain_rings(ring_buffer, ring_buffer.pending(), on_rows)
+
+    drain_thread = threading.Thread(target=drain_pending, daemon=True)
+    drain_thread.start()
+    try:
+      for vehicle_id in results:
+        with drain_lock:
+          _drain_rings(ring_buffer, (vehicle_id - 1,), on_rows)
+        yield vehicle_id
+    finally:
+      stop_draining.set()
+      drain_thread.join()
 
 
 if __name__ == "__main__":
@@ -47,12 +195,64 @@ if __name__ == "__main__":
   parser.add_argument(
       "--sim_run_time", type=float, required=True,
       help="Number of seconds to run each vehicle simulation.")
+  parser.add_argument(
+      "--seed", type=int, default=None,
+      help="Seed for reproducible runs. Unseeded runs use fresh entropy.")
+  parser.add_argument(
+      "--trace_dir", type=str, default=None,
+      help="Directory to write one trace file per vehicle to, "
+           "instead of printing sim outputs.")
+  parser.add_argument(
+      "--drive_cycle", type=str, default=None,
+      help="Drive cycle file feeding the vehicle inputs, as converted by "
+           "`drive_cycle.convert_profile`. Inputs are constant otherwise.")
+  parser.add_argument(
+      "--cycle_offset", type=float, default=0.0,
+      help="Time [s] between the drive cycle starts of consecutive vehicles.")
+  parser.add_argument(
+      "--fault_injection_mode", action=argparse.BooleanOptionalAction,
+      default=True, help="Random fault injection in the ECUs.")
+  parser.add_argument(
+      "--processes", type=int, default=None,
+      help="Number of worker processes. Defaults to the number of CPUs.")
+  parser.add_argument(
+      "--ring_capacity", type=int, default=shm_ring.DEFAULT_CAPACITY,
+      help="Rows per vehicle in the shared memory rings that carry sim "
+           "outputs to this process, when not writing traces.")
+  parser.add_argument(
+      "--block_timeout", type=float, default=0.01,
+      help="Seconds a worker waits on a full ring before dropping a row.")
+  parser.add_argument(
+      "--dtc_stdout", action="store_true",
+      help="Print DTC events and fault tree inference results to stdout.")
 
   args = parser.parse_args()
+  event_log.set_default_stdout(args.dtc_stdout)
 
   # Run vehicle simulation(s).
-  with Pool() as pool:
-    vehicle_instances = spawn_vehicles(args.num_vehicles)
+  vehicle_specs = make_vehicle_specs(
+      args.num_vehicles, seed=args.seed,
+      fault_injection_mode=args.fault_injection_mode,
+      drive_cycle_path=args.drive_cycle, cycle_offset=args.cycle_offset)
 
-    for result in pool.map(run_vehicle, vehicle_instances):
+  if args.trace_dir:
+    for result in run_vehicles(
+        vehicle_specs, args.num_vehicles, args.sim_run_time, args.trace_dir,
+        args.processes):
       print(f"End of simulation for Vehicle ID: {result}.", flush=True)
+  else:
+    num_rows = collections.Counter()
+
+    def count_rows(vehicle_id, rows):
+      num_rows[vehicle_id] += len(rows)
+
+    with shm_ring.SharedRingBuffer(
+        args.num_vehicles, args.ring_capacity) as ring_buffer:
+      for result in run_vehicles(
+          vehicle_specs, args.num_vehicles, args.sim_run_time,
+          processes=args.processes, ring_buffer=ring_buffer,
+          on_rows=count_rows, block_timeout=args.block_timeout):
+        print(f"End of simulation for Vehicle ID: {result}, "
+              f"rows: {num_rows[result]}, "
+              f"dropped: {ring_buffer.get_num_dropped(result - 1)}.",
+              flush=True)
@@ -0,0 +1,553 @@
+"""Multi-node fleet runner: a dojo coordinator and workers talking over TCP.
+
+The coordinator holds the vehicle specs to run. Workers, on any number of
+hosts, connect to it, pull batches of specs, build and run the vehicles, and
+stream back binary frames of sim outputs and DTC events. When the coordinator
+runs out of specs while some worker still has a backlog, it steals the
+unstarted half of that backlog for the idle worker, so a node that falls
+behind does not hold up the run.
+
+If a worker is lost, its outstanding specs are re-queued and their vehicles
+rerun from the start on another worker. Outputs stream through as they arrive,
+so the coordinator calls `on_restart(vehicle_id)` for each lost vehicle that
+had already sent sim outputs or DTC events; consumers should discard what they
+received for it so far, and the rerun sends it all again.
+
+Every message is a frame: a `FRAME_HEADER` (frame type, payload length)
+followed by the payload. Sim outputs travel as raw little-endian float64 rows
+laid out as `sim_output.SIGNALS`, and DTC events as `trace_file.DTC_EVENT_DTYPE`
+records. Control payloads are small JSON documents.
+
+To try it on one box: `dojo_cluster.py --num_vehicles 100 --sim_run_time 5
+--local_workers 4`, which starts the coordinator and four local worker
+processes standing in for nodes.
+"""
+
+import argparse
+import asyncio
+import collections
+import json
+import os
+import socket
+import struct
+import threading
+
+from multiprocessing import Process
+
+import numpy as np
+
+from common import dojo
+from telemetry import event_log
+from telemetry import trace_file
+from vehicle_model import sim_output
+
+
+# Constants.
+DEFAULT_PORT = 50051
+BATCH_SIZE = 16  # [], vehicle specs handed out per request.
+SHUTDOWN_TIMEOUT = 10.0  # [s], wait for workers to hang up after a run.
+ROWS_PER_FRAME = 100  # [], sim output rows per output frame.
+FRAME_HEADER = struct.Struct("<BI")  # Frame type, payload length [B].
+OUTPUT_HEADER = struct.Struct("<qI")  # Vehicle ID, number of rows.
+VEHICLE_ID = struct.Struct("<q")
+COUNT = struct.Struct("<I")
+
+# Frame types.
+## Worker to coordinator.
+HELLO = 1  # JSON worker description.
+REQUEST = 2  # No payload; asks for a batch of specs.
+OUTPUT = 3  # `OUTPUT_HEADER` followed by float64 rows.
+DTC_EVENTS = 4  # `trace_file.DTC_EVENT_DTYPE` records.
+DONE = 5  # `VEHICLE_ID` of a finished vehicle.
+RETURN = 6  # JSON list of specs given back after a steal.
+## Coordinator to worker.
+WELCOME = 11  # JSON run configuration.
+SPECS = 12  # JSON list of specs to run.
+STEAL = 13  # `COUNT` of unstarted specs to give back.
+SHUTDOWN = 14  # No payload.
+
+
+class ClusterError(Exception):
+  pass
+
+
+def encode_frame(frame_type, payload=b""):
+  """Returns a frame of the given type and payload bytes."""
+  return FRAME_HEADER.pack(frame_type, len(payload)) + payload
+
+
+def _encode_specs(specs):
+  return json.dumps([spec._asdict() for spec in specs]).encode()
+
+
+def _decode_specs(payload):
+  return [dojo.VehicleSpec(**spec) for spec in json.loads(payload)]
+
+
+def _recv_exactly(sock, num_bytes):
+  """Reads exactly `num_bytes` from a blocking socket."""
+  buffer = bytearray(num_bytes)
+  view = memoryview(buffer)
+  while view:
+    num_read = sock.recv_into(view)
+    if not num_read:
+      raise ClusterError("Connection closed.")
+    view = view[num_read:]
+
+  return bytes(buffer)
+
+
+def recv_frame(sock):
+  """Reads a frame from a blocking socket, returning (type, payload)."""
+  frame_type, length = FRAME_HEADER.unpack(
+      _recv_exactly(sock, FRAME_HEADER.size))
+  return frame_type, _recv_exactly(sock, length)
+
+
+async def _read_frame(reader):
+  """Reads a frame from an asyncio stream, returning (type, payload)."""
+  frame_type, length = FRAME_HEADER.unpack(
+      await reader.readexactly(FRAME_HEADER.size))
+  return frame_type, await reader.readexactly(length)
+
+
+class _WorkerState:
+  """Coordinator side bookkeeping of a connected worker."""
+
+  def __init__(self, name, writer):
+    self.name = name
+    self.writer = writer
+    self.outstanding = collections.OrderedDict()  # Vehicle ID to spec.
+    self.started = set()  # IDs of unfinished vehicles that sent outputs.
+    self.stealing = False
+
+
+class Coordinator:
+  """Hands out vehicle specs to workers and collects their outputs."""
+
+  def __init__(
+      self, specs, sim_run_time=dojo.RUN_TIME, batch_size=BATCH_SIZE,
+      rows_per_frame=ROWS_PER_FRAME, on_rows=None, on_dtc_events=None,
+      on_restart=None):
+    """Initializes a Coordinator.
+
+    Args:
+      specs: iterable of `dojo.VehicleSpec`s to run.
+      sim_run_time: float representing simulated time [s] to run each for.
+      batch_size: int representing specs handed out per worker request.
+      rows_per_frame: int representing sim output rows per output frame.
+      on_rows: optional callable invoked as `on_rows(vehicle_id, rows)` with
+        each (num_rows, NUM_SIGNALS) block of received sim outputs.
+      on_dtc_events: optional callable invoked with each received array of
+        `trace_file.DTC_EVENT_DTYPE` records.
+      on_restart: optional callable invoked as `on_restart(vehicle_id)` when a
+        vehicle that sent outputs is rerun from the start after its worker was
+        lost. The rows and DTC events received for it until then are repeated
+        by the rerun, and should be discarded.
+    """
+    self._pending = collections.deque(specs)
+    self._num_vehicles = len(self._pending)
+    self._config = {
+        "sim_run_time": sim_run_time, "rows_per_frame": rows_per_frame}
+    self._batch_size = batch_size
+    self._on_rows = on_rows
+    self._on_dtc_events = on_dtc_events
+    self._on_restart = on_restart
+    self._workers = {}
+    self._idle = collections.deque()  # Workers waiting for specs.
+    self._handlers = set()
+    self._done_per_worker = collections.Counter()
+    self._num_done = 0
+    self._num_steals = 0
+    self._num_restarts = 0
+    self._finished = None
+
+  def get_stats(self):
+    """Returns a dict of run statistics."""
+    return {
+        "vehicles": self._num_vehicles,
+        "done": self._num_done,
+        "steals": self._num_steals,
+        "restarts": self._num_restarts,
+        "done_per_worker": dict(self._done_per_worker),
+    }
+
+  async def serve(
+      self, host="0.0.0.0", port=DEFAULT_PORT, on_listening=None, sock=None):
+    """Serves workers until every vehicle has run.
+
+    Args:
+      host: string representing the interface to listen on.
+      port: int representing the port to listen on, or 0 for any free port.
+      on_listening: optional callable invoked with the bound port.
+      sock: optional already listening socket, overriding `host` and `port`.
+    """
+    self._finished = asyncio.Event()
+    if not self._pending:
+      self._finished.set()
+
+    if sock is None:
+      server = await asyncio.start_server(self._handle_worker, host, port)
+    else:
+      server = await asyncio.start_server(self._handle_worker, sock=sock)
+    if on_listening:
+      on_listening(server.sockets[0].getsockname()[1])
+
+    async with server:
+      await self._finished.wait()
+      server.close()
+      for worker in list(self._workers.values()):
+        worker.writer.write(encode_frame(SHUTDOWN))
+        await worker.writer.drain()
+
+      # Workers hang up on shutdown; wait for their handlers to wind down.
+      if self._handlers:
+        _, stragglers = await asyncio.wait(
+            self._handlers, timeout=SHUTDOWN_TIMEOUT)
+        for handler in stragglers:
+          handler.cancel()
+
+  async def _handle_worker(self, reader, writer):
+    """Serves one worker connection."""
+    self._handlers.add(asyncio.current_task())
+    worker = None
+
+    try:
+      frame_type, payload = await _read_frame(reader)
+      if frame_type != HELLO:
+        return
+
+      worker = _WorkerState(json.loads(payload)["name"], writer)
+      self._workers[id(worker)] = worker
+      writer.write(encode_frame(WELCOME, json.dumps(self._config).encode()))
+
+      while True:
+        frame_type, payload = await _read_frame(reader)
+        await self._handle_frame(worker, frame_type, payload)
+    except (asyncio.IncompleteReadError, ConnectionError):
+      if worker is not None and worker.outstanding:
+        # Lost worker: rerun its outstanding specs elsewhere, from the start.
+        self._workers.pop(id(worker), None)
+        for vehicle_id in worker.outstanding:
+          if vehicle_id in worker.started:
+            self._num_restarts += 1
+            if self._on_restart:
+              self._on_restart(vehicle_id)
+        self._pending.extend(worker.outstanding.values())
+        worker.outstanding.clear()
+        await self._serve_idle()
+    finally:
+      self._handlers.discard(asyncio.current_task())
+      if worker is not None:
+        self._workers.pop(id(worker), None)
+        if worker in self._idle:
+          self._idle.remove(worker)
+      writer.close()
+
+  async def _handle_frame(self, worker, frame_type, payload):
+    if frame_type == OUTPUT:
+      vehicle_id, num_rows = OUTPUT_HEADER.unpack_from(payload)
+      worker.started.add(vehicle_id)
+      if self._on_rows:
+        rows = np.frombuffer(
+            payload, dtype="<f8", offset=OUTPUT_HEADER.size).reshape(
+                num_rows, -1)
+        self._on_rows(vehicle_id, rows)
+    elif frame_type == DTC_EVENTS:
+      events = np.frombuffer(payload, dtype=trace_file.DTC_EVENT_DTYPE)
+      worker.started.update(events["vehicle_id"].tolist())
+      if self._on_dtc_events:
+        self._on_dtc_events(events)
+    elif frame_type == DONE:
+      (vehicle_id,) = VEHICLE_ID.unpack(payload)
+      worker.outstanding.pop(vehicle_id, None)
+      worker.started.discard(vehicle_id)
+      self._done_per_worker[worker.name] += 1
+      self._num_done += 1
+      if self._num_done == self._num_vehicles:
+        self._finished.set()
+    elif frame_type == REQUEST:
+      self._idle.append(worker)
+      await self._serve_idle()
+    elif frame_type == RETURN:
+      worker.stealing = False
+      returned = _decode_specs(payload)
+      for spec in returned:
+        worker.outstanding.pop(spec.vehicle_id, None)
+      self._pending.extend(returned)
+      await self._serve_idle()
+    else:
+      raise ClusterError(f"Unexpected frame type: {frame_type}.")
+
+  async def _serve_idle(self):
+    """Hands pending specs to idle workers, stealing work if there is none."""
+    while self._idle and self._pending:
+      worker = self._idle.popleft()
+      batch = [
+          self._pending.popleft()
+          for _ in range(min(self._batch_size, len(self._pending)))]
+      worker.outstanding.update((spec.vehicle_id, spec) for spec in batch)
+      worker.writer.write(encode_frame(SPECS, _encode_specs(batch)))
+      await worker.writer.drain()
+
+    if not self._idle:
+      return
+
+    # Steal the unstarted half of the largest backlog. The first outstanding
+    # spec of a worker may already be running, so it is never stolen.
+    victim = max(
+        (worker for worker in self._workers.values() if not worker.stealing),
+        key=lambda worker: len(worker.outstanding), default=None)
+    if victim is None or len(victim.outstanding) < 2:
+      return
+
+    victim.stealing = True
+    self._num_steals += 1
+    victim.writer.write(encode_frame(
+        STEAL, COUNT.pack(len(victim.outstanding) // 2)))
+    await victim.writer.drain()
+
+
+class _FrameRecorder:
+  """Recorder batching a vehicle's sim outputs and DTC edges into frames."""
+
+  def __init__(self, connection, vehicle_instance, rows_per_frame):
+    self._connection = connection
+    self._vehicle = vehicle_instance
+    self._vehicle_id = vehicle_instance.get_vehicle_id()
+    self._rows = np.empty((rows_per_frame, sim_output.NUM_SIGNALS), dtype="<f8")
+    self._num_rows = 0
+    self._active_dtcs = set()
+    self._dtc_events = []
+
+  def record(self, row):
+    self._rows[self._num_rows] = row
+    self._num_rows += 1
+
+    active_dtcs = {
+        (ecu, dtc) for ecu, dtcs in self._vehicle.get_active_dtcs().items()
+        for dtc in dtcs}
+    if active_dtcs != self._active_dtcs:
+      elapsed_time = row[sim_output.SIGNAL_INDEX["elapsed_time"]]
+      self._dtc_events.extend(
+          (elapsed_time, self._vehicle_id, ecu, dtc, True)
+          for ecu, dtc in active_dtcs - self._active_dtcs)
+      self._dtc_events.extend(
+          (elapsed_time, self._vehicle_id, ecu, dtc, False)
+          for ecu, dtc in self._active_dtcs - active_dtcs)
+      self._active_dtcs = active_dtcs
+
+    if self._num_rows == len(self._rows):
+      self.flush()
+
+  def flush(self):
+    """Sends buffered sim output rows and DTC events."""
+    if self._num_rows:
+      self._connection.send(
+          OUTPUT, OUTPUT_HEADER.pack(self._vehicle_id, self._num_rows) +
+          self._rows[:self._num_rows].tobytes())
+      self._num_rows = 0
+
+    if self._dtc_events:
+      self._connection.send(DTC_EVENTS, np.array(
+          self._dtc_events, dtype=trace_file.DTC_EVENT_DTYPE).tobytes())
+      self._dtc_events = []
+
+
+class _WorkerConnection:
+  """Worker side of a coordinator connection.
+
+  A receiver thread queues incoming specs and answers steal requests from the
+  unstarted end of the queue, while the main thread runs vehicles.
+  """
+
+  def __init__(self, host, port, name):
+    self._sock = socket.create_connection((host, port))
+    self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    self._send_lock = threading.Lock()
+    self._queue_changed = threading.Condition()
+    self._specs = collections.deque()
+    self._requested = False
+    self._shutdown = False
+
+    self.send(HELLO, json.dumps({"name": name}).encode())
+    frame_type, payload = recv_frame(self._sock)
+    if frame_type != WELCOME:
+      raise ClusterError(f"Expected a welcome frame, got: {frame_type}.")
+    self.config = json.loads(payload)
+
+    self._receiver = threading.Thread(target=self._receive, daemon=True)
+    self._receiver.start()
+
+  def send(self, frame_type, payload=b""):
+    with self._send_lock:
+      self._sock.sendall(encode_frame(frame_type, payload))
+
+  def _receive(self):
+    try:
+      while True:
+        frame_type, payload = recv_frame(self._sock)
+        with self._queue_changed:
+          if frame_type == SPECS:
+            self._specs.extend(_decode_specs(payload))
+            self._requested = False
+          elif frame_type == STEAL:
+            (count,) = COUNT.unpack(payload)
+            count = min(count, len(self._specs))
+            stolen = [self._specs.pop() for _ in range(count)]
+            self.send(RETURN, _encode_specs(stolen))
+          elif frame_type == SHUTDOWN:
+            self._shutdown = True
+          self._queue_changed.notify_all()
+    except (ClusterError, OSError):
+      with self._queue_changed:
+        self._shutdown = True
+        self._queue_changed.notify_all()
+
+  def next_spec(self):
+    """Returns the next spec to run, or `None` once shut down."""
+    with self._queue_changed:
+      while not self._specs and not self._shutdown:
+        if not self._requested:
+          self._requested = True
+          self.send(REQUEST)
+        self._queue_changed.wait()
+
+      return self._specs.popleft() if self._specs else None
+
+  def close(self):
+    self._sock.close()
+
+
+def run_worker(host, port, name=None):
+  """Runs vehicles for a coordinator until it shuts down.
+
+  Args:
+    host: string representing the coordinator host.
+    port: int representing the coordinator port.
+    name: optional string identifying the worker.
+  Returns:
+    num_vehicles: int representing the number of vehicles run.
+  """
+  name = name or f"{socket.gethostname()}:{os.getpid()}"
+  connection = _WorkerConnection(host, port, name)
+  sim_run_time = connection.config["sim_run_time"]
+  rows_per_frame = connection.config["rows_per_frame"]
+  num_vehicles = 0
+
+  try:
+    while (spec := connection.next_spec()) is not None:
+      vehicle_instance = dojo.build_vehicle(spec)
+      recorder = _FrameRecorder(connection, vehicle_instance, rows_per_frame)
+      vehicle_instance.attach_recorder(recorder)
+      vehicle_instance.run_for(sim_run_time)
+      recorder.flush()
+      event_log.flush_default_log()  # Workers exit without `atexit` handlers.
+      connection.send(DONE, VEHICLE_ID.pack(spec.vehicle_id))
+      num_vehicles += 1
+  except (ClusterError, OSError):
+    pass  # Coordinator went away.
+  finally:
+    connection.close()
+
+  return num_vehicles
+
+
+def run_local(specs, num_workers, **coordinator_kwargs):
+  """Runs a coordinator with local worker processes standing in for nodes.
+
+  Returns:
+    The coordinator, for its stats.
+  """
+  coordinator = Coordinator(specs, **coordinator_kwargs)
+
+  # Listen, and fork the workers, before the event loop starts any threads.
+  sock = socket.create_server(("127.0.0.1", 0))
+  port = sock.getsockname()[1]
+  workers = [
+      Process(target=run_worker, args=("127.0.0.1", port, f"local-{index}"))
+      for index in range(num_workers)]
+  for worker in workers:
+    worker.start()
+
+  asyncio.run(coordinator.serve(sock=sock))
+  for worker in workers:
+    worker.join()
+
+  return coordinator
+
+
+if __name__ == "__main__":
+  # Parse user input arguments.
+  parser = argparse.ArgumentParser()
+
+  parser.add_argument(
+      "--mode", choices=("coordinator", "worker"), default="coordinator",
+      help="Run the coordinator, or a worker connecting to one.")
+  parser.add_argument(
+      "--host", type=str, default="127.0.0.1",
+      help="Coordinator host, or interface to listen on.")
+  parser.add_argument(
+      "--port", type=int, default=DEFAULT_PORT, help="Coordinator port.")
+  parser.add_argument(
+      "--num_vehicles", type=int, default=10,
+      help="Number of vehicle instances to run across the workers.")
+  parser.add_argument(
+      "--sim_run_time", type=float, default=dojo.RUN_TIME,
+      help="Number of seconds to run each vehicle simulation.")
+  parser.add_argument(
+      "--seed", type=int, default=None,
+      help="Seed for reproducible runs. Unseeded runs use fresh entropy.")
+  parser.add_argument(
+      "--fault_injection_mode", action=argparse.BooleanOptionalAction,
+      default=True, help="Random fault injection in the ECUs.")
+  parser.add_argument(
+      "--batch_size", type=int, default=BATCH_SIZE,
+      help="Vehicle specs handed out per worker request.")
+  parser.add_argument(
+      "--local_workers", type=int, default=0,
+      help="Number of local worker processes to start with the coordinator.")
+  parser.add_argument(
+      "--dtc_stdout", action="store_true",
+      help="Print DTC events and fault tree inference results to stdout.")
+
+  args = parser.parse_args()
+  event_log.set_default_stdout(args.dtc_stdout)
+
+  if args.mode == "worker":
+    num_run = run_worker(args.host, args.port)
+    print(f"Worker ran {num_run} vehicles.")
+  else:
+    num_rows = collections.Counter()
+    num_dtc_events = collections.Counter()
+
+    def count_rows(vehicle_id, rows):
+      num_rows[vehicle_id] += len(rows)
+
+    def count_dtc_events(events):
+      num_dtc_events.update(events["vehicle_id"].tolist())
+
+    def discard_counts(vehicle_id):
+      num_rows.pop(vehicle_id, None)
+      num_dtc_events.pop(vehicle_id, None)
+
+    vehicle_specs = dojo.make_vehicle_specs(
+        args.num_vehicles, seed=args.seed,
+        fault_injection_mode=args.fault_injection_mode)
+    coordinator_kwargs = {
+        "sim_run_time": args.sim_run_time, "batch_size": args.batch_size,
+        "on_rows": count_rows, "on_dtc_events": count_dtc_events,
+        "on_restart": discard_counts}
+
+    if args.local_workers:
+      coordinator = run_local(
+          vehicle_specs, args.local_workers, **coordinator_kwargs)
+    else:
+      coordinator = Coordinator(vehicle_specs, **coordinator_kwargs)
+      asyncio.run(coordinator.serve(
+          args.host, args.port,
+          on_listening=lambda port: print(f"Listening on port {port}.")))
+
+    print(coordinator.get_stats())
+    print(f"Rows received: {sum(num_rows.values())}, "
+          f"DTC events: {sum(num_dtc_events.values())}.")
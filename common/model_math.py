@@ -1,7 +1,81 @@
-"""Math utilities for modeling."""
+"""Math utilities for modeling.
+
+The kernels below accept floats or NumPy arrays interchangeably, broadcasting
+over any leading axes (e.g. phases x vehicles x time) of their arguments.
+"""
 
 import math
-import random
+
+import numpy as np
+
+
+# Constants.
+NOISE_BLOCK_SIZE = 4096  # [], number of noise samples generated per block.
+# SplitMix64 increment and finalizer multipliers, for `KeyedWhiteNoise`.
+_SPLITMIX_GAMMA = np.uint64(0x9E3779B97F4A7C15)
+_SPLITMIX_MUL_1 = np.uint64(0xBF58476D1CE4E5B9)
+_SPLITMIX_MUL_2 = np.uint64(0x94D049BB133111EB)
+_SIN_120 = math.sqrt(3) / 2  # sin(2*pi/3).
+
+
+def phase_basis(theta):
+  """Computes the sines and cosines of the 3 phase angles of `theta`.
+
+  Only sin(theta) and cos(theta) are evaluated; the terms at theta -/+ 2*pi/3
+  follow from the angle sum identities, so one basis can be shared by the
+  phase waveforms and every park transform at the same angle.
+  Args:
+    theta: float or array representing electrical angle [rad].
+  Returns:
+    sines: tuple of sin(theta), sin(theta - 2*pi/3), sin(theta + 2*pi/3).
+    cosines: tuple of cos(theta), cos(theta - 2*pi/3), cos(theta + 2*pi/3).
+  """
+  if isinstance(theta, np.ndarray):
+    sin_a, cos_a = np.sin(theta), np.cos(theta)
+  else:
+    sin_a, cos_a = math.sin(theta), math.cos(theta)
+
+  half_sin, half_cos = 0.5 * sin_a, 0.5 * cos_a
+  root3_sin, root3_cos = _SIN_120 * sin_a, _SIN_120 * cos_a
+
+  sines = (sin_a, -half_sin - root3_cos, -half_sin + root3_cos)
+  cosines = (cos_a, -half_cos + root3_sin, -half_cos - root3_sin)
+
+  return sines, cosines
+
+
+def three_phase(amplitude, basis):
+  """Computes balanced 3-phase sinusoids of a given amplitude.
+  Args:
+    amplitude: float or array representing peak amplitude of each phase.
+    basis: tuple of (sines, cosines) as returned by `phase_basis`.
+  Returns:
+    phase_a, phase_b, phase_c: 3 phases of the quantity.
+  """
+  sines, _ = basis
+  return amplitude * sines[0], amplitude * sines[1], amplitude * sines[2]
+
+
+def park_transform_basis(phase_a, phase_b, phase_c, basis):
+  """Computes the d-q space equivalent of a 3-phase quantity.
+  Args:
+    phase_a: float or array representing 'A phase' of a 3-phase quantity.
+    phase_b: float or array representing 'B phase' of a 3-phase quantity.
+    phase_c: float or array representing 'C phase' of a 3-phase quantity.
+    basis: tuple of (sines, cosines) as returned by `phase_basis`.
+  Returns:
+    d_component: 'direct' component of 3-phase quantity.
+    q_component: 'quadrature' component of 3-phase quantity.
+  """
+  sines, cosines = basis
+
+  d_component = (2 / 3) * (
+      phase_a * cosines[0] + phase_b * cosines[1] + phase_c * cosines[2])
+
+  q_component = (-2 / 3) * (
+      phase_a * sines[0] + phase_b * sines[1] + phase_c * sines[2])
+
+  return d_component, q_component
 
 
 def park_transform(phase_a, phase_b, phase_c, theta):
@@ -10,30 +84,237 @@ def park_transform(phase_a, phase_b, phase_c, theta):
     phase_a: float representing 'A phase' of a 3-phase quantity.
     phase_b: float representing 'B phase' of a 3-phase quantity.
     phase_c: float representing 'C phase' of a 3-phase quantity.
+    theta: float representing electrical angle [rad].
   Returns:
     d_component: float representing 'direct' component of 3-phase quantity.
     q_component: float representing 'quadrature' component of 3-phase quantity.
   """
-  d_component = (2 / 3) * (
-      phase_a * math.cos(theta) +
-      phase_b * math.cos(theta - (2 * math.pi / 3)) +
-      phase_c * math.cos(theta + (2 * math.pi / 3))
-  )
+  return park_transform_basis(
+      phase_a, phase_b, phase_c, phase_basis(theta))
 
-  q_component = (2 / 3) * (
-      - phase_a * math.sin(theta)
-      - phase_b * math.sin(theta - (2 * math.pi / 3))
-      - phase_c * math.sin(theta + (2 * math.pi / 3))
-  )
 
-  return d_component, q_component
+def park_transform_array(phases, theta=None, basis=None):
+  """Computes the d-q space equivalent of stacked 3-phase quantities.
+  Args:
+    phases: array whose leading axis of size 3 holds the A, B and C phases,
+      e.g. shaped (3, num_vehicles, num_samples).
+    theta: array representing electrical angle [rad], broadcastable against
+      `phases[0]`. Ignored if `basis` is given.
+    basis: optional tuple of (sines, cosines) as returned by `phase_basis`.
+  Returns:
+    dq: array shaped (2, ...) holding the 'direct' and 'quadrature' components.
+  """
+  if basis is None:
+    basis = phase_basis(np.asarray(theta, dtype=float))
+
+  return np.stack(
+      park_transform_basis(phases[0], phases[1], phases[2], basis))
+
+
+def make_rngs(vehicle_id, run_seed=None, num_streams=1):
+  """Creates independent random number generator streams for a vehicle.
+
+  Streams are derived from the run seed and the vehicle ID alone, so they are
+  reproducible, and independent of each other, whichever process creates them.
+  Args:
+    vehicle_id: non-negative int representing the vehicle ID.
+    run_seed: optional int seeding the whole run; fresh OS entropy if `None`.
+    num_streams: int representing the number of streams to create.
+  Returns:
+    List of `num_streams` instances of `numpy.random.Generator`.
+  """
+  seed_sequence = np.random.SeedSequence(run_seed, spawn_key=(vehicle_id,))
+  return [
+      np.random.Generator(np.random.PCG64(child))
+      for child in seed_sequence.spawn(num_streams)
+  ]
+
+
+def make_stream_keys(vehicle_ids, run_seed=None, stream=0):
+  """Derives a 64-bit key per vehicle for one of its random streams.
+
+  As in `make_rngs`, each key is derived from the run seed and the vehicle ID
+  alone, so a vehicle's stream is the same whichever batch, e.g. a chunk of a
+  fleet, or process simulates it.
+  Args:
+    vehicle_ids: iterable of non-negative ints representing the vehicle IDs.
+    run_seed: optional int seeding the whole run; fresh OS entropy if `None`.
+    stream: int representing the stream index. Each key is derived from the
+      same (run seed, vehicle ID, stream) `SeedSequence` as the `make_rngs`
+      stream of that index would be.
+  Returns:
+    uint64 array of one key per vehicle.
+  """
+  if run_seed is None:
+    run_seed = np.random.SeedSequence().entropy
+
+  return np.array([
+      np.random.SeedSequence(
+          run_seed, spawn_key=(int(vehicle_id), stream)).generate_state(
+              1, np.uint64)[0]
+      for vehicle_id in vehicle_ids
+  ], dtype=np.uint64)
+
+
+class UniformBlock:
+  """Source of uniform samples in [low, high), generated in blocks.
+
+  Drawing a block of samples at a time amortizes the random number generator
+  call overhead over many signals and time steps.
+  """
+
+  def __init__(self, low=0.0, high=1.0, rng=None, block_size=NOISE_BLOCK_SIZE):
+    self._low = low
+    self._high = high
+    self._rng = rng if rng is not None else np.random.default_rng()
+    self._block_size = block_size
+    self._block = []
+    self._block_rng_state = None  # Generator state the block was drawn from.
+    self._index = 0
+
+  def next(self):
+    """Returns the next sample, refilling the block if needed."""
+    if self._index >= len(self._block):
+      self._block_rng_state = self._rng.bit_generator.state
+      self._block = self._rng.uniform(
+          self._low, self._high, self._block_size).tolist()
+      self._index = 0
+
+    sample = self._block[self._index]
+    self._index += 1
+    return sample
+
+  def get_state(self):
+    """Returns the state of the source, as a dict of plain values.
+
+    The current block is not stored, only the generator state it was drawn
+    from, and is re-drawn on `set_state`.
+    """
+    return {
+        "rng": self._rng.bit_generator.state,
+        "block_rng": self._block_rng_state,
+        "index": self._index,
+    }
+
+  def set_state(self, state):
+    """Restores a state returned by `get_state`."""
+    self._block_rng_state = state["block_rng"]
+    self._block = []
+    if self._block_rng_state is not None:
+      self._rng.bit_generator.state = self._block_rng_state
+      self._block = self._rng.uniform(
+          self._low, self._high, self._block_size).tolist()
+    self._rng.bit_generator.state = state["rng"]
+    self._index = state["index"]
+
+
+class WhiteNoise(UniformBlock):
+  """Source of uniform white noise, generated in blocks."""
+
+  def __init__(self, rng=None, block_size=NOISE_BLOCK_SIZE):
+    super().__init__(-1.0, 1.0, rng, block_size)
+
+  def add(self, signal, percent_amplitude):
+    """Adds white noise to a scalar signal.
+    Args:
+      signal: float representing signal to be modified.
+      percent_amplitude: float representing % of signal amplitude to add as
+        noise.
+    """
+    return signal + percent_amplitude * signal * self.next()
+
+  def add_array(self, signals, percent_amplitudes, out=None):
+    """Adds white noise to an array of signals.
+    Args:
+      signals: array representing signals to be modified.
+      percent_amplitudes: float or array, broadcastable against `signals`,
+        representing % of signal amplitude to add as noise.
+      out: optional array to write the result to e.g. `signals` itself.
+    """
+    gain = self._rng.uniform(-1.0, 1.0, np.shape(signals))
+    gain *= percent_amplitudes
+    gain += 1.0
+    return np.multiply(signals, gain, out=out)
+
+
+class KeyedWhiteNoise:
+  """Source of uniform white noise for a batch of vehicles, one stream each.
+
+  Samples are a SplitMix64 hash of each vehicle's key, see `make_stream_keys`,
+  and of its sample count. The noise of a vehicle therefore does not depend on
+  which other vehicles share the batch, while the whole batch is still drawn
+  with a few array operations.
+  """
+
+  def __init__(self, keys):
+    self._keys = np.asarray(keys, dtype=np.uint64)
+    self._count = 0  # Samples drawn per vehicle.
+    # Hashing buffers, reused while draws keep the same shape.
+    self._hashes = None
+    self._shifted = None
+
+  def uniform(self, num_samples, columns=None):
+    """Draws the next `num_samples` samples in [-1, 1) of every vehicle.
+
+    Args:
+      num_samples: int representing the samples drawn per vehicle.
+      columns: optional array of the indices, within the `num_samples`, of the
+        samples to return. The others are skipped rather than computed.
+    Returns:
+      (num_vehicles, num_samples) array of samples, or (num_vehicles,
+      len(columns)) if `columns` is given. It is the transpose of a C-ordered
+      array, so that each sample column is contiguous.
+    """
+    if columns is None:
+      counters = np.arange(num_samples, dtype=np.uint64)
+    else:
+      counters = np.array(columns, dtype=np.uint64)
+    counters += np.uint64(self._count)
+    counters *= _SPLITMIX_GAMMA
+    self._count += num_samples
+
+    shape = (len(counters), len(self._keys))
+    if self._hashes is None or self._hashes.shape != shape:
+      self._hashes = np.empty(shape, dtype=np.uint64)
+      self._shifted = np.empty(shape, dtype=np.uint64)
+    z, shifted = self._hashes, self._shifted
+
+    np.add(counters[:, np.newaxis], self._keys, out=z)
+    z ^= np.right_shift(z, np.uint64(30), out=shifted)
+    z *= _SPLITMIX_MUL_1
+    z ^= np.right_shift(z, np.uint64(27), out=shifted)
+    z *= _SPLITMIX_MUL_2
+    z ^= np.right_shift(z, np.uint64(31), out=shifted)
+    z >>= np.uint64(11)
+    samples = np.multiply(z, 2.0**-52)
+    samples -= 1.0
+    return samples.T
+
+  def add_array(self, signals, percent_amplitudes, out=None):
+    """Adds white noise to the signals of every vehicle.
+    Args:
+      signals: (num_vehicles, num_signals) array representing signals to be
+        modified.
+      percent_amplitudes: float or array, broadcastable against `signals`,
+        representing % of signal amplitude to add as noise.
+      out: optional array to write the result to e.g. `signals` itself.
+    """
+    gain = self.uniform(np.shape(signals)[-1])
+    gain *= percent_amplitudes
+    gain += 1.0
+    return np.multiply(signals, gain, out=out)
+
+
+_DEFAULT_NOISE = WhiteNoise()
+
 
 def add_white_noise(signal, percent_amplitude):
   """Adds white noise to an input signal.
   Args:
-    signal: float representing signal to be modified.
+    signal: float or array representing signal to be modified.
     percent_amplitude: float representing % of signal amplitude to add as noise.
   """
-  return (
-      signal + random.uniform(
-         -percent_amplitude * signal, percent_amplitude * signal))
+  if isinstance(signal, np.ndarray):
+    return _DEFAULT_NOISE.add_array(signal, percent_amplitude)
+
+  return _DEFAULT_NOISE.add(signal, percent_amplitude)
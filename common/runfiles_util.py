@@ -0,0 +1,42 @@
+"""Deferred resolution of Bazel runfiles paths.
+
+Creating the runfiles object reads the runfiles manifest or directory, so it is
+done once per process, when the first data file path is actually needed, rather
+than when every module defining one is imported.
+"""
+
+import functools
+
+
+@functools.lru_cache(maxsize=None)
+def _get_runfiles():
+  from rules_python.python.runfiles import runfiles
+  return runfiles.Create()
+
+
+@functools.lru_cache(maxsize=None)
+def rlocation(path):
+  """Returns the absolute path of a runfile e.g. a YAML data file.
+
+  Args:
+    path: string representing the runfile path, prefixed by the workspace name.
+  """
+  return _get_runfiles().Rlocation(path)
+
+
+def lazy_runfile(name, runfile):
+  """Returns a module `__getattr__` resolving a runfile path on first access.
+
+  Assigned to a module's `__getattr__`, it makes `name` a module attribute
+  holding the absolute path of `runfile`, without resolving it at import.
+
+  Args:
+    name: string representing the module attribute e.g. `DTCS_YAML_PATH`.
+    runfile: string representing the runfile path, as for `rlocation`.
+  """
+  def __getattr__(attribute):
+    if attribute == name:
+      return rlocation(runfile)
+    raise AttributeError(f"module has no attribute {attribute!r}")
+
+  return __getattr__
@@ -0,0 +1,111 @@
+"""Tool for measuring the cold import time of the repo's entry points.
+
+Every measurement imports a module in a fresh interpreter, so nothing is cached
+in `sys.modules`, and reports the median over several runs. With `--check`, the
+tool exits with an error if any entry point exceeds its `IMPORT_BUDGETS` entry,
+so import time regressions (e.g. a heavy dependency imported at module level)
+are caught before they slow down every worker process and CLI invocation.
+"""
+
+import argparse
+import importlib.util
+import statistics
+import subprocess
+import sys
+
+
+# Constants.
+NUM_RUNS = 5  # [], fresh interpreters per entry point.
+# Entry points and their import time budgets [ms], excluding interpreter start.
+IMPORT_BUDGETS = {
+    "vehicle_model.diagnostics.dtc_util": 30.0,
+    "digital_twin_model.fault_tree_util": 30.0,
+    "vehicle_model.diagnostics.catalog": 40.0,
+    "vehicle_model.vehicle": 250.0,
+    "vehicle_model.fleet": 250.0,
+    "common.dojo": 300.0,
+    "common.async_dojo": 300.0,
+    "common.dojo_cluster": 300.0,
+    "digital_twin_model.replay": 300.0,
+    "common.vehicle_plotter": 1000.0,
+}
+# Modules whose entry points are skipped if not installed.
+OPTIONAL_REQUIREMENTS = {"common.vehicle_plotter": "PySide6"}
+_TIMER_SCRIPT = (
+    "import time; start_time = time.perf_counter(); import {module}; "
+    "print(time.perf_counter() - start_time)")
+
+
+class StartupBenchmarkError(Exception):
+  pass
+
+
+def time_import(module, num_runs=NUM_RUNS):
+  """Returns the median cold import time [ms] of a module.
+
+  Args:
+    module: string representing the dotted module name.
+    num_runs: int representing the number of fresh interpreters to time.
+  """
+  import_times = []
+  for _ in range(num_runs):
+    result = subprocess.run(
+        [sys.executable, "-c", _TIMER_SCRIPT.format(module=module)],
+        capture_output=True, text=True)
+    if result.returncode:
+      raise StartupBenchmarkError(
+          f"Importing {module} failed:\n{result.stderr}")
+    import_times.append(float(result.stdout.split()[-1]) * 1e3)
+
+  return statistics.median(import_times)
+
+
+def run_benchmark(modules=None, num_runs=NUM_RUNS):
+  """Returns the median cold import time [ms] of each entry point.
+
+  Args:
+    modules: optional iterable of dotted module names. Defaults to the entry
+      points of `IMPORT_BUDGETS`.
+    num_runs: int representing the number of fresh interpreters per module.
+  """
+  import_times = {}
+  for module in modules or IMPORT_BUDGETS:
+    requirement = OPTIONAL_REQUIREMENTS.get(module)
+    if requirement and not importlib.util.find_spec(requirement):
+      print(f"{module}: skipped, {requirement} is not installed.")
+      continue
+
+    import_times[module] = time_import(module, num_runs)
+
+  return import_times
+
+
+if __name__ == "__main__":
+  # Parse user input arguments.
+  parser = argparse.ArgumentParser()
+
+  parser.add_argument(
+      "--modules", nargs="+", default=None,
+      help="Modules to time. Defaults to every entry point.")
+  parser.add_argument(
+      "--num_runs", type=int, default=NUM_RUNS,
+      help="Number of fresh interpreters per module.")
+  parser.add_argument(
+      "--check", action="store_true",
+      help="Exit with an error if an entry point exceeds its budget.")
+
+  args = parser.parse_args()
+
+  over_budget = []
+  for module, import_time in run_benchmark(args.modules, args.num_runs).items():
+    budget = IMPORT_BUDGETS.get(module)
+    status = ""
+    if budget is not None:
+      status = f" (budget: {budget:.0f} ms)"
+      if import_time > budget:
+        over_budget.append(module)
+        status += " OVER BUDGET"
+    print(f"{module}: {import_time:.1f} ms{status}")
+
+  if args.check and over_budget:
+    sys.exit(f"Over import time budget: {', '.join(over_budget)}.")
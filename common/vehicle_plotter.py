@@ -10,7 +10,6 @@ import math
 import numpy
 import queue
 import sys
-import time
 
 from PySide6 import QtCore
 from PySide6 import QtGui
@@ -385,7 +384,8 @@ class VehicleListener(QtCore.QThread):
           downsample_counter += 1
         else:
           downsample_counter = 0
-          msg = self._vehicle_sim.get_sim_outputs()
+          # Snapshot the sim outputs, which are updated in place every step.
+          msg = self._vehicle_sim.get_sim_outputs().copy()
           # Print sim outputs to console.
           # print(msg)
           self._data_queue.put(msg)
@@ -422,14 +422,14 @@ class VehicleRunner(QtCore.QThread):
     QtCore.QThread.__init__(self, parent)
 
     self.should_exit = False
-    self._vehicle_sim = vehicle.Vehicle(
-        vehicle_id=1, fault_injection_mode=fault_injection_mode)
+    # Pace the simulated clock against the wall clock for realtime plotting.
+    self._vehicle_sim = vehicle.RealTimePacer(vehicle.Vehicle(
+        vehicle_id=1, fault_injection_mode=fault_injection_mode))
     self._buffer_size = buffer_size
     self._data_queue = data_queue
-    self._start_time = time.time()
 
   def get_vehicle_sim(self):
-    """Gets the current vehicle_sim instance."""
+    """Gets the current (realtime paced) vehicle_sim instance."""
     return self._vehicle_sim
 
   def run(self):
@@ -438,8 +438,8 @@ class VehicleRunner(QtCore.QThread):
 
     while not self.should_exit:
       try:
-        self._vehicle_sim.run_time_step(self._start_time)
-        msg = self._vehicle_sim.get_sim_outputs()
+        self._vehicle_sim.step()
+        msg = self._vehicle_sim.get_vehicle().get_sim_outputs().copy()
         self._data_queue.put(msg)
 
         if buffer_counter < self._buffer_size - 1:
@@ -447,8 +447,6 @@ class VehicleRunner(QtCore.QThread):
         else:
           buffer_counter = 0
           self.has_data.emit()
-
-        time.sleep(0.01)
       except Exception as e:
         print(e)
         pass
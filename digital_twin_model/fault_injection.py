@@ -1,9 +1,6 @@
 """Module for injecting faults in ECUs."""
 
-import random
-
-from digital_twin_model import fault_tree_util
-from vehicle_model.diagnostics import dtc_util
+from vehicle_model.diagnostics import catalog as diagnostics_catalog
 
 
 FAULT_TYPES = ["short", "open", "comms_missing"]
@@ -16,8 +13,10 @@ class FaultInjectionError(Exception):
 class FaultInjector:
 
   def __init__(self, vehicle_id=None):
-    self.dtcs_dict = dtc_util.load_yaml()
-    self.fault_tree_dict = fault_tree_util.load_yaml()
+    # Shared, read-only definitions, parsed once per process.
+    catalog = diagnostics_catalog.get_catalog()
+    self.dtcs_dict = catalog.dtcs_dict
+    self.fault_tree_dict = catalog.fault_tree_dict
     self.active_dtcs = []
     self.vehicle_id = vehicle_id
 
@@ -79,11 +78,10 @@ class FaultInjector:
       self.vehicle_output["i_d"] = float("inf")
       self.vehicle_output["iq_cmd"] = float("inf")
 
-    # CASE 3: Sets comms missing on BMM, PMM and TMM.
+    # CASE 3: Sets comms missing on BMM, PMM and TMM. Its DTCs are raised by
+    # the `watchdog.CommsWatchdog` of the vehicle, as the signals go missing.
     if fault_type == "comms_missing":
-      self.active_dtcs = [
-        "B001", "B002", "B004", "B005", "B006", "B007", "B011", "B013"
-      ]
+      self.active_dtcs = []
 
       self.vehicle_output["v_bus"] = float("Nan")
       self.vehicle_output["i_bus"] = float("Nan")
@@ -145,3 +143,17 @@ class FaultInjector:
     """Retrieves vehicle output signals."""
     return self.vehicle_output
 
+  def get_state(self):
+    """Retrieves the injected faults, as a dict of plain values."""
+    return {
+      "active_dtcs": list(self.active_dtcs),
+      "vehicle_output": {
+          signal: value for signal, value in self.vehicle_output.items()
+          if signal != "vehicle_id"},
+    }
+
+  def set_state(self, state):
+    """Restores injected faults retrieved with `get_state`."""
+    self.active_dtcs = list(state["active_dtcs"])
+    self.vehicle_output.update(state["vehicle_output"])
+
@@ -1,15 +1,10 @@
 """Utility for reading DTC information from YAML file definitions."""
 
-import yaml
-
-from rules_python.python.runfiles import runfiles
-
+from common import runfiles_util
 from vehicle_model.diagnostics import dtc_util
 
 # Constants.
-r = runfiles.Create()
-
-FAULT_TREE_YAML_PATH = r.Rlocation(
+FAULT_TREE_YAML_RUNFILE = (
     "automotive-diagnostics/digital_twin_model/fault_tree.yaml")
 _DTC_TYPES = ["comms_missing", "rationality", "open_circuit", "short_circuit"]
 _ECUS = ["bmm", "pmm", "tmm"]
@@ -19,13 +14,30 @@ class DTCReaderError(Exception):
   pass
 
 
-def load_yaml():
-  """Loads a yaml file into a dictionary."""
+def get_fault_tree_yaml_path():
+  """Returns the path of the fault tree YAML file."""
+  return runfiles_util.rlocation(FAULT_TREE_YAML_RUNFILE)
+
+
+# `FAULT_TREE_YAML_PATH` is resolved lazily, on first access.
+__getattr__ = runfiles_util.lazy_runfile(
+    "FAULT_TREE_YAML_PATH", FAULT_TREE_YAML_RUNFILE)
+
+
+def load_yaml(yaml_path=None):
+  """Loads a yaml file into a dictionary, the fault tree by default.
+
+  Raises:
+    dtc_util.DTCReaderError: if a mapping has duplicate keys.
+  """
+  import yaml
+
+  yaml_path = yaml_path or get_fault_tree_yaml_path()
   yaml_dict = {}
 
-  with open(FAULT_TREE_YAML_PATH, "r") as f:  
+  with open(yaml_path, "r") as f:  
     try:
-      yaml_dict = yaml.safe_load(f)
+      yaml_dict = yaml.load(f, Loader=dtc_util.get_unique_key_loader())
     except yaml.YAMLError as e:
       print(e)
 
@@ -42,7 +54,8 @@ def parse_fault_tree_dict(fault_tree_dict, dtcs_vector):
 
   for symptom, metadata in fault_tree_dict["symptoms"].items():
     if all(item in dtcs_vector for item in metadata["conditions"]):
-      symptoms_map[symptom] = metadata["probable_cause_weights"]
+      # A plain copy, the shared catalog's fault tree is read-only.
+      symptoms_map[symptom] = dict(metadata["probable_cause_weights"])
 
   return symptoms_map
 
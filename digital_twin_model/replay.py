@@ -0,0 +1,225 @@
+"""Replays recorded traces through ECU diagnostics and fault tree inference.
+
+No plant models are run: the rationality DTCs of `dtcs.yaml` are evaluated by
+the same `monitor.RationalityMonitor` as live vehicles, on the recorded signal
+columns in vectorized chunks, and debounced by a `debounce.DTCDebouncer`, one
+evaluation per recorded sample. Replayed DTC events thus honour the maturation
+and dematuration of each DTC, as live ones do for traces recorded at the rate
+of the live checks. Fault tree inference runs once per distinct set of
+debounced DTCs rather than once per sample. This makes it cheap to re-score
+archived runs against new DTC limits or fault tree weights.
+"""
+
+import argparse
+import functools
+
+from multiprocessing.pool import Pool
+
+import numpy as np
+
+from digital_twin_model import fault_tree_util
+from telemetry import trace_file
+from vehicle_model import sim_output
+from vehicle_model.diagnostics import catalog as diagnostics_catalog
+from vehicle_model.diagnostics import debounce
+from vehicle_model.diagnostics import dtc_util
+from vehicle_model.diagnostics import monitor as rationality_monitor
+
+
+# Constants.
+CHUNK_SIZE = 65536  # [], sim output records evaluated per vectorized chunk.
+
+
+class ReplayResult:
+  """Diagnostics of one replayed trace.
+
+  Attributes:
+    trace_path: string representing path of the replayed trace.
+    vehicle_ids: array of the vehicle IDs in the trace.
+    dtcs: tuple of the rationality `catalog.DTCEntry`s evaluated, in the
+      monitor's bit order.
+    skipped_dtcs: tuple of the DTCs monitoring a signal that is not in the
+      trace. Checks of missing signals pass.
+    dtc_counts: (num_vehicles, len(dtcs)) array counting the samples during
+      which each DTC was failing, before debouncing.
+    dtc_events: `trace_file.DTC_EVENT_DTYPE` array of the debounced DTC
+      set/clear transitions.
+    diagnoses: dict mapping each distinct tuple of debounced active DTCs to a
+      dict of its sample count, matching symptoms and cause probabilities.
+  """
+
+  def __init__(self, trace_path, vehicle_ids, dtcs, skipped_dtcs):
+    self.trace_path = trace_path
+    self.vehicle_ids = np.asarray(vehicle_ids)
+    self.dtcs = dtcs
+    self.skipped_dtcs = skipped_dtcs
+    self.dtc_counts = np.zeros((len(vehicle_ids), len(dtcs)), dtype=np.int64)
+    self.dtc_events = np.zeros(0, dtype=trace_file.DTC_EVENT_DTYPE)
+    self.diagnoses = {}
+
+
+def _active_dtcs(mask, monitor):
+  """Returns the sorted, de-duplicated DTCs set in a bitmask."""
+  return tuple(sorted({entry.dtc for entry in monitor.get_dtcs(mask)}))
+
+
+def replay_trace(trace_path, catalog=None, chunk_size=CHUNK_SIZE):
+  """Replays a trace file through rationality checks and fault tree inference.
+
+  Args:
+    trace_path: string representing path of a trace file.
+    catalog: optional `catalog.DiagnosticsCatalog` to score the trace with.
+      Defaults to the shared one.
+    chunk_size: int representing sim output records, i.e. samples times
+      vehicles, evaluated per vectorized chunk.
+  Returns:
+    A `ReplayResult`.
+  """
+  catalog = catalog or diagnostics_catalog.get_catalog()
+  monitor = rationality_monitor.get_rationality_monitor(catalog)
+  reader = trace_file.TraceReader(trace_path)
+  num_vehicles = len(reader.vehicle_ids)
+
+  # The recorded columns of the monitored signals, by sim output column.
+  columns = {sim_output.SIGNAL_INDEX[signal] for signal in monitor.signals}
+  traces = {
+      column: reader.column(sim_output.SIGNALS[column]) for column in columns
+      if sim_output.SIGNALS[column] in reader.signals}
+  skipped_dtcs = tuple(
+      entry for entry in monitor.dtcs
+      if any(sim_output.SIGNAL_INDEX[signal] not in traces
+             for signal in entry.signals))
+  result = ReplayResult(
+      trace_path, reader.vehicle_ids, monitor.dtcs, skipped_dtcs)
+
+  # Debouncer rows are trace columns, mapped back to vehicle IDs in events.
+  debouncer = debounce.DTCDebouncer(range(num_vehicles), monitor.dtcs)
+  dtc_bits = np.array(
+      [1 << bit for bit in range(monitor.get_num_dtcs())], dtype=np.uint64)
+  event_bits = {
+      (entry.ecu.encode(), entry.dtc.encode()): bit
+      for entry, bit in zip(monitor.dtcs, dtc_bits)}
+  debounced_masks = np.zeros(num_vehicles, dtype=np.uint64)
+  # Whether the debounced DTCs matched the last evaluation, i.e. none is
+  # pending. Evaluations are only debounced when they differ, or until settled.
+  settled = True
+
+  times = reader.column("elapsed_time")
+  samples_per_chunk = max(1, chunk_size // max(1, num_vehicles))
+  # Missing signals are NaN, which never fails a rationality check.
+  records = np.full(
+      (samples_per_chunk, num_vehicles, sim_output.NUM_SIGNALS), np.nan)
+  mask_counts = {}
+  events = []
+
+  for start in range(0, reader.num_samples, samples_per_chunk):
+    stop = min(start + samples_per_chunk, reader.num_samples)
+    chunk = records[:stop - start]
+    for column, trace in traces.items():
+      chunk[..., column] = trace[start:stop]
+
+    masks = monitor.evaluate(chunk)
+    failing = (masks[..., np.newaxis] & dtc_bits) != 0
+    result.dtc_counts += failing.sum(axis=0)
+
+    chunk_times = times[start:stop]
+    chunk_debounced_masks = np.empty_like(masks)
+    for sample, sample_masks in enumerate(masks):
+      if not (settled and np.array_equal(sample_masks, debounced_masks)):
+        sample_events = debouncer.update(failing[sample])
+        if len(sample_events):
+          rows = sample_events["vehicle_id"]
+          np.bitwise_xor.at(debounced_masks, rows, [
+              event_bits[(event["ecu"], event["dtc"])]
+              for event in sample_events])
+          sample_events["elapsed_time"] = chunk_times[sample, rows]
+          sample_events["vehicle_id"] = reader.vehicle_ids[rows]
+          events.append(sample_events)
+        settled = np.array_equal(sample_masks, debounced_masks)
+      chunk_debounced_masks[sample] = debounced_masks
+
+    # Distinct DTC combinations, for inference once per combination.
+    unique_masks, counts = np.unique(chunk_debounced_masks, return_counts=True)
+    for mask, count in zip(unique_masks.tolist(), counts.tolist()):
+      mask_counts[mask] = mask_counts.get(mask, 0) + count
+
+  if events:
+    result.dtc_events = np.sort(
+        np.concatenate(events), order=("elapsed_time", "vehicle_id"))
+
+  for mask, count in mask_counts.items():
+    active_dtcs = _active_dtcs(mask, monitor)
+    diagnosis = result.diagnoses.setdefault(active_dtcs, {"samples": 0})
+    if "symptoms" not in diagnosis:
+      symptoms_map = fault_tree_util.parse_fault_tree_dict(
+          catalog.fault_tree_dict, active_dtcs)
+      diagnosis["symptoms"] = symptoms_map
+      diagnosis["cause_probabilities"] = (
+          fault_tree_util.calculate_cause_probabilities(symptoms_map))
+    diagnosis["samples"] += count
+
+  return result
+
+
+_worker_catalog = None
+
+
+def _init_worker(dtcs_yaml_path, fault_tree_yaml_path):
+  """Loads the diagnostics definitions once per worker process."""
+  global _worker_catalog
+  _worker_catalog = diagnostics_catalog.get_catalog(
+      dtcs_yaml_path, fault_tree_yaml_path)
+
+
+def _replay_in_worker(trace_path, chunk_size):
+  """Replays a trace with the worker's diagnostics definitions."""
+  return replay_trace(trace_path, _worker_catalog, chunk_size=chunk_size)
+
+
+def replay_traces(
+    trace_paths, dtcs_yaml_path=None, fault_tree_yaml_path=None,
+    processes=None, chunk_size=CHUNK_SIZE):
+  """Replays many traces in parallel, yielding results as they finish.
+
+  Args:
+    trace_paths: iterable of strings representing paths of trace files.
+    dtcs_yaml_path: string representing path of DTC definitions to score with.
+    fault_tree_yaml_path: string representing path of the fault tree to use.
+    processes: optional int representing number of worker processes.
+    chunk_size: int representing samples evaluated per vectorized chunk.
+  Yields:
+    A `ReplayResult` per trace, in completion order.
+  """
+  with Pool(
+      processes, initializer=_init_worker,
+      initargs=(dtcs_yaml_path, fault_tree_yaml_path)) as pool:
+    replay = functools.partial(_replay_in_worker, chunk_size=chunk_size)
+    yield from pool.imap_unordered(replay, trace_paths)
+
+
+if __name__ == "__main__":
+  # Parse user input arguments.
+  parser = argparse.ArgumentParser()
+
+  parser.add_argument(
+      "traces", nargs="+", help="Trace files to replay.")
+  parser.add_argument(
+      "--dtcs_yaml", type=str, default=dtc_util.DTCS_YAML_PATH,
+      help="DTC definitions to score the traces with.")
+  parser.add_argument(
+      "--fault_tree_yaml", type=str,
+      default=fault_tree_util.FAULT_TREE_YAML_PATH,
+      help="Fault tree to run inference with.")
+  parser.add_argument(
+      "--processes", type=int, default=None,
+      help="Number of worker processes. Defaults to the number of CPUs.")
+
+  args = parser.parse_args()
+
+  for result in replay_traces(
+      args.traces, args.dtcs_yaml, args.fault_tree_yaml, args.processes):
+    print(f"Trace: {result.trace_path}.")
+    for active_dtcs, diagnosis in result.diagnoses.items():
+      print(f"  DTCs: {list(active_dtcs)}, samples: {diagnosis['samples']}, "
+            f"cause probabilities: {diagnosis['cause_probabilities']}")
+    print(f"  DTC events: {len(result.dtc_events)}.", flush=True)
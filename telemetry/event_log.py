@@ -0,0 +1,493 @@
+"""Buffered, structured log of DTC events, written in the background.
+
+Callers hand DTC set/clear events (`trace_file.DTC_EVENT_DTYPE` arrays, as
+emitted by the debouncer, watchdog or replay) to `DTCEventLog.log`, which only
+stamps and enqueues them: formatting and I/O happen on a writer thread, which
+takes every event queued since its last write as one batch. If the bounded
+queue is full, events are dropped and counted rather than blocking the
+simulation loop.
+
+Each `EVENT_DTYPE` record holds the wall-clock timestamp, simulated time,
+vehicle ID, ECU, DTC code and type, whether the DTC was set or cleared, and a
+snapshot ("freeze frame") of the sim outputs, laid out as `sim_output.SIGNALS`.
+
+Log files are written in one of two formats, rotated once they reach
+`max_bytes`, keeping `backup_count` older files as `<path>.1`, `<path>.2`, ...
+
+  binary  `LOG_MAGIC`, a uint32 record size, then raw `EVENT_DTYPE` records.
+  jsonl   one JSON object per event, snapshot signals keyed by name.
+
+Printing to stdout is an optional sink, also on the writer thread. It also
+prints the fault tree inference results passed to `log_inference`, while the
+log files only hold DTC events. Read either format back with `read_events`.
+
+If writing fails, the writer keeps draining the queue, and the error is raised
+by the next `log`, `flush` or `close`.
+"""
+
+import atexit
+import collections
+import json
+import os
+import queue
+import struct
+import sys
+import threading
+import time
+
+import numpy as np
+
+from telemetry import trace_file
+from vehicle_model import sim_output
+
+
+# Constants.
+LOG_MAGIC = b"ADDTCLG1"
+FILE_FORMATS = ("binary", "jsonl")
+DTC_TYPES = ("unknown", "comms_missing", "rationality", "open_circuit",
+             "short_circuit")
+MAX_BYTES = 64 * 2**20  # [B], log file size at which it is rotated.
+BACKUP_COUNT = 5  # [], rotated log files kept.
+QUEUE_SIZE = 4096  # [], batches of events buffered for the writer thread.
+EVENT_DTYPE = np.dtype([
+    ("timestamp", "<f8"),  # [s], wall-clock time since the epoch.
+    ("elapsed_time", "<f8"),  # [s], simulated time, NaN if unknown.
+    ("vehicle_id", "<i8"),
+    ("ecu", "S3"),
+    ("dtc", "S4"),
+    ("dtc_type", "u1"),  # Index into `DTC_TYPES`.
+    ("active", "?"),
+    ("snapshot", "<f8", (sim_output.NUM_SIGNALS,)),
+])
+_HEADER = struct.Struct("<8sI")
+
+# Fault tree inference results queued by `DTCEventLog.log_inference`.
+_Inference = collections.namedtuple(
+    "_Inference",
+    ["timestamp", "vehicle_id", "symptoms_map", "cause_probabilities"])
+
+
+class EventLogError(Exception):
+  pass
+
+
+def _get_dtc_types():
+  """Returns a dict mapping (ecu, dtc) to `DTC_TYPES` indices."""
+  from vehicle_model.diagnostics import catalog as diagnostics_catalog
+
+  return {
+      (entry.ecu.encode(), entry.dtc.encode()): DTC_TYPES.index(entry.type)
+      for entry in diagnostics_catalog.get_catalog().dtc_table
+      if entry.type in DTC_TYPES}
+
+
+class DTCEventLog:
+  """Structured DTC event log with a batching background writer."""
+
+  def __init__(
+      self, path=None, file_format="binary", max_bytes=MAX_BYTES,
+      backup_count=BACKUP_COUNT, stdout=False, queue_size=QUEUE_SIZE):
+    """Initializes a DTCEventLog, and starts its writer thread.
+
+    Args:
+      path: optional string representing path of the log file. Events are only
+        sent to the other sinks if `None`.
+      file_format: string, one of `FILE_FORMATS`.
+      max_bytes: int representing the file size [B] at which it is rotated.
+      backup_count: int representing the number of rotated files kept.
+      stdout: bool, if `True` events are also printed to stdout.
+      queue_size: int representing the batches of events buffered for the
+        writer, beyond which events are dropped.
+    """
+    if file_format not in FILE_FORMATS:
+      raise EventLogError(f"{file_format} not one of {FILE_FORMATS}.")
+
+    self._path = path
+    self._file_format = file_format
+    self._max_bytes = max_bytes
+    self._backup_count = backup_count
+    self._stdout = stdout
+    self._dtc_types = None  # Resolved on the writer thread.
+    self._file = None
+    self._header_size = _HEADER.size if file_format == "binary" else 0
+    self._num_logged = 0
+    self._num_dropped = 0
+    self._num_written = 0
+    self._error = None  # First exception raised on the writer thread.
+    self._closed = False
+
+    self._queue = queue.Queue(queue_size)
+    self._writer = threading.Thread(target=self._write_batches, daemon=True)
+    self._writer.start()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *unused_exc_info):
+    self.close()
+
+  def log(self, events, snapshots=None, vehicle_id=None):
+    """Enqueues DTC events for the writer, without blocking.
+
+    Args:
+      events: `trace_file.DTC_EVENT_DTYPE` array of DTCs set or cleared.
+      snapshots: optional sim outputs at the events, a `sim_output.NUM_SIGNALS`
+        record shared by every event, or one row per event. NaN if `None`.
+      vehicle_id: optional int overriding the vehicle ID of the events.
+    Returns:
+      bool, `False` if the events were dropped as the queue is full.
+    """
+    if self._closed:
+      raise EventLogError("Event log is closed.")
+    self._raise_error()
+    if not len(events):
+      return True
+
+    if snapshots is not None:
+      snapshots = np.array(snapshots, dtype=np.float64)  # Copy, may be a view.
+    try:
+      self._queue.put_nowait((time.time(), events, snapshots, vehicle_id))
+    except queue.Full:
+      self._num_dropped += len(events)
+      return False
+
+    self._num_logged += len(events)
+    return True
+
+  def log_inference(self, symptoms_map, cause_probabilities, vehicle_id=0):
+    """Enqueues fault tree inference results for the stdout sink.
+
+    Args:
+      symptoms_map: dict mapping symptoms to their causes' probabilities, as
+        returned by `fault_tree_util.parse_fault_tree_dict`.
+      cause_probabilities: dict mapping causes to their probabilities.
+      vehicle_id: int representing the vehicle the DTCs were set on.
+    Returns:
+      bool, `False` if the results were dropped as the queue is full.
+    """
+    if self._closed:
+      raise EventLogError("Event log is closed.")
+    self._raise_error()
+    if not self._stdout:
+      return True
+
+    try:
+      self._queue.put_nowait(_Inference(
+          time.time(), vehicle_id, symptoms_map, cause_probabilities))
+    except queue.Full:
+      return False
+
+    return True
+
+  def get_num_logged(self):
+    """Returns the number of events accepted by `log`."""
+    return self._num_logged
+
+  def get_num_dropped(self):
+    """Returns the number of events dropped as the queue was full."""
+    return self._num_dropped
+
+  def get_num_written(self):
+    """Returns the number of events written to the sinks."""
+    return self._num_written
+
+  def flush(self):
+    """Blocks until every event logged so far is written."""
+    self._queue.join()
+    self._raise_error()
+
+  def close(self):
+    """Writes the pending events, stops the writer and closes the file."""
+    if self._closed:
+      return
+
+    self._closed = True
+    if self._writer.is_alive():
+      self._queue.put(None)  # The writer drains the queue, so this returns.
+      self._writer.join()
+    self._raise_error()
+
+  def _raise_error(self):
+    """Raises the error of the writer thread, if writing failed."""
+    if self._error is not None:
+      raise EventLogError(
+          f"Writing DTC events failed: {self._error!r}") from self._error
+
+  def _to_records(self, items):
+    """Returns the `EVENT_DTYPE` records of queued items."""
+    if self._dtc_types is None:
+      self._dtc_types = _get_dtc_types()
+
+    records = np.zeros(sum(len(item[1]) for item in items), dtype=EVENT_DTYPE)
+    start = 0
+    for timestamp, events, snapshots, vehicle_id in items:
+      stop = start + len(events)
+      batch = records[start:stop]
+      batch["timestamp"] = timestamp
+      for field in ("elapsed_time", "vehicle_id", "ecu", "dtc", "active"):
+        batch[field] = events[field]
+      if vehicle_id is not None:
+        batch["vehicle_id"] = vehicle_id
+      batch["dtc_type"] = [
+          self._dtc_types.get((ecu, dtc), 0)
+          for ecu, dtc in zip(events["ecu"].tolist(), events["dtc"].tolist())]
+      batch["snapshot"] = np.nan if snapshots is None else snapshots
+      start = stop
+
+    return records
+
+  def _write_batches(self):
+    """Writer thread: writes queued events in batches until closed."""
+    try:
+      while True:
+        items = [self._queue.get()]
+        while True:
+          try:
+            items.append(self._queue.get_nowait())
+          except queue.Empty:
+            break
+
+        closing = items[-1] is None
+        batch = [item for item in items if item is not None]
+        try:
+          if batch:
+            self._write(batch)
+        except Exception as e:  # Kept for the caller, the writer carries on.
+          self._num_dropped += sum(
+              len(item[1]) for item in batch
+              if not isinstance(item, _Inference))
+          if self._error is None:
+            self._error = e
+        for _ in items:
+          self._queue.task_done()
+        if closing:
+          return
+    finally:
+      if self._file:
+        self._file.close()
+
+  def _write(self, items):
+    """Writes queued items to every sink."""
+    records = self._to_records(
+        [item for item in items if not isinstance(item, _Inference)])
+    if self._path and len(records):
+      if self._file_format == "binary":
+        data = records.tobytes()
+      else:
+        data = "".join(
+            json.dumps(_to_dict(record)) + "\n" for record in records).encode()
+      self._open_for(len(data))
+      self._file.write(data)
+      self._file.flush()
+
+    if self._stdout:
+      lines = []
+      start = 0
+      for item in items:  # In logged order.
+        if isinstance(item, _Inference):
+          lines.extend(_format_inference(item))
+        else:
+          lines.extend(map(_format, records[start:start + len(item[1])]))
+          start += len(item[1])
+      sys.stdout.write("".join(line + "\n" for line in lines))
+      sys.stdout.flush()
+
+    self._num_written += len(records)
+
+  def _open_for(self, num_bytes):
+    """Opens the log file, rotating it first if `num_bytes` would overflow.
+
+    Batches are never split, so a file holds at least one batch.
+    """
+    if (self._file and self._file.tell() > self._header_size and
+        self._file.tell() + num_bytes > self._max_bytes):
+      self._file.close()
+      self._file = None
+      self._rotate()
+
+    if not self._file:
+      self._file = open(self._path, "ab")
+      if self._file_format == "binary" and not self._file.tell():
+        self._file.write(_HEADER.pack(LOG_MAGIC, EVENT_DTYPE.itemsize))
+
+  def _rotate(self):
+    """Shifts `<path>` to `<path>.1`, `<path>.1` to `<path>.2` and so on."""
+    if not self._backup_count:
+      os.remove(self._path)
+      return
+
+    for index in range(self._backup_count - 1, 0, -1):
+      source = f"{self._path}.{index}"
+      if os.path.exists(source):
+        os.replace(source, f"{self._path}.{index + 1}")
+    os.replace(self._path, f"{self._path}.1")
+
+
+def _to_dict(record):
+  """Returns a JSON serializable dict of an `EVENT_DTYPE` record."""
+  elapsed_time = float(record["elapsed_time"])
+  return {
+      "timestamp": float(record["timestamp"]),
+      "elapsed_time": None if elapsed_time != elapsed_time else elapsed_time,
+      "vehicle_id": int(record["vehicle_id"]),
+      "ecu": record["ecu"].decode(),
+      "dtc": record["dtc"].decode(),
+      "dtc_type": DTC_TYPES[record["dtc_type"]],
+      "active": bool(record["active"]),
+      "snapshot": {
+          signal: value
+          for signal, value in zip(
+              sim_output.SIGNALS, record["snapshot"].tolist())
+          if value == value},  # Not NaN.
+  }
+
+
+def _format(record):
+  """Returns a human readable line of an `EVENT_DTYPE` record."""
+  timestamp = time.strftime(
+      "%Y-%m-%d %H:%M:%S", time.localtime(record["timestamp"]))
+  state = "set" if record["active"] else "cleared"
+  return (
+      f"{timestamp} Vehicle {record['vehicle_id']} "
+      f"{record['ecu'].decode().upper()} DTC {state}: "
+      f"{record['dtc'].decode()} ({DTC_TYPES[record['dtc_type']]})")
+
+
+def _format_inference(inference):
+  """Returns the human readable lines of an `_Inference`."""
+  timestamp = time.strftime(
+      "%Y-%m-%d %H:%M:%S", time.localtime(inference.timestamp))
+  prefix = f"{timestamp} Vehicle {inference.vehicle_id}"
+  return (
+      f"{prefix} Symptoms map: {inference.symptoms_map}",
+      f"{prefix} Cause probabilities: {inference.cause_probabilities}")
+
+
+def read_events(path):
+  """Reads the events of a log file, of either format.
+
+  Args:
+    path: string representing path of the log file.
+  Returns:
+    `EVENT_DTYPE` array of the events, in logged order.
+  """
+  with open(path, "rb") as f:
+    data = f.read()
+
+  if data.startswith(LOG_MAGIC):
+    _, record_size = _HEADER.unpack_from(data)
+    if record_size != EVENT_DTYPE.itemsize:
+      raise EventLogError(f"{path} records are not `EVENT_DTYPE` records.")
+    return np.frombuffer(data, dtype=EVENT_DTYPE, offset=_HEADER.size)
+
+  lines = data.decode().splitlines()
+  records = np.zeros(len(lines), dtype=EVENT_DTYPE)
+  for record, line in zip(records, lines):
+    event = json.loads(line)
+    for field in ("timestamp", "vehicle_id", "ecu", "dtc", "active"):
+      record[field] = event[field]
+    elapsed_time = event["elapsed_time"]
+    record["elapsed_time"] = np.nan if elapsed_time is None else elapsed_time
+    record["dtc_type"] = DTC_TYPES.index(event["dtc_type"])
+    record["snapshot"] = [
+        event["snapshot"].get(signal, np.nan) for signal in sim_output.SIGNALS]
+
+  return records
+
+
+_default_log = None
+_default_log_pid = None
+_default_stdout = False
+
+
+def get_default_log():
+  """Returns the process-wide log, used by ECUs given none.
+
+  Unless replaced with `set_default_log`, it writes no file and only counts
+  events, or also prints them after `set_default_stdout(True)`. It is created
+  on first use, and again in forked processes, and closed at exit.
+  """
+  global _default_log, _default_log_pid
+  if _default_log is None or _default_log_pid != os.getpid():
+    _default_log = DTCEventLog(stdout=_default_stdout)
+    _default_log_pid = os.getpid()
+
+  return _default_log
+
+
+def set_default_stdout(stdout):
+  """Sets whether process-wide logs created from now on print to stdout.
+
+  Processes forked afterwards, e.g. dojo workers, inherit the setting.
+  """
+  global _default_stdout
+  _default_stdout = stdout
+
+
+def set_default_log(event_log):
+  """Sets the process-wide log, e.g. to a file, returning the previous one."""
+  global _default_log, _default_log_pid
+  previous_log = _default_log
+  _default_log = event_log
+  _default_log_pid = os.getpid()
+
+  return previous_log
+
+
+def flush_default_log():
+  """Writes the pending events of the process-wide log, if it was used.
+
+  Worker processes, e.g. of a `multiprocessing.Pool`, exit without running
+  `atexit` handlers, so they flush once done with each vehicle.
+  """
+  if _default_log is not None and _default_log_pid == os.getpid():
+    _default_log.flush()
+
+
+@atexit.register
+def _close_default_log():
+  """Writes the pending events of the process-wide log, at exit."""
+  if _default_log is not None and _default_log_pid == os.getpid():
+    _default_log.close()
+
+
+if __name__ == "__main__":
+  """Quick functionality and overhead checks for this library."""
+  import tempfile
+  import timeit
+
+  events = np.zeros(2, dtype=trace_file.DTC_EVENT_DTYPE)
+  events["elapsed_time"] = 1.5
+  events["vehicle_id"] = 7
+  events["ecu"] = (b"bmm", b"pmm")
+  events["dtc"] = (b"D001", b"A005")
+  events["active"] = (True, False)
+  snapshot = np.arange(sim_output.NUM_SIGNALS, dtype=np.float64)
+
+  log_dir = tempfile.mkdtemp()
+  for file_format in FILE_FORMATS:
+    path = os.path.join(log_dir, f"events.{file_format}")
+    with DTCEventLog(
+        path, file_format, max_bytes=64 * 1024, backup_count=2) as event_log:
+      event_log.log(events, snapshot)
+      event_log.flush()
+
+      num_logs = 10000
+      log_time = timeit.timeit(
+          lambda: event_log.log(events, snapshot), number=num_logs) / num_logs
+    file_names = sorted(
+        name for name in os.listdir(log_dir) if file_format in name)
+    print(f"{file_format}: {log_time * 1e6:.2f} us/log call, "
+          f"written: {event_log.get_num_written()}, "
+          f"dropped: {event_log.get_num_dropped()}, files: {file_names}")
+    records = read_events(path)
+    print(f"  read back {len(records)}, last: {_format(records[-1])}, "
+          f"snapshot v_bus: {records[-1]['snapshot'][2]}")
+
+  set_default_stdout(True)
+  default_log = get_default_log()
+  default_log.log(events, snapshot)
+  default_log.log_inference(
+      {"s1": {"bmm_v_bus_sensor_short": 1.0}}, {"bmm_v_bus_sensor_short": 1.0},
+      vehicle_id=7)
+  default_log.flush()
@@ -0,0 +1,155 @@
+"""Bounded ring buffer recorder for vehicle sim outputs."""
+
+import numpy as np
+
+from vehicle_model import sim_output
+
+
+# Constants.
+DEFAULT_CAPACITY = 6000  # [], rows kept in memory i.e. 60 s at 100 Hz.
+
+
+class RecorderError(Exception):
+  pass
+
+
+class TelemetryRecorder:
+  """Records sim outputs into a preallocated, memory-bounded ring buffer.
+
+  Each recorded row is written twice, at `i` and `i + capacity`, into a buffer
+  of `2 * capacity` rows. Trading that extra copy for memory means the latest
+  `n <= capacity` rows are always contiguous, so reads are returned as views
+  without any per-read copying or per-step allocation.
+
+  Rows may be single-vehicle sim outputs or, by setting `row_shape`, a whole
+  fleet's (num_vehicles, num_signals) sim outputs per time step.
+
+  If `spill_path` is given, each batch of `capacity` rows is appended to that
+  file in chronological order just before it would be overwritten, so the full
+  history survives on disk. Read it back with `load_spill`.
+  """
+
+  def __init__(
+      self, capacity=DEFAULT_CAPACITY, row_shape=(sim_output.NUM_SIGNALS,),
+      dtype=np.float64, spill_path=None,
+      time_index=sim_output.SIGNAL_INDEX["elapsed_time"]):
+    """Initializes a TelemetryRecorder.
+
+    Args:
+      capacity: int representing the number of rows kept in memory.
+      row_shape: tuple representing the shape of each recorded row.
+      dtype: NumPy dtype to store rows as.
+      spill_path: optional string representing a file to spill rows to.
+      time_index: int representing the column holding elapsed time [s].
+    """
+    if capacity < 1:
+      raise RecorderError(f"capacity should be positive, got: {capacity}.")
+
+    self._capacity = capacity
+    self._row_shape = tuple(row_shape)
+    self._time_index = time_index
+    self._buffer = np.zeros((2 * capacity,) + self._row_shape, dtype=dtype)
+    self._head = 0  # Buffer row that the next record is written to.
+    self._num_recorded = 0
+    self._num_spilled = 0
+    self._spill_file = open(spill_path, "wb") if spill_path else None
+
+  def __len__(self):
+    """Returns the number of rows currently held in memory."""
+    return min(self._num_recorded, self._capacity)
+
+  def get_capacity(self):
+    """Returns the number of rows kept in memory."""
+    return self._capacity
+
+  def get_num_recorded(self):
+    """Returns the total number of rows recorded, including spilled ones."""
+    return self._num_recorded
+
+  def record(self, row):
+    """Appends a row of sim outputs.
+
+    Args:
+      row: `sim_output.SimOutput` or array of shape `row_shape`.
+    """
+    if isinstance(row, sim_output.SimOutput):
+      row = row.as_array()
+
+    buffer, head = self._buffer, self._head
+    buffer[head] = row
+    buffer[head + self._capacity] = row
+
+    head += 1
+    self._head = 0 if head == self._capacity else head
+    self._num_recorded += 1
+
+    if (self._spill_file and
+        self._num_recorded - self._num_spilled == self._capacity):
+      self.spill()
+
+  def latest(self, num_rows=None):
+    """Returns a view of the latest rows, oldest first.
+
+    Args:
+      num_rows: optional int representing the number of rows to return; all
+        rows held in memory if `None`.
+    """
+    num_rows = len(self) if num_rows is None else min(num_rows, len(self))
+    end = self._head + self._capacity
+    return self._buffer[end - num_rows:end]
+
+  def window(self, seconds):
+    """Returns a view of the rows recorded over the last `seconds` [s]."""
+    rows = self.latest()
+    if not len(rows):
+      return rows
+
+    times = rows.reshape(len(rows), -1, rows.shape[-1])[:, 0, self._time_index]
+    start = np.searchsorted(times, times[-1] - seconds, side="right")
+    return rows[start:]
+
+  def spill(self):
+    """Appends the rows not yet spilled to the spill file."""
+    if not self._spill_file:
+      raise RecorderError("No spill_path given for this recorder.")
+
+    self.latest(self._num_recorded - self._num_spilled).tofile(
+        self._spill_file)
+    self._num_spilled = self._num_recorded
+
+  def close(self):
+    """Spills any remaining rows and closes the spill file."""
+    if self._spill_file:
+      self.spill()
+      self._spill_file.close()
+      self._spill_file = None
+
+
+def load_spill(
+    spill_path, row_shape=(sim_output.NUM_SIGNALS,), dtype=np.float64):
+  """Memory-maps a recorder spill file as an array of rows, oldest first."""
+  return np.memmap(spill_path, dtype=dtype, mode="r").reshape(
+      (-1,) + tuple(row_shape))
+
+
+if __name__ == "__main__":
+  """Quick functionality tests for this library."""
+  import os
+  import tempfile
+
+  from vehicle_model import vehicle
+
+  spill_path = os.path.join(tempfile.mkdtemp(), "vehicle_1.bin")
+  recorder = TelemetryRecorder(capacity=500, spill_path=spill_path)
+
+  vehicle_1 = vehicle.Vehicle(vehicle_id=1)
+  vehicle_1.attach_recorder(recorder)
+  vehicle_1.run_for(12.34)
+  recorder.close()
+
+  last_second = recorder.window(1.0)
+  print(len(recorder), recorder.get_num_recorded(), last_second.shape)
+  print(np.shares_memory(last_second, recorder.latest()))
+
+  spilled = load_spill(spill_path)
+  print(spilled.shape, np.array_equal(spilled[-len(recorder):], recorder.latest()))
@@ -0,0 +1,241 @@
+"""Shared memory ring buffers carrying sim outputs between processes.
+
+A `SharedRingBuffer` is a single `multiprocessing.shared_memory` segment holding
+one fixed-layout ring region per vehicle:
+
+  headers  int64[num_rings, 4]: rows written, rows read, rows dropped, closed.
+  rows     float64[num_rings, capacity, row_size], laid out as
+           `sim_output.SIGNALS` by default.
+
+Each ring has a single producer, e.g. the worker process simulating the
+vehicle, which only advances the written count, and a single consumer, which
+only advances the read count, so no locks are needed. A row is written before
+the written count is published, so consumers never see partial rows. Consumers
+read rows in place, as views of the segment.
+
+If a ring is full the producer waits up to `block_timeout` seconds for the
+consumer to catch up (backpressure), then drops the row and counts it.
+"""
+
+import time
+
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from vehicle_model import sim_output
+
+
+# Constants.
+DEFAULT_CAPACITY = 1024  # [], rows per ring.
+POLL_INTERVAL = 1e-4  # [s], interval at which a blocked producer retries.
+_WRITTEN, _READ, _DROPPED, _CLOSED = range(4)
+_HEADER_SIZE = 4
+
+
+class SharedRingError(Exception):
+  pass
+
+
+class SharedRingBuffer:
+  """Shared memory segment of per vehicle ring regions."""
+
+  def __init__(
+      self, num_rings=None, capacity=DEFAULT_CAPACITY,
+      row_size=sim_output.NUM_SIGNALS, name=None):
+    """Creates a segment, or attaches to an existing one by `name`.
+
+    Args:
+      num_rings: int representing the number of rings, i.e. vehicles, to
+        create. `None` when attaching.
+      capacity: int representing rows per ring.
+      row_size: int representing float64 values per row.
+      name: optional string representing name of an existing segment.
+    """
+    if name is None:
+      if not num_rings or capacity < 1:
+        raise SharedRingError("num_rings and capacity should be positive.")
+      layout = np.array([num_rings, capacity, row_size], dtype=np.int64)
+      size = (layout.nbytes + num_rings * _HEADER_SIZE * 8 +
+              num_rings * capacity * row_size * 8)
+      self._shm = shared_memory.SharedMemory(create=True, size=size)
+      self._owner = True
+      np.ndarray(3, dtype=np.int64, buffer=self._shm.buf)[:] = layout
+    else:
+      self._shm = shared_memory.SharedMemory(name=name)
+      self._owner = False
+
+    layout = np.ndarray(3, dtype=np.int64, buffer=self._shm.buf)
+    self._num_rings, self._capacity, self._row_size = layout.tolist()
+
+    self._headers = np.ndarray(
+        (self._num_rings, _HEADER_SIZE), dtype=np.int64, buffer=self._shm.buf,
+        offset=layout.nbytes)
+    self._rows = np.ndarray(
+        (self._num_rings, self._capacity, self._row_size), dtype=np.float64,
+        buffer=self._shm.buf, offset=layout.nbytes + self._headers.nbytes)
+
+  def get_name(self):
+    """Returns the name other processes attach to the segment with."""
+    return self._shm.name
+
+  def get_num_rings(self):
+    """Returns the number of rings in the segment."""
+    return self._num_rings
+
+  def get_capacity(self):
+    """Returns the number of rows per ring."""
+    return self._capacity
+
+  def writer(self, index, block_timeout=0.0):
+    """Returns a `RingWriter` producing into ring `index`."""
+    return RingWriter(self, index, block_timeout)
+
+  def read(self, index, max_rows=None):
+    """Returns a view of the unread rows of ring `index`, oldest first.
+
+    The view is contiguous, so it may stop at the end of the ring region even
+    if more rows are available; call `read` again after `release`. Rows are
+    only valid until released.
+    """
+    header = self._headers[index]
+    start = int(header[_READ])
+    num_rows = int(header[_WRITTEN]) - start
+    if max_rows is not None:
+      num_rows = min(num_rows, max_rows)
+
+    offset = start % self._capacity
+    return self._rows[index, offset:min(offset + num_rows, self._capacity)]
+
+  def pending(self):
+    """Returns the indices of rings with unread rows."""
+    (indices,) = np.nonzero(
+        self._headers[:, _WRITTEN] > self._headers[:, _READ])
+    return indices
+
+  def release(self, index, num_rows):
+    """Marks the oldest `num_rows` rows of ring `index` as consumed."""
+    self._headers[index, _READ] += num_rows
+
+  def drain(self, index, callback):
+    """Passes every unread row block of ring `index` to `callback`, in order.
+
+    Returns:
+      num_rows: int representing the number of rows drained.
+    """
+    num_rows = 0
+    rows = self.read(index)
+    while len(rows):
+      callback(rows)
+      self.release(index, len(rows))
+      num_rows += len(rows)
+      rows = self.read(index)
+
+    return num_rows
+
+  def get_num_written(self, index):
+    """Returns the number of rows written to ring `index`."""
+    return int(self._headers[index, _WRITTEN])
+
+  def get_num_dropped(self, index):
+    """Returns the number of rows dropped by the producer of ring `index`."""
+    return int(self._headers[index, _DROPPED])
+
+  def is_closed(self, index):
+    """Returns whether the producer of ring `index` is done writing."""
+    return bool(self._headers[index, _CLOSED])
+
+  def close(self):
+    """Detaches from the segment, destroying it if this process created it."""
+    self._headers = self._rows = None
+    self._shm.close()
+    if self._owner:
+      self._shm.unlink()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *unused_exc_info):
+    self.close()
+
+
+class RingWriter:
+  """Producer of one ring. A recorder: attach it with `attach_recorder`."""
+
+  def __init__(self, ring_buffer, index, block_timeout=0.0):
+    """Initializes a RingWriter.
+
+    Args:
+      ring_buffer: `SharedRingBuffer` holding the ring.
+      index: int representing the ring to produce into.
+      block_timeout: float representing the time [s] to wait for space in a
+        full ring before dropping the row.
+    """
+    self._header = ring_buffer._headers[index]
+    self._rows = ring_buffer._rows[index]
+    self._capacity = ring_buffer.get_capacity()
+    self._block_timeout = block_timeout
+    self._header[_CLOSED] = 0
+
+  def record(self, row):
+    """Writes a row, or drops it if the ring stays full.
+
+    Returns:
+      bool representing whether the row was written.
+    """
+    if isinstance(row, sim_output.SimOutput):
+      row = row.as_array()
+
+    header = self._header
+    written = int(header[_WRITTEN])
+
+    if written - header[_READ] >= self._capacity:
+      deadline = time.monotonic() + self._block_timeout
+      while written - header[_READ] >= self._capacity:
+        if time.monotonic() >= deadline:
+          header[_DROPPED] += 1
+          return False
+        time.sleep(POLL_INTERVAL)
+
+    self._rows[written % self._capacity] = row
+    header[_WRITTEN] = written + 1  # Publish the row.
+    return True
+
+  def close(self):
+    """Marks the ring as done, for consumers to stop waiting on it."""
+    self._header[_CLOSED] = 1
+
+
+if __name__ == "__main__":
+  """Quick functionality tests for this library."""
+  from multiprocessing import Process
+
+  from vehicle_model import vehicle
+
+  def produce(name, index):
+    ring_buffer = SharedRingBuffer(name=name)
+    writer = ring_buffer.writer(index, block_timeout=0.01)
+    vehicle_instance = vehicle.Vehicle(vehicle_id=index + 1, seed=1)
+    vehicle_instance.attach_recorder(writer)
+    vehicle_instance.run_for(10)
+    writer.close()
+    ring_buffer.close()
+
+  with SharedRingBuffer(num_rings=4, capacity=256) as ring_buffer:
+    producers = [
+        Process(target=produce, args=(ring_buffer.get_name(), index))
+        for index in range(4)]
+    for producer in producers:
+      producer.start()
+
+    received = [0] * 4
+    while not all(ring_buffer.is_closed(index) and
+                  not len(ring_buffer.read(index)) for index in range(4)):
+      for index in range(4):
+        received[index] += ring_buffer.drain(index, lambda rows: None)
+      time.sleep(0.001)
+
+    for producer in producers:
+      producer.join()
+
+    print(received, [ring_buffer.get_num_dropped(i) for i in range(4)])
@@ -0,0 +1,304 @@
+"""Memory-mapped columnar trace files for recorded simulation runs.
+
+File layout (all offsets page aligned, little endian):
+
+  [0, 8)             magic, `TRACE_MAGIC`.
+  [8, 16)            uint64 length of the JSON header that follows.
+  [16, HEADER_SIZE)  JSON header: signal schema, vehicle IDs offset, run
+                     parameters and seed, sample count and section offsets.
+  vehicle IDs        int64[num_vehicles].
+  columns            one column per signal, each `max_samples` x
+                     `num_vehicles` values laid out time-major.
+  DTC events         `DTC_EVENT_DTYPE` records, written on close.
+
+Columns are written in chunks while a run is in progress, into a file that is
+sized up front but sparse, so unused capacity costs no disk space. The header's
+sample count is updated after each chunk, so a trace still being recorded can
+be read up to its last written chunk. Reading a signal memory-maps only that
+column's region of the file.
+"""
+
+import json
+import mmap
+import struct
+
+import numpy as np
+
+from vehicle_model import sim_output
+
+
+# Constants.
+TRACE_MAGIC = b"ADTRACE1"
+TRACE_VERSION = 1
+HEADER_SIZE = 65536  # [B], space reserved for the magic and JSON header.
+DEFAULT_CHUNK_SIZE = 1024  # [], samples buffered per column before writing.
+DTC_EVENT_DTYPE = np.dtype([
+    ("elapsed_time", "<f8"),
+    ("vehicle_id", "<i8"),
+    ("ecu", "S3"),
+    ("dtc", "S4"),
+    ("active", "?"),
+])
+_PREAMBLE = struct.Struct("<8sQ")
+
+
+class TraceFileError(Exception):
+  pass
+
+
+def _page_align(offset):
+  """Rounds an offset up to the next page boundary."""
+  return -(-offset // mmap.PAGESIZE) * mmap.PAGESIZE
+
+
+class TraceWriter:
+  """Writes sim outputs of one or more vehicles to a columnar trace file.
+
+  A TraceWriter is a recorder: it can be attached to a `vehicle.Vehicle` or a
+  `fleet.FleetSimulator` with `attach_recorder`.
+  """
+
+  def __init__(
+      self, path, max_samples, vehicle_ids=(1,), signals=sim_output.SIGNALS,
+      dtype=np.float64, parameters=None, seed=None,
+      chunk_size=DEFAULT_CHUNK_SIZE):
+    """Initializes a TraceWriter.
+
+    Args:
+      path: string representing path of the trace file to create.
+      max_samples: int representing the maximum number of time samples.
+      vehicle_ids: sequence of ints, one per vehicle in each recorded row.
+      signals: sequence of signal names, in recorded column order.
+      dtype: NumPy dtype to store signal values as.
+      parameters: optional JSON serializable dict of run parameters.
+      seed: optional int representing the seed of the run.
+      chunk_size: int representing samples buffered before each write.
+    """
+    self._path = path
+    self._max_samples = max_samples
+    self._vehicle_ids = np.asarray(vehicle_ids, dtype="<i8")
+    self._signals = tuple(signals)
+    self._dtype = np.dtype(dtype).newbyteorder("<")
+    self._num_samples = 0
+    self._dtc_events = []
+
+    num_vehicles = len(self._vehicle_ids)
+    self._column_bytes = max_samples * num_vehicles * self._dtype.itemsize
+    self._column_stride = _page_align(self._column_bytes)
+    self._data_offset = _page_align(HEADER_SIZE + self._vehicle_ids.nbytes)
+    self._events_offset = (
+        self._data_offset + len(self._signals) * self._column_stride)
+
+    self._header = {
+        "version": TRACE_VERSION,
+        "signals": list(self._signals),
+        "dtype": self._dtype.str,
+        "num_vehicles": num_vehicles,
+        "vehicle_ids_offset": HEADER_SIZE,
+        "max_samples": max_samples,
+        "num_samples": 0,
+        "data_offset": self._data_offset,
+        "column_stride": self._column_stride,
+        "events_offset": self._events_offset,
+        "num_events": 0,
+        "parameters": parameters or {},
+        "seed": seed,
+    }
+
+    # Chunk buffer laid out signal-major, so each column's part is contiguous.
+    self._chunk = np.empty(
+        (len(self._signals), chunk_size, num_vehicles), dtype=self._dtype)
+    self._chunk_len = 0
+
+    self._file = open(path, "wb+")
+    self._file.truncate(self._events_offset)  # Sparse until written.
+    self._write_header()
+    self._file.seek(HEADER_SIZE)
+    self._file.write(self._vehicle_ids.tobytes())
+
+  def _write_header(self):
+    """Writes the magic and JSON header at the start of the file."""
+    header_bytes = json.dumps(self._header).encode()
+    if _PREAMBLE.size + len(header_bytes) > HEADER_SIZE:
+      raise TraceFileError("Trace header exceeds HEADER_SIZE.")
+
+    self._file.seek(0)
+    self._file.write(_PREAMBLE.pack(TRACE_MAGIC, len(header_bytes)))
+    self._file.write(header_bytes)
+
+  def record(self, row):
+    """Appends one time sample.
+
+    Args:
+      row: `sim_output.SimOutput` or array of shape (num_signals,) for a
+        single vehicle, or (num_vehicles, num_signals) for a fleet.
+    """
+    if isinstance(row, sim_output.SimOutput):
+      row = row.as_array()
+    if self._num_samples + self._chunk_len >= self._max_samples:
+      raise TraceFileError(f"Trace is full at {self._max_samples} samples.")
+
+    self._chunk[:, self._chunk_len, :] = np.reshape(
+        row, (-1, len(self._signals))).T
+    self._chunk_len += 1
+
+    if self._chunk_len == self._chunk.shape[1]:
+      self.flush()
+
+  def record_rows(self, rows):
+    """Appends a block of time samples at once.
+
+    Args:
+      rows: array of shape (num_samples, num_signals) for a single vehicle, or
+        (num_samples, num_vehicles, num_signals) for a fleet.
+    """
+    rows = np.reshape(rows, (len(rows), -1, len(self._signals)))
+    self.flush()
+    if self._num_samples + len(rows) > self._max_samples:
+      raise TraceFileError(f"Trace is full at {self._max_samples} samples.")
+
+    row_bytes = len(self._vehicle_ids) * self._dtype.itemsize
+    for column in range(len(self._signals)):
+      self._file.seek(
+          self._data_offset + column * self._column_stride +
+          self._num_samples * row_bytes)
+      self._file.write(
+          np.ascontiguousarray(rows[:, :, column], dtype=self._dtype).tobytes())
+
+    self._commit_samples(len(rows))
+
+  def add_dtc_event(self, elapsed_time, vehicle_id, ecu, dtc, active):
+    """Records a DTC being set (`active=True`) or cleared."""
+    self._dtc_events.append((elapsed_time, vehicle_id, ecu, dtc, active))
+
+  def flush(self):
+    """Writes buffered samples to each signal column."""
+    if not self._chunk_len:
+      return
+
+    row_bytes = len(self._vehicle_ids) * self._dtype.itemsize
+    for column, values in enumerate(self._chunk):
+      self._file.seek(
+          self._data_offset + column * self._column_stride +
+          self._num_samples * row_bytes)
+      self._file.write(values[:self._chunk_len].tobytes())
+
+    self._commit_samples(self._chunk_len)
+    self._chunk_len = 0
+
+  def _commit_samples(self, num_samples):
+    """Counts samples written to the columns, in the header too."""
+    self._num_samples += num_samples
+    self._header["num_samples"] = self._num_samples
+    self._write_header()
+    self._file.flush()
+
+  def close(self):
+    """Flushes samples, writes the DTC events section and final header."""
+    if self._file.closed:
+      return
+
+    self.flush()
+
+    events = np.array(self._dtc_events, dtype=DTC_EVENT_DTYPE)
+    self._file.seek(self._events_offset)
+    self._file.write(events.tobytes())
+
+    self._header["num_events"] = len(events)
+    self._write_header()
+    self._file.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *unused_exc_info):
+    self.close()
+
+
+class TraceReader:
+  """Reads a trace file lazily, one memory-mapped column at a time."""
+
+  def __init__(self, path):
+    self._path = path
+
+    with open(path, "rb") as f:
+      magic, header_len = _PREAMBLE.unpack(f.read(_PREAMBLE.size))
+      if magic != TRACE_MAGIC:
+        raise TraceFileError(f"{path} is not a trace file.")
+      self.header = json.loads(f.read(header_len))
+
+    self.signals = tuple(self.header["signals"])
+    self.num_samples = self.header["num_samples"]
+    self.parameters = self.header["parameters"]
+    self.seed = self.header["seed"]
+    self.vehicle_ids = np.memmap(
+        path, dtype="<i8", mode="r", offset=self.header["vehicle_ids_offset"],
+        shape=(self.header["num_vehicles"],))
+    self._dtype = np.dtype(self.header["dtype"])
+    self._signal_index = {
+        signal: index for index, signal in enumerate(self.signals)}
+
+  def column(self, signal):
+    """Returns a (num_samples, num_vehicles) memory-mapped signal column."""
+    if signal not in self._signal_index:
+      raise TraceFileError(f"{signal} is not recorded in: `{self._path}`.")
+
+    offset = (self.header["data_offset"] +
+              self._signal_index[signal] * self.header["column_stride"])
+    return np.memmap(
+        self._path, dtype=self._dtype, mode="r", offset=offset,
+        shape=(self.num_samples, self.header["num_vehicles"]))
+
+  def vehicle_signal(self, signal, vehicle_id):
+    """Returns the samples of one signal for one vehicle."""
+    (matches,) = np.nonzero(self.vehicle_ids == vehicle_id)
+    if not len(matches):
+      raise TraceFileError(f"Vehicle {vehicle_id} is not in: `{self._path}`.")
+
+    return self.column(signal)[:, matches[0]]
+
+  def sim_outputs(self, vehicle_id, signals=None):
+    """Returns (num_samples, num_signals) sim outputs of one vehicle.
+
+    NOTE: Unlike `column`, this copies the requested signals into memory.
+    """
+    signals = self.signals if signals is None else signals
+    return np.stack(
+        [self.vehicle_signal(signal, vehicle_id) for signal in signals], axis=1)
+
+  def dtc_events(self):
+    """Returns the DTC events as a `DTC_EVENT_DTYPE` array."""
+    if not self.header["num_events"]:
+      return np.zeros(0, dtype=DTC_EVENT_DTYPE)
+
+    return np.memmap(
+        self._path, dtype=DTC_EVENT_DTYPE, mode="r",
+        offset=self.header["events_offset"],
+        shape=(self.header["num_events"],))
+
+
+if __name__ == "__main__":
+  """Quick functionality tests for this library."""
+  import os
+  import tempfile
+
+  from vehicle_model import fleet
+
+  trace_path = os.path.join(tempfile.mkdtemp(), "fleet.trace")
+  fleet_sim = fleet.FleetSimulator(100, seed=7)
+
+  with TraceWriter(
+      trace_path, max_samples=100000,
+      vehicle_ids=fleet_sim.get_vehicle_ids(),
+      parameters={"num_vehicles": 100}, seed=7) as writer:
+    fleet_sim.attach_recorder(writer)
+    fleet_sim.run_for(30)
+    writer.add_dtc_event(12.5, 3, "bmm", "A001", True)
+
+  reader = TraceReader(trace_path)
+  v_bus = reader.column("v_bus")
+  print(reader.num_samples, v_bus.shape, reader.seed, reader.parameters)
+  print(np.array_equal(v_bus[-1], fleet_sim.get_sim_outputs()[:, 2]))
+  print(reader.vehicle_signal("batt_soc", 42)[-3:])
+  print(reader.dtc_events())
+  print(os.path.getsize(trace_path), os.stat(trace_path).st_blocks * 512)
@@ -0,0 +1,173 @@
+"""Process-wide catalog of the diagnostics definitions.
+
+The DTC definitions (`dtcs.yaml`) and the fault tree (`fault_tree.yaml`) are
+parsed once per process into a `DiagnosticsCatalog`, an immutable view that
+every ECU shares by reference. YAML parsing dominates vehicle construction, so
+the parsed definitions can also be kept in a binary (`marshal`) cache file,
+keyed on a hash of the YAML files, which later processes load instead. The
+cache is used when a cache directory is given, or set in `CACHE_DIR_ENV`.
+"""
+
+import collections
+import functools
+import marshal
+import os
+import types
+
+from digital_twin_model import fault_tree_util
+from vehicle_model.diagnostics import dtc_util
+
+
+# Constants.
+CACHE_DIR_ENV = "DIAGNOSTICS_CACHE_DIR"
+_CACHE_PREFIX = "diagnostics-"
+
+# A DTC definition, with `None` for fields its type does not use.
+DTCEntry = collections.namedtuple(
+    "DTCEntry",
+    ["ecu", "dtc", "type", "description", "signals", "lower_limit",
+     "upper_limit", "frequency", "maturation", "dematuration"])
+
+
+class CatalogError(Exception):
+  pass
+
+
+def _freeze(value):
+  """Returns a read-only copy of parsed YAML: mapping proxies and tuples."""
+  if isinstance(value, dict):
+    return types.MappingProxyType(
+        {key: _freeze(item) for key, item in value.items()})
+  if isinstance(value, list):
+    return tuple(_freeze(item) for item in value)
+  return value
+
+
+class DiagnosticsCatalog:
+  """Immutable, compiled DTC definitions and fault tree."""
+
+  def __init__(self, dtcs_dict, fault_tree_dict):
+    """Initializes a DiagnosticsCatalog.
+
+    Args:
+      dtcs_dict: dict of DTCs per ECU, as loaded by `dtc_util.load_yaml`.
+      fault_tree_dict: dict of the fault tree, as loaded by
+        `fault_tree_util.load_yaml`.
+    """
+    self.dtcs_dict = _freeze(dtcs_dict)
+    self.fault_tree_dict = _freeze(fault_tree_dict)
+
+    self.dtc_table = tuple(
+        DTCEntry(
+            ecu, dtc, metadata["type"], metadata["description"],
+            metadata.get("signals", ()), metadata.get("lower_limit"),
+            metadata.get("upper_limit"), metadata.get("frequency"),
+            metadata.get("maturation"), metadata.get("dematuration"))
+        for ecu, dtcs in self.dtcs_dict.items()
+        for dtc, metadata in dtcs.items())
+    self._dtcs = {(entry.ecu, entry.dtc): entry for entry in self.dtc_table}
+
+  def get_ecus(self):
+    """Returns the ECUs with DTC definitions."""
+    return tuple(self.dtcs_dict)
+
+  def get_dtc(self, ecu, dtc):
+    """Returns the `DTCEntry` of an ECU's DTC."""
+    try:
+      return self._dtcs[(ecu, dtc)]
+    except KeyError:
+      raise CatalogError(f"{ecu} has no DTC {dtc}.")
+
+  def get_dtcs(self, ecu=None, dtc_type=None):
+    """Returns the `DTCEntry`s of an ECU and type, or of all if `None`."""
+    return tuple(
+        entry for entry in self.dtc_table
+        if ecu in (None, entry.ecu) and dtc_type in (None, entry.type))
+
+  def get_ecu_frequency(self, ecu):
+    """Returns the rate [Hz] an ECU runs its diagnostics at."""
+    return dtc_util.get_ecu_frequency(ecu, self.dtcs_dict)
+
+
+def _hash_files(paths):
+  """Returns a hex digest of the contents of files."""
+  import hashlib  # Deferred, like `tempfile`: only the cache needs them.
+
+  digest = hashlib.sha256()
+  for path in paths:
+    with open(path, "rb") as f:
+      digest.update(f.read())
+
+  return digest.hexdigest()
+
+
+def _load_definitions(dtcs_yaml_path, fault_tree_yaml_path, cache_dir):
+  """Returns the parsed DTCs and fault tree dicts, via the cache if any."""
+  dtcs_yaml_path = dtcs_yaml_path or dtc_util.get_dtcs_yaml_path()
+  fault_tree_yaml_path = (
+      fault_tree_yaml_path or fault_tree_util.get_fault_tree_yaml_path())
+
+  if not cache_dir:
+    return (
+        dtc_util.load_yaml(dtcs_yaml_path),
+        fault_tree_util.load_yaml(fault_tree_yaml_path))
+
+  key = _hash_files((dtcs_yaml_path, fault_tree_yaml_path))
+  cache_path = os.path.join(
+      cache_dir, f"{_CACHE_PREFIX}{key[:32]}-{marshal.version}.bin")
+
+  try:
+    with open(cache_path, "rb") as f:
+      return marshal.load(f)
+  except (OSError, EOFError, ValueError, TypeError):
+    pass  # Missing or unreadable; rebuild it.
+
+  definitions = (
+      dtc_util.load_yaml(dtcs_yaml_path),
+      fault_tree_util.load_yaml(fault_tree_yaml_path))
+
+  # Write then rename, so concurrent processes never read a partial cache.
+  import tempfile
+
+  os.makedirs(cache_dir, exist_ok=True)
+  fd, temp_path = tempfile.mkstemp(dir=cache_dir, prefix=_CACHE_PREFIX)
+  with os.fdopen(fd, "wb") as f:
+    marshal.dump(definitions, f)
+  os.replace(temp_path, cache_path)
+
+  return definitions
+
+
+@functools.lru_cache(maxsize=None)
+def get_catalog(dtcs_yaml_path=None, fault_tree_yaml_path=None, cache_dir=None):
+  """Returns the diagnostics catalog, loaded once per process and shared.
+
+  Args:
+    dtcs_yaml_path: optional string representing path of the DTC definitions.
+      Defaults to the bundled `dtcs.yaml`.
+    fault_tree_yaml_path: optional string representing path of the fault
+      tree. Defaults to the bundled `fault_tree.yaml`.
+    cache_dir: optional string representing a directory for the binary cache.
+      Defaults to the `CACHE_DIR_ENV` environment variable, if set.
+  """
+  cache_dir = cache_dir or os.environ.get(CACHE_DIR_ENV)
+  return DiagnosticsCatalog(
+      *_load_definitions(dtcs_yaml_path, fault_tree_yaml_path, cache_dir))
+
+
+if __name__ == "__main__":
+  """Quick functionality tests for this library."""
+  import tempfile
+  import time
+
+  catalog = get_catalog()
+  print(catalog.get_ecus(), len(catalog.dtc_table))
+  print(catalog.get_dtc("bmm", "A001"))
+  print(catalog.get_dtcs("pmm", "comms_missing")[0])
+  print(catalog.get_ecu_frequency("bmm"), get_catalog() is catalog)
+
+  cache_dir = tempfile.mkdtemp()
+  for label in ("YAML", "Cold cache", "Warm cache"):
+    start_time = time.perf_counter()
+    _load_definitions(None, None, None if label == "YAML" else cache_dir)
+    print(f"{label}: {(time.perf_counter() - start_time) * 1e3:.2f} ms")
@@ -0,0 +1,233 @@
+"""DTC debouncing with maturation counters, emitting only state transitions.
+
+A raw DTC check, e.g. a rationality limit or an injected fault, can flip from
+one evaluation to the next. Reporting every raw result floods the logs and
+re-runs fault tree inference each step. The `DTCDebouncer` instead only sets a
+DTC after `maturation` consecutive failing evaluations, and clears it after
+`dematuration` consecutive passing ones, both set per DTC in `dtcs.yaml`
+(`DEFAULT_MATURATION` / `DEFAULT_DEMATURATION` if absent). Counters reset when
+an evaluation agrees with the debounced state, so a flapping check holds it.
+
+Counters and states are (num_vehicles, num_dtcs) arrays, over every DTC of the
+catalog, updated for a vehicle or a whole fleet at once. Only transitions are
+emitted, as `trace_file.DTC_EVENT_DTYPE` events. The debounced states are also
+available as a compact status bitfield per ECU: one bit per DTC of the ECU, in
+catalog order.
+"""
+
+import numpy as np
+
+from telemetry import trace_file
+from vehicle_model.diagnostics import catalog as diagnostics_catalog
+
+
+# Constants.
+DEFAULT_MATURATION = 1  # [], failing evaluations to set, i.e. no debouncing.
+DEFAULT_DEMATURATION = 1  # [], passing evaluations to clear.
+MAX_ECU_DTCS = 64  # [], DTCs of an ECU that fit in its status bitfield.
+
+
+class DebounceError(Exception):
+  pass
+
+
+class DTCDebouncer:
+  """Debounced DTC states of one or more vehicles."""
+
+  def __init__(self, vehicle_ids=(0,), dtc_entries=None):
+    """Initializes a DTCDebouncer.
+
+    Args:
+      vehicle_ids: iterable of ints representing the vehicles, in the order of
+        the rows passed to `update`.
+      dtc_entries: optional iterable of `catalog.DTCEntry`s. Defaults to every
+        DTC of the shared catalog.
+    """
+    if dtc_entries is None:
+      dtc_entries = diagnostics_catalog.get_catalog().dtc_table
+    self.dtcs = tuple(dtc_entries)
+
+    self._maturation = np.array([
+        entry.maturation or DEFAULT_MATURATION for entry in self.dtcs])
+    self._dematuration = np.array([
+        entry.dematuration or DEFAULT_DEMATURATION for entry in self.dtcs])
+    self._dtc_indices = {}
+    for index, entry in enumerate(self.dtcs):
+      self._dtc_indices.setdefault(entry.dtc, []).append(index)
+    self._ecu_names = np.array([entry.ecu for entry in self.dtcs], dtype="S3")
+    self._dtc_names = np.array([entry.dtc for entry in self.dtcs], dtype="S4")
+
+    # Columns and status bits of each ECU's DTCs.
+    self._ecu_columns = {}
+    for index, entry in enumerate(self.dtcs):
+      self._ecu_columns.setdefault(entry.ecu, []).append(index)
+    if max(map(len, self._ecu_columns.values()), default=0) > MAX_ECU_DTCS:
+      raise DebounceError(f"At most {MAX_ECU_DTCS} DTCs per ECU are supported.")
+    self._ecu_bits = {
+        ecu: np.array([1 << bit for bit in range(len(columns))], np.uint64)
+        for ecu, columns in self._ecu_columns.items()}
+
+    self._vehicle_ids = np.array(list(vehicle_ids), dtype=np.int64)
+    shape = (len(self._vehicle_ids), len(self.dtcs))
+    self._active = np.zeros(shape, dtype=bool)
+    self._counters = np.zeros(shape, dtype=np.int64)
+
+  def update(self, failing, now=None, rows=None):
+    """Debounces one evaluation of every DTC.
+
+    Args:
+      failing: bool array of the raw DTC results, (num_dtcs,) for a single
+        vehicle or (num_rows, num_dtcs), columns in `dtcs` order.
+      now: optional float representing the evaluation time [s], for events.
+      rows: optional int or array of the vehicle rows evaluated. Defaults to
+        every vehicle, in order.
+    Returns:
+      `trace_file.DTC_EVENT_DTYPE` array of the DTCs set or cleared.
+    """
+    if isinstance(rows, (int, np.integer)) and np.ndim(failing) == 1:
+      return self._update_row(failing, now, rows)
+
+    rows = (
+        np.arange(len(self._vehicle_ids)) if rows is None
+        else np.atleast_1d(rows))
+    failing = np.atleast_2d(failing)
+    active = self._active[rows]
+
+    pending = failing != active
+    counters = np.where(pending, self._counters[rows] + 1, 0)
+    thresholds = np.where(active, self._dematuration, self._maturation)
+    flips = pending & (counters >= thresholds)
+    counters[flips] = 0
+    self._counters[rows] = counters
+    if not flips.any():
+      return np.zeros(0, dtype=trace_file.DTC_EVENT_DTYPE)
+
+    active ^= flips
+    self._active[rows] = active
+
+    flipped_rows, dtcs = np.nonzero(flips)
+    events = np.zeros(len(dtcs), dtype=trace_file.DTC_EVENT_DTYPE)
+    events["elapsed_time"] = np.nan if now is None else now
+    events["vehicle_id"] = self._vehicle_ids[rows[flipped_rows]]
+    events["ecu"] = self._ecu_names[dtcs]
+    events["dtc"] = self._dtc_names[dtcs]
+    events["active"] = active[flipped_rows, dtcs]
+
+    return events
+
+  def _update_row(self, failing, now, row):
+    """Debounces one evaluation of a single vehicle, in place.
+
+    As `update`, on views of the row's states and counters, which is several
+    times cheaper for the per-step evaluations of a single vehicle.
+    """
+    active = self._active[row]
+    counters = self._counters[row]
+
+    pending = failing != active
+    counters += 1
+    counters *= pending
+    flips = pending & (
+        counters >= np.where(active, self._dematuration, self._maturation))
+    if not flips.any():
+      return np.zeros(0, dtype=trace_file.DTC_EVENT_DTYPE)
+
+    counters[flips] = 0
+    active ^= flips
+
+    (dtcs,) = np.nonzero(flips)
+    events = np.zeros(len(dtcs), dtype=trace_file.DTC_EVENT_DTYPE)
+    events["elapsed_time"] = np.nan if now is None else now
+    events["vehicle_id"] = self._vehicle_ids[row]
+    events["ecu"] = self._ecu_names[dtcs]
+    events["dtc"] = self._dtc_names[dtcs]
+    events["active"] = active[dtcs]
+
+    return events
+
+  def update_dtcs(self, failing_dtcs, now=None, row=0):
+    """Debounces one evaluation of a vehicle, given its failing DTC names.
+
+    Args:
+      failing_dtcs: iterable of strings representing the failing DTCs, e.g.
+        injected ones. The DTCs of every ECU with that name fail.
+      now: optional float representing the evaluation time [s], for events.
+      row: int representing the vehicle row.
+    Returns:
+      `trace_file.DTC_EVENT_DTYPE` array of the DTCs set or cleared.
+    """
+    failing = np.zeros(len(self.dtcs), dtype=bool)
+    for dtc in failing_dtcs:
+      failing[self._dtc_indices.get(dtc, [])] = True
+
+    return self.update(failing, now, row)
+
+  def is_settled(self, row=0):
+    """Returns `False` while a vehicle has DTCs pending a state change."""
+    return not self._counters[row].any()
+
+  def get_active_dtcs(self, row=0):
+    """Returns the `DTCEntry`s of a vehicle's debounced active DTCs."""
+    return tuple(
+        entry for entry, active in zip(self.dtcs, self._active[row]) if active)
+
+  def get_status(self, ecu):
+    """Returns an ECU's status bitfields, one uint64 per vehicle.
+
+    Bit i is set if the i-th DTC of the ECU, in catalog order, is active.
+    """
+    columns = self._ecu_columns.get(ecu)
+    if columns is None:
+      raise DebounceError(f"{ecu} has no DTCs.")
+
+    return self._active[:, columns] @ self._ecu_bits[ecu]
+
+  def reset(self):
+    """Clears every DTC and counter, without emitting events."""
+    self._active[:] = False
+    self._counters[:] = 0
+
+  def get_state(self):
+    """Returns the debounced states and counters, as a dict of plain values."""
+    return {
+        "active": self._active.tolist(),
+        "counters": self._counters.tolist(),
+    }
+
+  def set_state(self, state):
+    """Restores a state returned by `get_state`."""
+    self._active[:] = state["active"]
+    self._counters[:] = state["counters"]
+
+
+if __name__ == "__main__":
+  """Quick functionality and event rate checks for this library."""
+  rng = np.random.default_rng(1)
+  num_steps = 10000
+
+  # A sustained fault, failing the check at random half of the time, as
+  # injected by `BMM.inject_fault`.
+  debouncer = DTCDebouncer()
+  num_raw_edges = 0
+  num_events = 0
+  previous = False
+  for step in range(num_steps):
+    failing = bool(rng.random() < 0.5)
+    num_raw_edges += failing != previous
+    previous = failing
+    events = debouncer.update_dtcs(["A001", "D001"] if failing else [], step)
+    num_events += len(events)
+    if step < 20 and len(events):
+      print(events)
+
+  print(f"Raw edges: {num_raw_edges}, debounced events: {num_events}.")
+  print(f"Active: {[entry.dtc for entry in debouncer.get_active_dtcs()]}, "
+        f"BMM status: {int(debouncer.get_status('bmm')[0]):#06x}")
+
+  # A fleet with sustained faults: each DTC sets once, when mature.
+  fleet = DTCDebouncer(range(10000))
+  failing = rng.random((10000, len(fleet.dtcs))) < 0.5
+  num_events = [len(fleet.update(failing, step)) for step in range(20)]
+  print(f"Fleet events per step: {num_events}, raw failing checks per step: "
+        f"{failing.sum()}, PMM status of vehicle 0: "
+        f"{int(fleet.get_status('pmm')[0]):#06x}")
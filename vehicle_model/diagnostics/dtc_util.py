@@ -1,14 +1,16 @@
-"""Utility for reading DTC information from YAML file definitions."""
+"""Utility for reading DTC information from YAML file definitions.
 
-import yaml
+The YAML path is resolved, and PyYAML imported, on first use rather than at
+import, keeping the import of this module cheap.
+"""
 
-from rules_python.python.runfiles import runfiles
+import functools
 
+from common import runfiles_util
 
-# Constants.
-r = runfiles.Create()
 
-DTCS_YAML_PATH = r.Rlocation(
+# Constants.
+DTCS_YAML_RUNFILE = (
     "automotive-diagnostics/vehicle_model/diagnostics/dtcs.yaml")
 _ECUS = ["bmm", "pmm", "tmm"]
 
@@ -17,13 +19,55 @@ class DTCReaderError(Exception):
   pass
 
 
-def load_yaml():
-  """Loads a yaml file into a dictionary."""
+def get_dtcs_yaml_path():
+  """Returns the path of the DTC definitions YAML file."""
+  return runfiles_util.rlocation(DTCS_YAML_RUNFILE)
+
+
+# `DTCS_YAML_PATH` is resolved lazily, on first access.
+__getattr__ = runfiles_util.lazy_runfile("DTCS_YAML_PATH", DTCS_YAML_RUNFILE)
+
+
+@functools.lru_cache(maxsize=None)
+def get_unique_key_loader():
+  """Returns a safe YAML loader class rejecting duplicate mapping keys.
+
+  PyYAML keeps the last of duplicate keys, so a DTC sharing its code with
+  another would otherwise silently replace it.
+  """
+  import yaml
+
+  class UniqueKeyLoader(yaml.SafeLoader):
+
+    def construct_mapping(self, node, deep=False):
+      keys = set()
+      for key_node, _ in node.value:
+        key = self.construct_object(key_node, deep=deep)
+        if key in keys:
+          mark = key_node.start_mark
+          raise DTCReaderError(
+              f"Duplicate key {key!r} in {mark.name}, line {mark.line + 1}.")
+        keys.add(key)
+
+      return super().construct_mapping(node, deep)
+
+  return UniqueKeyLoader
+
+
+def load_yaml(yaml_path=None):
+  """Loads a yaml file into a dictionary, the DTC definitions by default.
+
+  Raises:
+    DTCReaderError: if a mapping, e.g. an ECU's DTCs, has duplicate keys.
+  """
+  import yaml
+
+  yaml_path = yaml_path or get_dtcs_yaml_path()
   yaml_dict = {}
 
-  with open(DTCS_YAML_PATH, "r") as f:  
+  with open(yaml_path, "r") as f:  
     try:
-      yaml_dict = yaml.safe_load(f)
+      yaml_dict = yaml.load(f, Loader=get_unique_key_loader())
     except yaml.YAMLError as e:
       print(e)
 
@@ -48,7 +92,8 @@ def get_dtc_metadata(ecu, dtc, dtcs_dict):
     raise DTCReaderError(f"{ecu} should be one of: `{_ECUS}`.")
 
   if dtc not in dtcs_dict[ecu].keys():
-    raise DTCReaderError(f"{dtc} is not defined in: `{DTCS_YAML_PATH}`.")
+    raise DTCReaderError(
+        f"{dtc} is not defined in: `{get_dtcs_yaml_path()}`.")
 
   dtc_metadata = dtcs_dict[ecu][dtc]
   dtc_type = dtc_metadata["type"]
@@ -67,6 +112,24 @@ def get_dtc_metadata(ecu, dtc, dtcs_dict):
     )
 
 
+def get_ecu_frequency(ecu, dtcs_dict):
+  """Returns the rate [Hz] an ECU runs its diagnostics at.
+
+  This is the highest `frequency` among the ECU's DTCs, as its signals must be
+  checked at least that often for comms missing faults to be meaningful.
+  """
+  if ecu not in _ECUS:
+    raise DTCReaderError(f"{ecu} should be one of: `{_ECUS}`.")
+
+  frequencies = [
+      metadata["frequency"] for metadata in dtcs_dict[ecu].values()
+      if "frequency" in metadata]
+  if not frequencies:
+    raise DTCReaderError(f"{ecu} has no DTC with a `frequency`.")
+
+  return max(frequencies)
+
+
 if __name__ == "__main__":
   """Quick functionality tests for this library."""
   dtcs_dict = load_yaml()
@@ -81,3 +144,5 @@ if __name__ == "__main__":
   print(get_dtc_metadata("bmm", "D001", dtcs_dict))
   print(get_dtc_metadata("pmm", "A004", dtcs_dict))
   print(get_dtc_metadata("pmm", "B004", dtcs_dict))
+
+  print(get_ecu_frequency("bmm", dtcs_dict))
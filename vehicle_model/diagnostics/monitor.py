@@ -0,0 +1,193 @@
+"""Vectorized rationality monitor compiled from the DTC definitions.
+
+Every rationality DTC of `dtcs.yaml` is compiled into one check per monitored
+signal: a sim output column, aligned with `sim_output.SIGNALS`, and its lower
+and upper limits, held in arrays. A step's checks are then a single vectorized
+comparison of the gathered columns against the limits, for one vehicle's sim
+output record or a whole fleet's (num_vehicles, `sim_output.NUM_SIGNALS`)
+matrix, folded into a bitmask with one bit per DTC, in catalog order. DTCs
+monitoring several signals fail if any of them is out of limits. NaN values are
+left to the open circuit DTCs, and never fail a rationality check.
+
+Adding a rationality DTC to `dtcs.yaml` adds a column to the arrays, and no
+code.
+"""
+
+import functools
+
+import numpy as np
+
+from vehicle_model import sim_output
+from vehicle_model.diagnostics import catalog as diagnostics_catalog
+
+
+# Constants.
+MAX_DTCS = 64  # [], DTCs that fit in a bitmask.
+
+
+class MonitorError(Exception):
+  pass
+
+
+class RationalityMonitor:
+  """Rationality DTC checks, compiled into limit arrays.
+
+  The monitor holds no per-vehicle state: the active DTC bitmasks are passed in
+  and returned, so one monitor serves every vehicle and fleet in a process.
+  """
+
+  def __init__(self, dtc_entries):
+    """Initializes a RationalityMonitor.
+
+    Args:
+      dtc_entries: iterable of `catalog.DTCEntry`s. Those of other types than
+        rationality are ignored.
+    """
+    self.dtcs = tuple(
+        entry for entry in dtc_entries if entry.type == "rationality")
+    if len(self.dtcs) > MAX_DTCS:
+      raise MonitorError(f"At most {MAX_DTCS} rationality DTCs are supported.")
+
+    signals, bits, lower_limits, upper_limits = [], [], [], []
+    for bit, entry in enumerate(self.dtcs):
+      for signal in entry.signals:
+        if signal not in sim_output.SIGNAL_INDEX:
+          raise MonitorError(
+              f"{entry.ecu} DTC {entry.dtc} monitors unknown signal {signal}.")
+        signals.append(signal)
+        bits.append(1 << bit)
+        lower_limits.append(entry.lower_limit)
+        upper_limits.append(entry.upper_limit)
+
+    # One entry per check, i.e. per monitored signal of each DTC.
+    self.signals = tuple(signals)
+    self._columns = np.array(
+        [sim_output.SIGNAL_INDEX[signal] for signal in signals], dtype=np.intp)
+    self._bits = np.array(bits, dtype=np.uint64)
+    self._lower_limits = np.array(lower_limits, dtype=np.float64)
+    self._upper_limits = np.array(upper_limits, dtype=np.float64)
+    # With one check per DTC, summing the bits of failing checks ORs them.
+    self._one_check_per_dtc = len(set(bits)) == len(bits)
+
+    self._ecu_masks = {}
+    for bit, entry in enumerate(self.dtcs):
+      self._ecu_masks[entry.ecu] = self._ecu_masks.get(entry.ecu, 0) | 1 << bit
+
+  def get_num_dtcs(self):
+    """Returns the number of rationality DTCs, i.e. of bitmask bits used."""
+    return len(self.dtcs)
+
+  def get_ecu_mask(self, ecu):
+    """Returns the bitmask of an ECU's rationality DTCs."""
+    return self._ecu_masks.get(ecu, 0)
+
+  def evaluate(self, outputs):
+    """Evaluates every rationality check on sim outputs.
+
+    Args:
+      outputs: sim output record(s), a `sim_output.NUM_SIGNALS` array for one
+        vehicle or a (num_vehicles, `sim_output.NUM_SIGNALS`) matrix.
+    Returns:
+      Bitmask of the failing DTCs: an int for one vehicle, or a uint64 array
+      with one bitmask per vehicle.
+    """
+    values = np.asarray(outputs)[..., self._columns]
+    failing = (values < self._lower_limits) | (values > self._upper_limits)
+    if self._one_check_per_dtc:
+      masks = failing @ self._bits
+    else:
+      masks = np.bitwise_or.reduce(
+          np.where(failing, self._bits, np.uint64(0)), axis=-1)
+
+    return int(masks) if masks.ndim == 0 else masks
+
+  def evaluate_signals(self, signals):
+    """Evaluates the checks of the signals present in a dict, e.g. an ECU's.
+
+    Args:
+      signals: mapping of signal names, as named in `dtcs.yaml`, to values.
+        Checks of missing signals pass.
+    Returns:
+      int bitmask of the failing DTCs.
+    """
+    values = np.array([signals.get(signal, np.nan) for signal in self.signals])
+    failing = (values < self._lower_limits) | (values > self._upper_limits)
+
+    return int(np.bitwise_or.reduce(self._bits[failing]))
+
+  def update(self, outputs, previous_masks=0):
+    """Evaluates sim outputs, and compares them with the previous bitmasks.
+
+    Args:
+      outputs: sim output record(s), as for `evaluate`.
+      previous_masks: bitmask(s) of the DTCs active at the previous step, as
+        returned by `evaluate`.
+    Returns:
+      active_masks: bitmask(s) of the DTCs active now.
+      set_masks: bitmask(s) of the DTCs set since the previous step.
+      cleared_masks: bitmask(s) of the DTCs cleared since the previous step.
+    """
+    active_masks = self.evaluate(outputs)
+    if isinstance(active_masks, np.ndarray):
+      previous_masks = np.asarray(previous_masks, dtype=np.uint64)
+
+    return (
+        active_masks, active_masks & ~previous_masks,
+        previous_masks & ~active_masks)
+
+  def get_dtcs(self, mask, ecu=None):
+    """Returns the `DTCEntry`s set in a bitmask, of an ECU or of all if `None`.
+
+    Args:
+      mask: int bitmask, e.g. a single vehicle's.
+      ecu: optional string representing the ECU to filter on.
+    """
+    mask = int(mask)
+    return tuple(
+        entry for bit, entry in enumerate(self.dtcs)
+        if mask >> bit & 1 and ecu in (None, entry.ecu))
+
+
+@functools.lru_cache(maxsize=None)
+def get_rationality_monitor(catalog=None):
+  """Returns the monitor of a diagnostics catalog, the shared one by default."""
+  catalog = catalog or diagnostics_catalog.get_catalog()
+  return RationalityMonitor(catalog.dtc_table)
+
+
+if __name__ == "__main__":
+  """Quick functionality and overhead checks for this library."""
+  import timeit
+
+  monitor = get_rationality_monitor()
+  print(f"{monitor.get_num_dtcs()} rationality DTCs: {monitor.signals}")
+
+  outputs = np.zeros(sim_output.NUM_SIGNALS)
+  for signal, value in (
+      ("v_bus", 400.0), ("i_bus", 200.0), ("batt_soc", 99.0), ("v_d", 350.0),
+      ("v_q", 350.0), ("i_d", 100.0), ("iq_cmd", 100.0), ("torque_mech", 10.0),
+      ("omega_mech", 100.0), ("T_junc_batt", 25.0), ("T_junc_inverter", 25.0),
+      ("T_junc_motor", 25.0), ("T_fluid", 25.0)):
+    outputs[sim_output.SIGNAL_INDEX[signal]] = value
+
+  active_mask, set_mask, cleared_mask = monitor.update(outputs)
+  print(f"Nominal: {active_mask:#x}")
+  outputs[sim_output.SIGNAL_INDEX["v_bus"]] = 500.0
+  outputs[sim_output.SIGNAL_INDEX["iq_cmd"]] = float("nan")
+  active_mask, set_mask, cleared_mask = monitor.update(outputs, active_mask)
+  print(f"Faulty: set {[entry.dtc for entry in monitor.get_dtcs(set_mask)]}")
+  outputs[sim_output.SIGNAL_INDEX["v_bus"]] = 400.0
+  active_mask, set_mask, cleared_mask = monitor.update(outputs, active_mask)
+  print(f"Recovered: cleared "
+        f"{[entry.dtc for entry in monitor.get_dtcs(cleared_mask)]}")
+  pmm_mask = monitor.evaluate_signals({"v_q": 0.0, "i_q": 300.0})
+  print(f"PMM signals: {[entry.dtc for entry in monitor.get_dtcs(pmm_mask)]}")
+
+  num_runs = 10000
+  fleet_outputs = np.tile(outputs, (10000, 1))
+  single_time = timeit.timeit(
+      lambda: monitor.update(outputs), number=num_runs) / num_runs
+  fleet_time = timeit.timeit(
+      lambda: monitor.update(fleet_outputs), number=100) / 100
+  print(f"Single vehicle: {single_time * 1e6:.2f} us/step, fleet of "
+        f"{len(fleet_outputs)}: {fleet_time * 1e3:.2f} ms/step.")
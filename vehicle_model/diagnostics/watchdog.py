@@ -0,0 +1,359 @@
+"""Comms missing watchdog, driven by the DTC signal frequencies.
+
+Every comms missing DTC of `dtcs.yaml` is compiled into one check per monitored
+signal, with a timeout of `TIMEOUT_PERIODS` periods of the DTC's `frequency`.
+The watchdog keeps the time each check's signal was last seen, per vehicle, in
+a (num_vehicles, num_checks) array, so recording arrivals is a vectorized
+assignment, e.g. of a whole fleet's sim outputs per step.
+
+Deadlines live in a hashed timer wheel: buckets of `tick` seconds, each holding
+arrays of (vehicle, check) entries, with a heap of the occupied buckets. A
+bucket is only visited once due, when its entries are re-checked at once
+against their last seen times: those seen since are rescheduled to their new
+deadline, and the rest expire. Healthy signals are re-checked once per timeout
+rather than per arrival or step, and expired ones leave the wheel until they
+are seen again, so the cost follows the deadlines falling due rather than
+signals x vehicles. Times are whatever clock the caller runs on: simulated
+time, or `time.monotonic` in real-time runs, the default.
+
+DTC set/clear edges are returned as `trace_file.DTC_EVENT_DTYPE` arrays, as for
+replayed traces, and the active DTCs are kept as one bitmask per vehicle, with
+one bit per comms missing DTC in catalog order.
+"""
+
+import heapq
+import math
+import time
+
+import numpy as np
+
+from telemetry import trace_file
+from vehicle_model import sim_output
+from vehicle_model.diagnostics import catalog as diagnostics_catalog
+
+
+# Constants.
+TIMEOUT_PERIODS = 3  # [], missed periods before a signal is missing.
+WHEEL_TICK = 0.01  # [s], resolution of the deadlines.
+MAX_DTCS = 64  # [], DTCs that fit in a bitmask.
+_TIME_TOLERANCE = 1e-9  # [], of deadlines, in ticks.
+
+
+class WatchdogError(Exception):
+  pass
+
+
+class CommsWatchdog:
+  """Comms missing DTCs of many vehicles, raised and cleared from deadlines."""
+
+  def __init__(
+      self, vehicle_ids, now=None, dtc_entries=None,
+      timeout_periods=TIMEOUT_PERIODS, tick=WHEEL_TICK):
+    """Initializes a CommsWatchdog.
+
+    Args:
+      vehicle_ids: iterable of ints representing the watched vehicles, in the
+        order of the rows of the sim outputs passed to `observe`.
+      now: optional float representing the start time [s], from which every
+        signal is given one timeout to arrive. Defaults to `time.monotonic()`.
+      dtc_entries: optional iterable of `catalog.DTCEntry`s. Those of other
+        types than comms missing are ignored. Defaults to the shared catalog.
+      timeout_periods: float representing the missed periods before a signal
+        is missing.
+      tick: float representing the timer wheel resolution [s].
+    """
+    if dtc_entries is None:
+      dtc_entries = diagnostics_catalog.get_catalog().dtc_table
+    self.dtcs = tuple(
+        entry for entry in dtc_entries if entry.type == "comms_missing")
+    if len(self.dtcs) > MAX_DTCS:
+      raise WatchdogError(f"At most {MAX_DTCS} comms missing DTCs supported.")
+
+    signals, check_dtcs, timeouts = [], [], []
+    for index, entry in enumerate(self.dtcs):
+      if not entry.frequency:
+        raise WatchdogError(f"{entry.ecu} DTC {entry.dtc} has no frequency.")
+      for signal in entry.signals:
+        if signal not in sim_output.SIGNAL_INDEX:
+          raise WatchdogError(
+              f"{entry.ecu} DTC {entry.dtc} monitors unknown signal {signal}.")
+        signals.append(signal)
+        check_dtcs.append(index)
+        timeouts.append(timeout_periods / entry.frequency)
+
+    # One entry per check, i.e. per monitored signal of each DTC.
+    self.signals = tuple(signals)
+    self._columns = np.array(
+        [sim_output.SIGNAL_INDEX[signal] for signal in signals], dtype=np.intp)
+    self._check_dtcs = np.array(check_dtcs, dtype=np.intp)
+    self._timeouts = np.array(timeouts, dtype=np.float64)
+    self._signal_checks = {
+        signal: np.flatnonzero([name == signal for name in signals])
+        for signal in set(signals)}
+
+    # One entry per DTC.
+    self._bits = np.array(
+        [1 << index for index in range(len(self.dtcs))], dtype=np.uint64)
+    self._ecu_names = np.array([entry.ecu for entry in self.dtcs], dtype="S3")
+    self._dtc_names = np.array([entry.dtc for entry in self.dtcs], dtype="S4")
+
+    # Per vehicle state.
+    self._vehicle_ids = np.array(list(vehicle_ids), dtype=np.int64)
+    self._rows = {
+        vehicle_id: row
+        for row, vehicle_id in enumerate(self._vehicle_ids.tolist())}
+    num_vehicles, num_checks = len(self._vehicle_ids), len(self.signals)
+    now = time.monotonic() if now is None else now
+    self._last_seen = np.full((num_vehicles, num_checks), now)
+    self._expired = np.zeros((num_vehicles, num_checks), dtype=bool)
+    self._num_expired = 0
+    self._missing_counts = np.zeros(
+        (num_vehicles, len(self.dtcs)), dtype=np.int64)
+    self._masks = np.zeros(num_vehicles, dtype=np.uint64)
+
+    # Timer wheel: bucket index to list of arrays of flat (row, check) indices.
+    self._tick = tick
+    self._buckets = {}
+    self._bucket_heap = []
+    entries = np.arange(num_vehicles * num_checks)
+    self._schedule(entries, now + np.tile(self._timeouts, num_vehicles))
+
+  def get_vehicle_ids(self):
+    """Returns the array of watched vehicle IDs, in row order."""
+    return self._vehicle_ids
+
+  def get_masks(self):
+    """Returns the bitmasks of the active comms missing DTCs, per vehicle."""
+    return self._masks
+
+  def get_dtcs(self, vehicle_id):
+    """Returns the `DTCEntry`s of a vehicle's active comms missing DTCs."""
+    mask = int(self._masks[self._rows[vehicle_id]])
+    return tuple(
+        entry for index, entry in enumerate(self.dtcs) if mask >> index & 1)
+
+  def get_num_scheduled(self):
+    """Returns the number of (vehicle, check) deadlines in the timer wheel."""
+    return sum(
+        len(entries) for bucket in self._buckets.values()
+        for entries in bucket)
+
+  def _schedule(self, entries, deadlines):
+    """Adds flat (row, check) entries to the buckets of their deadlines."""
+    if not len(entries):
+      return
+
+    buckets = np.ceil(deadlines / self._tick - _TIME_TOLERANCE).astype(np.int64)
+    if buckets.min() == buckets.max():
+      # Signals seen at the same time, e.g. a fleet's, share a bucket.
+      groups = [(int(buckets[0]), entries)]
+    else:
+      order = np.argsort(buckets, kind="stable")
+      buckets, entries = buckets[order], entries[order]
+      unique_buckets, starts = np.unique(buckets, return_index=True)
+      groups = zip(unique_buckets.tolist(), np.split(entries, starts[1:]))
+
+    for bucket, bucket_entries in groups:
+      if bucket not in self._buckets:
+        self._buckets[bucket] = []
+        heapq.heappush(self._bucket_heap, bucket)
+      self._buckets[bucket].append(bucket_entries)
+
+  def observe(self, outputs, now=None, rows=None):
+    """Records the arrival of the signals present in sim outputs.
+
+    Args:
+      outputs: sim output record(s), a `sim_output.NUM_SIGNALS` array or a
+        (num_rows, `sim_output.NUM_SIGNALS`) matrix. NaN signals are missing.
+      now: optional float representing the arrival time [s]. Defaults to
+        `time.monotonic()`.
+      rows: optional int or array of the vehicle rows of the outputs. Defaults
+        to every vehicle, in order.
+    Returns:
+      `trace_file.DTC_EVENT_DTYPE` array of the DTCs cleared by the arrivals.
+    """
+    now = time.monotonic() if now is None else now
+    values = np.atleast_2d(outputs)[:, self._columns]
+    received = ~np.isnan(values)
+
+    if rows is None:
+      np.copyto(self._last_seen, now, where=received)
+      expired = self._expired
+    else:
+      rows = np.atleast_1d(rows)
+      self._last_seen[rows] = np.where(received, now, self._last_seen[rows])
+      expired = self._expired[rows]
+
+    if not self._num_expired:
+      return np.zeros(0, dtype=trace_file.DTC_EVENT_DTYPE)
+
+    recovered_rows, recovered_checks = np.nonzero(expired & received)
+    if rows is not None:
+      recovered_rows = rows[recovered_rows]
+    return self._recover(recovered_rows, recovered_checks, now)
+
+  def observe_signal(self, vehicle_id, signal, now=None):
+    """Records the arrival of one signal of one vehicle, e.g. a bus message.
+
+    Args:
+      vehicle_id: int representing the sending vehicle.
+      signal: string representing the signal, as named in `dtcs.yaml`.
+      now: optional float representing the arrival time [s]. Defaults to
+        `time.monotonic()`.
+    Returns:
+      `trace_file.DTC_EVENT_DTYPE` array of the DTCs cleared by the arrival.
+    """
+    now = time.monotonic() if now is None else now
+    row = self._rows[vehicle_id]
+    checks = self._signal_checks.get(signal)
+    if checks is None:
+      return np.zeros(0, dtype=trace_file.DTC_EVENT_DTYPE)
+
+    self._last_seen[row, checks] = now
+    checks = checks[self._expired[row, checks]]
+    return self._recover(np.full(len(checks), row), checks, now)
+
+  def _recover(self, rows, checks, now):
+    """Returns to the wheel expired checks seen again, clearing their DTCs."""
+    if not len(rows):
+      return np.zeros(0, dtype=trace_file.DTC_EVENT_DTYPE)
+
+    self._expired[rows, checks] = False
+    self._num_expired -= len(rows)
+    self._schedule(
+        rows * len(self.signals) + checks, now + self._timeouts[checks])
+
+    dtcs = self._check_dtcs[checks]
+    np.subtract.at(self._missing_counts, (rows, dtcs), 1)
+    rows, dtcs = _unique_pairs(rows, dtcs)
+    cleared = self._missing_counts[rows, dtcs] == 0
+    rows, dtcs = rows[cleared], dtcs[cleared]
+    np.bitwise_and.at(self._masks, rows, ~self._bits[dtcs])
+
+    return self._events(rows, dtcs, np.full(len(rows), now), active=False)
+
+  def advance(self, now=None):
+    """Expires the checks whose signals were not seen by their deadline.
+
+    Args:
+      now: optional float representing the current time [s]. Defaults to
+        `time.monotonic()`.
+    Returns:
+      `trace_file.DTC_EVENT_DTYPE` array of the DTCs set, at their deadlines.
+    """
+    now = time.monotonic() if now is None else now
+    now_bucket = math.floor(now / self._tick + _TIME_TOLERANCE)
+
+    due = []
+    while self._bucket_heap and self._bucket_heap[0] <= now_bucket:
+      due.extend(self._buckets.pop(heapq.heappop(self._bucket_heap)))
+    if not due:
+      return np.zeros(0, dtype=trace_file.DTC_EVENT_DTYPE)
+
+    entries = np.concatenate(due)
+    rows, checks = np.divmod(entries, len(self.signals))
+    deadlines = self._last_seen[rows, checks] + self._timeouts[checks]
+    expired = deadlines <= now
+    self._schedule(entries[~expired], deadlines[~expired])
+
+    rows, checks, deadlines = rows[expired], checks[expired], deadlines[expired]
+    self._expired[rows, checks] = True
+    self._num_expired += len(rows)
+    dtcs = self._check_dtcs[checks]
+    was_active = self._missing_counts[rows, dtcs] > 0
+    np.add.at(self._missing_counts, (rows, dtcs), 1)
+
+    # The first check of a DTC to expire sets it.
+    order = np.argsort(deadlines, kind="stable")
+    rows, dtcs, deadlines, was_active = (
+        rows[order], dtcs[order], deadlines[order], was_active[order])
+    first = _unique_pairs(rows, dtcs, return_index=True)
+    first = first[~was_active[first]]
+    rows, dtcs, deadlines = rows[first], dtcs[first], deadlines[first]
+    np.bitwise_or.at(self._masks, rows, self._bits[dtcs])
+
+    return self._events(rows, dtcs, deadlines, active=True)
+
+  def get_state(self):
+    """Returns the last seen times and active DTCs, as a dict of plain values.
+
+    The timer wheel is not part of the state: it is rebuilt from the last seen
+    times by `set_state`.
+    """
+    return {
+        "last_seen": self._last_seen.tolist(),
+        "expired": self._expired.tolist(),
+        "missing_counts": self._missing_counts.tolist(),
+        "masks": self._masks.tolist(),
+    }
+
+  def set_state(self, state):
+    """Restores a state returned by `get_state`, of the same vehicles."""
+    self._last_seen[:] = state["last_seen"]
+    self._expired[:] = state["expired"]
+    self._num_expired = int(self._expired.sum())
+    self._missing_counts[:] = state["missing_counts"]
+    self._masks[:] = state["masks"]
+
+    self._buckets = {}
+    self._bucket_heap = []
+    entries = np.flatnonzero(~self._expired)
+    rows, checks = np.divmod(entries, len(self.signals))
+    self._schedule(
+        entries, self._last_seen[rows, checks] + self._timeouts[checks])
+
+  def _events(self, rows, dtcs, times, active):
+    """Returns DTC events of given rows and DTC indices, in time order."""
+    events = np.zeros(len(rows), dtype=trace_file.DTC_EVENT_DTYPE)
+    events["elapsed_time"] = times
+    events["vehicle_id"] = self._vehicle_ids[rows]
+    events["ecu"] = self._ecu_names[dtcs]
+    events["dtc"] = self._dtc_names[dtcs]
+    events["active"] = active
+
+    return np.sort(events, order=("elapsed_time", "vehicle_id"))
+
+
+def _unique_pairs(rows, dtcs, return_index=False):
+  """Returns the distinct (row, DTC) pairs, or the index of their first."""
+  keys = rows * MAX_DTCS + dtcs
+  _, index = np.unique(keys, return_index=True)
+  if return_index:
+    return index
+
+  return rows[index], dtcs[index]
+
+
+if __name__ == "__main__":
+  """Quick functionality and throughput checks for this library."""
+  num_vehicles = 10000
+  dt = 0.01  # [s].
+
+  watchdog = CommsWatchdog(range(1, num_vehicles + 1), now=0.0)
+  outputs = np.ones((num_vehicles, sim_output.NUM_SIGNALS))
+  print(f"{len(watchdog.dtcs)} comms missing DTCs, "
+        f"{watchdog.get_num_scheduled()} deadlines.")
+
+  # Vehicle 1 loses `v_bus` and every 100th vehicle all signals, from 1 s
+  # to 2 s.
+  dropout = outputs.copy()
+  dropout[0, sim_output.SIGNAL_INDEX["v_bus"]] = np.nan
+  dropout[99::100] = np.nan
+
+  events = []
+  start_time = time.perf_counter()
+  for step in range(1, 301):
+    now = step * dt
+    events.append(watchdog.observe(dropout if 1.0 <= now < 2.0 else outputs,
+                                   now))
+    events.append(watchdog.advance(now))
+    if step == 150:
+      print(f"At {now:.2f} s: vehicle 1 "
+            f"{[entry.dtc for entry in watchdog.get_dtcs(1)]}, vehicle 100 "
+            f"{len(watchdog.get_dtcs(100))} DTCs.")
+  wall_time = time.perf_counter() - start_time
+
+  events = np.concatenate(events)
+  print(f"Events: {len(events)}, set: {events['active'].sum()}, "
+        f"first: {events[0]}, active after: {watchdog.get_masks().any()}.")
+  print(f"{num_vehicles} vehicles: {wall_time / 300 * 1e3:.2f} ms/step.")
@@ -0,0 +1,277 @@
+"""Drive cycles feeding time-varying inputs to vehicle simulations.
+
+Drive cycle profiles (`time` [s] plus the `INPUT_SIGNALS` columns) are
+converted once, in streamed chunks, from CSV or `.npy` files into cycle files:
+trace files (see `telemetry.trace_file`) resampled onto a uniform time grid.
+Looking up the inputs at any time is then a direct index plus a linear
+interpolation between two neighbouring samples, whatever the profile length.
+
+Cycle files are memory-mapped read-only, so every process simulating vehicles
+on the same cycle shares one copy of it in the OS page cache. `DriveCycle`s
+pickle as their path, and are re-mapped once per worker rather than copied.
+"""
+
+import csv
+import functools
+import math
+import os
+
+import numpy as np
+
+from telemetry import trace_file
+
+
+# Constants.
+INPUT_SIGNALS = ("i_bus_cmd", "omega_mech", "fluid_velocity")
+DEFAULT_PERIOD = 0.01  # [s], resampling period of cycle files.
+CHUNK_SIZE = 65536  # [], profile rows read, or cycle samples cached, at once.
+_TIME_TOLERANCE = 1e-9  # [s].
+
+
+class DriveCycleError(Exception):
+  pass
+
+
+def _read_csv_chunks(csv_path, chunk_size):
+  """Yields (rows, 1 + len(INPUT_SIGNALS)) arrays of a CSV profile."""
+  with open(csv_path, newline="") as f:
+    reader = csv.reader(f)
+    header = [name.strip() for name in next(reader)]
+    try:
+      columns = [header.index(name) for name in ("time",) + INPUT_SIGNALS]
+    except ValueError as e:
+      raise DriveCycleError(f"{csv_path} is missing a column: {e}.") from e
+
+    rows = []
+    for line in reader:
+      if not line:
+        continue
+      rows.append([float(line[column]) for column in columns])
+      if len(rows) == chunk_size:
+        yield np.array(rows)
+        rows = []
+
+    if rows:
+      yield np.array(rows)
+
+
+def _read_npy_chunks(npy_path, chunk_size):
+  """Yields (rows, 1 + len(INPUT_SIGNALS)) arrays of a `.npy` profile."""
+  profile = np.load(npy_path, mmap_mode="r")
+  if profile.ndim != 2 or profile.shape[1] != 1 + len(INPUT_SIGNALS):
+    raise DriveCycleError(
+        f"{npy_path} should have columns: time, {', '.join(INPUT_SIGNALS)}.")
+
+  for start in range(0, len(profile), chunk_size):
+    yield np.asarray(profile[start:start + chunk_size], dtype=np.float64)
+
+
+def convert_profile(
+    profile_path, cycle_path, period=DEFAULT_PERIOD, chunk_size=CHUNK_SIZE):
+  """Converts a drive cycle profile into a cycle file.
+
+  Args:
+    profile_path: string representing path of a `.csv` profile with a header
+      naming `time` [s] and the `INPUT_SIGNALS` columns, or of a `.npy` profile
+      with those columns in that order. Times must be increasing.
+    cycle_path: string representing path of the cycle file to create.
+    period: float representing the resampling period [s].
+    chunk_size: int representing profile rows read and resampled at once.
+  """
+  if profile_path.endswith(".csv"):
+    read_chunks = functools.partial(_read_csv_chunks, profile_path, chunk_size)
+  elif profile_path.endswith(".npy"):
+    read_chunks = functools.partial(_read_npy_chunks, profile_path, chunk_size)
+  else:
+    raise DriveCycleError(f"{profile_path} should be a .csv or .npy file.")
+
+  # First pass for the time span, to size the cycle file.
+  start_time = end_time = None
+  for chunk in read_chunks():
+    if start_time is None:
+      start_time = chunk[0, 0]
+    end_time = chunk[-1, 0]
+  if start_time is None or end_time - start_time < period:
+    raise DriveCycleError(f"{profile_path} should span at least one period.")
+
+  num_samples = int((end_time - start_time) / period + _TIME_TOLERANCE) + 1
+
+  with trace_file.TraceWriter(
+      cycle_path, num_samples, vehicle_ids=(0,),
+      signals=("elapsed_time",) + INPUT_SIGNALS,
+      parameters={
+          "period": period, "source": os.path.basename(profile_path)},
+      chunk_size=1) as writer:
+    next_sample = 0
+    previous = np.empty((0, 1 + len(INPUT_SIGNALS)))
+
+    for chunk in read_chunks():
+      points = np.concatenate((previous, chunk))
+      if np.any(np.diff(points[:, 0]) <= 0):
+        raise DriveCycleError(f"{profile_path} times should be increasing.")
+
+      stop_sample = min(
+          int((chunk[-1, 0] - start_time) / period + _TIME_TOLERANCE) + 1,
+          num_samples)
+      times = start_time + np.arange(next_sample, stop_sample) * period
+      samples = np.empty((len(times), 1 + len(INPUT_SIGNALS)))
+      samples[:, 0] = times - start_time
+      for column in range(1, samples.shape[1]):
+        samples[:, column] = np.interp(times, points[:, 0], points[:, column])
+
+      writer.record_rows(samples)
+      next_sample = stop_sample
+      previous = chunk[-1:]
+
+
+class DriveCycle:
+  """Read-only, memory-mapped drive cycle.
+
+  Times are relative to the start of the cycle; before it and past its end the
+  first and last samples are held.
+  """
+
+  def __init__(self, cycle_path, chunk_size=CHUNK_SIZE):
+    """Initializes a DriveCycle.
+
+    Args:
+      cycle_path: string representing path of a cycle file.
+      chunk_size: int representing samples cached for scalar lookups.
+    """
+    self._cycle_path = cycle_path
+    self._chunk_size = chunk_size
+
+    reader = trace_file.TraceReader(cycle_path)
+    if "period" not in reader.parameters:
+      raise DriveCycleError(f"{cycle_path} is not a drive cycle file.")
+
+    self._period = reader.parameters["period"]
+    self._num_samples = reader.num_samples
+    # Views of the mapped column of each input signal.
+    self._columns = [reader.column(signal)[:, 0] for signal in INPUT_SIGNALS]
+
+    # Cached chunk of samples, as lists, for fast scalar lookups.
+    self._chunk_start = 0
+    self._chunk_stop = 0
+    self._chunk = None
+    # Indices of the samples followed by a change of input, found on first use.
+    self._changes = None
+
+  def __reduce__(self):
+    return (get_drive_cycle, (self._cycle_path,))
+
+  def get_path(self):
+    """Returns the path of the cycle file."""
+    return self._cycle_path
+
+  def get_period(self):
+    """Returns the sampling period [s] of the cycle."""
+    return self._period
+
+  def get_duration(self):
+    """Returns the duration [s] of the cycle."""
+    return (self._num_samples - 1) * self._period
+
+  def _load_chunk(self, index):
+    """Caches the samples from `index` on, with one sample of overlap."""
+    self._chunk_start = index
+    self._chunk_stop = min(index + self._chunk_size, self._num_samples - 1)
+    self._chunk = [
+        column[index:self._chunk_stop + 1].tolist() for column in self._columns]
+
+  def values(self, cycle_time):
+    """Returns the inputs at a time [s] of the cycle.
+
+    Returns:
+      Tuple of floats, one per `INPUT_SIGNALS`.
+    """
+    position = min(max(cycle_time / self._period, 0.0), self._num_samples - 1)
+    index = min(int(position), self._num_samples - 2)
+    fraction = position - index
+
+    if not self._chunk_start <= index < self._chunk_stop:
+      self._load_chunk(index)
+
+    offset = index - self._chunk_start
+    return tuple(
+        chunk[offset] + fraction * (chunk[offset + 1] - chunk[offset])
+        for chunk in self._chunk)
+
+  def _get_changes(self):
+    """Returns the indices of the samples after which some input changes."""
+    if self._changes is None:
+      changes = []
+      for start in range(0, self._num_samples - 1, self._chunk_size):
+        stop = min(start + self._chunk_size, self._num_samples - 1)
+        changed = np.zeros(stop - start, dtype=bool)
+        for column in self._columns:
+          samples = column[start:stop + 1]
+          changed |= samples[1:] != samples[:-1]
+        changes.append(start + np.flatnonzero(changed))
+      self._changes = np.concatenate(changes)
+
+    return self._changes
+
+  def get_constant_until(self, cycle_time):
+    """Returns the time [s] of the cycle up to which the inputs stay constant.
+
+    Args:
+      cycle_time: float representing the time [s] of the cycle to start from.
+    Returns:
+      float, `cycle_time` itself if the inputs change right after it, or
+      `math.inf` if they never change again.
+    """
+    changes = self._get_changes()
+    index = int(max(cycle_time / self._period, 0.0))
+    next_change = np.searchsorted(changes, index)
+    if next_change == len(changes):
+      return math.inf
+
+    return max(float(changes[next_change]) * self._period, cycle_time)
+
+  def values_at(self, cycle_times):
+    """Returns the inputs at an array of times [s] of the cycle.
+
+    Returns:
+      Array of shape (len(INPUT_SIGNALS),) + cycle_times.shape.
+    """
+    positions = np.clip(
+        np.asarray(cycle_times) / self._period, 0, self._num_samples - 1)
+    indices = np.minimum(positions.astype(np.intp), self._num_samples - 2)
+    fractions = positions - indices
+
+    return np.stack([
+        column[indices] + fractions * (column[indices + 1] - column[indices])
+        for column in self._columns])
+
+
+@functools.lru_cache(maxsize=None)
+def get_drive_cycle(cycle_path):
+  """Returns the drive cycle of a cycle file, opened once per process."""
+  return DriveCycle(cycle_path)
+
+
+if __name__ == "__main__":
+  """Quick functionality tests for this library."""
+  import pickle
+  import tempfile
+
+  temp_dir = tempfile.mkdtemp()
+  profile_path = os.path.join(temp_dir, "cycle.csv")
+  cycle_path = os.path.join(temp_dir, "cycle.trace")
+
+  with open(profile_path, "w") as f:
+    f.write("time,i_bus_cmd,omega_mech,fluid_velocity\n")
+    for t in range(0, 601, 3):
+      f.write(f"{t},{100 + t % 150},{50 + t / 10},2.0\n")
+
+  convert_profile(profile_path, cycle_path, chunk_size=7)
+  cycle = get_drive_cycle(cycle_path)
+  print(cycle.get_duration(), cycle.values(0.0), cycle.values(4.5))
+  print(cycle.values(1e6), cycle.values_at(np.array([[0.0, 4.5], [1e6, -1]])))
+
+  times = np.linspace(0, 600, 1001)
+  print(np.allclose(
+      [cycle.values(t) for t in times], cycle.values_at(times).T))
+  print(pickle.loads(pickle.dumps(cycle)).values(4.5))
+  print(cycle.get_constant_until(4.5), cycle.get_constant_until(1e6))
@@ -1,13 +1,49 @@
 """Generic model for an Electronic Control Unit (ECU)."""
 
-from pubsub import pub
+import functools
 
+import numpy as np
+
+from common import model_math
 from digital_twin_model import fault_injection
+from telemetry import event_log
+from vehicle_model import sim_output
+from vehicle_model.diagnostics import catalog as diagnostics_catalog
+from vehicle_model.diagnostics import debounce
+from vehicle_model.ecu import signal_bus
+
+
+@functools.lru_cache(maxsize=None)
+def get_diagnostic_dtcs():
+  """Returns the `DTCEntry`s debounced by ECUs, i.e. the circuit ones.
+
+  Rationality DTCs are debounced by the owning vehicle, on its sim outputs, and
+  comms missing ones raised by its `watchdog.CommsWatchdog`, so that every DTC
+  has a single owner.
+  """
+  return tuple(
+      entry for entry in diagnostics_catalog.get_catalog().dtc_table
+      if entry.type not in ("rationality", "comms_missing"))
 
 
 class ECU:
 
-  def __init__(self):
+  # Sender output signals the ECU reads from the messages of its subscribed
+  # topics, into its `input_dict`.
+  RECEIVED_SIGNALS = ()
+
+  def __init__(self, rng=None, bus=None):
+    """Initializes an ECU.
+
+    Args:
+      rng: optional `numpy.random.Generator` driving fault injection decisions.
+      bus: optional `signal_bus.SignalBus` carrying the messages of the ECU's
+        vehicle. Defaults to the process-wide bus.
+    """
+    self._bus = bus or signal_bus.get_default_bus()
+    self._topics = {}  # Topics sent to, resolved once per name.
+    self._event_log = None  # The process-wide log if `None`.
+    self.vehicle_id = 0  # Set by the owning vehicle, for DTC events.
     self.input_dict = {}
     self.intermediate_dict = {}
     self.output_dict = {}
@@ -16,16 +52,28 @@ class ECU:
     self.dtcs_dict = self.fault_injector.dtcs_dict
     self.fault_tree_dict = self.fault_injector.fault_tree_dict
     self.active_dtcs = []
+    # Raw DTC results are debounced, so DTCs are reported on transitions only.
+    self.debouncer = debounce.DTCDebouncer(dtc_entries=get_diagnostic_dtcs())
+    # DTCs of faults injected by the owning vehicle, failing until cleared.
+    self.held_dtcs = ()
+
+    # Uniform [0, 1) samples for fault injection decisions, drawn in blocks.
+    self.fault_samples = model_math.UniformBlock(rng=rng)
 
   def listener(self, arg1, arg2, arg3=None):
     """Listens to inputs for the ECU.
 
     Args:
-      arg1: variable (has to be named as such) representing ECU input.
-      arg2: variable (has to be named as such) representing ECU output.
+      arg1: dict representing the sender's ECU input signals.
+      arg2: dict representing the topic's frame of the sender's ECU output
+        signals, see `signal_bus.Topic`.
     """
-    self.input_dict = arg1
-    self.output_dict = arg2
+    # Only the signals the ECU receives are written, into their own slots, so
+    # other ECUs' signals do not pile up in this ECU's dicts.
+    input_dict = self.input_dict
+    for signal in self.RECEIVED_SIGNALS:
+      if signal in arg2:
+        input_dict[signal] = arg2[signal]
 
   def subscribe(self, topic):
     """Subscribes listener to a topic.
@@ -33,7 +81,7 @@ class ECU:
     Args:
       topic: string representing a comms channel.
     """
-    pub.subscribe(self.listener, topic)
+    self._bus.subscribe(self.listener, topic, self.RECEIVED_SIGNALS)
 
   def send(self, topic):
     """Sends outputs to a topic.
@@ -41,16 +89,69 @@ class ECU:
     Args:
       topic: string representing a comms channel.
     """
-    pub.sendMessage(
-        topic, arg1=self.input_dict, arg2=self.output_dict, arg3=None)
+    resolved = self._topics.get(topic)
+    if resolved is None:
+      resolved = self._topics[topic] = self._bus.get_topic(topic)
+
+    self._bus.send(resolved, self.input_dict, self.output_dict)
 
   def get_input(self, input_key):
     """Returns an input signal value given its name/key."""
     return self.input_dict.get(input_key)
 
-  def set_dtcs(self, active_dtcs):
-    """Sets the value of active DTCs."""
-    self.active_dtcs = active_dtcs
+  def update_dtcs(self, failing_dtcs=(), now=None):
+    """Debounces an evaluation of the ECU's DTCs, reporting transitions.
+
+    Args:
+      failing_dtcs: iterable of strings representing the failing DTCs. The
+        `held_dtcs` of injected faults fail as well.
+      now: optional float representing the evaluation time [s], for events.
+    Returns:
+      `trace_file.DTC_EVENT_DTYPE` array of the DTCs set or cleared.
+    """
+    events = self.debouncer.update_dtcs((*failing_dtcs, *self.held_dtcs), now)
+    if len(events):
+      self.set_dtcs(events)
+
+    return events
+
+  def set_dtcs(self, events=()):
+    """Sets the active DTCs to the debounced ones, logging transitions.
+
+    Args:
+      events: `trace_file.DTC_EVENT_DTYPE` array of the DTCs set or cleared.
+    """
+    self.active_dtcs = [
+        entry.dtc for entry in self.debouncer.get_active_dtcs()]
+    self._log_dtc_events(events)
+
+  def set_event_log(self, dtc_event_log):
+    """Sets the `event_log.DTCEventLog` of the ECU's DTC events.
+
+    Args:
+      dtc_event_log: `event_log.DTCEventLog`, or `None` for the process-wide
+        one.
+    """
+    self._event_log = dtc_event_log
+
+  def _log_dtc_events(self, events):
+    """Logs DTC events, with a snapshot of the ECU's signals.
+
+    Args:
+      events: `trace_file.DTC_EVENT_DTYPE` array of the DTCs set or cleared.
+    """
+    snapshot = np.full(sim_output.NUM_SIGNALS, np.nan)
+    for signals in (self.input_dict, self.output_dict):
+      for signal, value in signals.items():
+        index = sim_output.SIGNAL_INDEX.get(signal)
+        if index is not None:
+          snapshot[index] = value
+
+    self._get_event_log().log(events, snapshot, self.vehicle_id)
+
+  def _get_event_log(self):
+    """Returns the ECU's `event_log.DTCEventLog`."""
+    return self._event_log or event_log.get_default_log()
 
   def get_dtcs(self):
     """Gets the value of active DTCs."""
@@ -60,6 +161,30 @@ class ECU:
     """Returns an output signal value given its name/key."""
     return self.output_dict.get(output_key)
 
+  def get_state(self):
+    """Returns the ECU state, incl. injected faults, as a dict of values."""
+    return {
+        "inputs": dict(self.input_dict),
+        "intermediates": dict(self.intermediate_dict),
+        "outputs": dict(self.output_dict),
+        "active_dtcs": list(self.active_dtcs),
+        "held_dtcs": list(self.held_dtcs),
+        "fault_samples": self.fault_samples.get_state(),
+        "fault_injector": self.fault_injector.get_state(),
+        "debouncer": self.debouncer.get_state(),
+    }
+
+  def set_state(self, state):
+    """Restores a state returned by `get_state`."""
+    self.input_dict = dict(state["inputs"])
+    self.intermediate_dict = dict(state["intermediates"])
+    self.output_dict = dict(state["outputs"])
+    self.active_dtcs = list(state["active_dtcs"])
+    self.held_dtcs = tuple(state["held_dtcs"])
+    self.fault_samples.set_state(state["fault_samples"])
+    self.fault_injector.set_state(state["fault_injector"])
+    self.debouncer.set_state(state["debouncer"])
+
   def populate_inputs(self, *args, **kwargs):
     raise NotImplementedError
 
@@ -1,19 +1,20 @@
 """Model Battery Management Module (PMM). Extends ECU."""
 
-import random
-import datetime
-
 from vehicle_model.ecu import ecu
 
 class PMM(ecu.ECU):
 
-  def __init__(self):
-    super().__init__()
+  # Battery outputs, sent by the BMM on `battery-inverter`.
+  RECEIVED_SIGNALS = ("v_bus", "i_bus")
+
+  def __init__(self, rng=None, bus=None):
+    super().__init__(rng, bus)
+
+  def populate_inputs(self, theta_elec):
+    """Populates PMM input variables.
 
-  def populate_inputs(self, v_bus, i_bus, theta_elec):
-    """Populates PMM input variables."""
-    self.input_dict["v_bus"] = v_bus
-    self.input_dict["i_bus"] = i_bus
+    `v_bus` and `i_bus` are received from the BMM on `battery-inverter`.
+    """
     self.input_dict["theta_elec"] = theta_elec
 
   def populate_outputs(self, v_d, v_q, i_d, i_q, inverter_losses):
@@ -26,24 +27,14 @@ class PMM(ecu.ECU):
 
   def inject_fault(self):
     # Inject short circuit.
-    if random.uniform(0, 1) < 0.5:
+    if self.fault_samples.next() < 0.5:
       self.output_dict["v_q"] = 0.0
       self.output_dict["i_q"] = 0.0
       # self.set_dtcs()
 
     # # Inject open circuit.
-    # if random.uniform(0, 1) < 0.5:
+    # if self.fault_samples.next() < 0.5:
     #   self.output_dict["v_q"] = float("Nan")
     #   self.output_dict["i_q"] = float("Nan")
     #   self.output_dict["v_d"] = float("Nan")
     #   self.output_dict["i_d"] = float("Nan")
-
-  def set_dtcs(self):
-    if self.output_dict["v_q"] < 300.0 or self.output_dict["v_q"] > 405.0:
-      now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-      print(f"{now} PMM DTC: A005 - Motor Voltage Rationality Fault.")
-
-    if self.output_dict["i_q"] < 0.0 or self.output_dict["i_q"] > 225.0:
-      now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-      print(f"{now} PMM DTC: A007 - Motor Current Rationality Fault.")
-
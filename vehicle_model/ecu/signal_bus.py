@@ -0,0 +1,149 @@
+"""In-process signal bus carrying ECU messages within a vehicle.
+
+A lightweight stand-in for a general purpose publish-subscribe library, for the
+one message ECUs exchange every step: their input and output signal dicts.
+Topics are resolved to `Topic` objects once, when first subscribed or sent to,
+and hold their listeners in a plain list, so sending is a list walk of direct
+calls: no topic tree lookup, keyword argument matching or message validation.
+
+Each topic also holds a frame: a dict with one slot per signal its listeners
+receive, preallocated as they subscribe. Sending writes the sender's values
+into the slots in place, and passes listeners the frame rather than the
+sender's whole output dict.
+"""
+
+import math
+
+
+class SignalBusError(Exception):
+  pass
+
+
+class Topic:
+  """A resolved topic: its name, current listeners and signal frame."""
+
+  __slots__ = ("name", "listeners", "frame")
+
+  def __init__(self, name):
+    self.name = name
+    self.listeners = []
+    # Latest value of each signal received by the listeners, NaN until sent.
+    self.frame = {}
+
+
+class SignalBus:
+  """Maps topic names to `Topic`s, and dispatches messages to listeners."""
+
+  def __init__(self):
+    self._topics = {}
+
+  def get_topic(self, name):
+    """Returns the topic of a given name, creating it if needed."""
+    topic = self._topics.get(name)
+    if topic is None:
+      if not name or not isinstance(name, str):
+        raise SignalBusError(f"Invalid topic name: {name!r}.")
+      topic = self._topics[name] = Topic(name)
+
+    return topic
+
+  def subscribe(self, listener, topic, signals=()):
+    """Subscribes a listener to a topic.
+
+    Args:
+      listener: callable invoked as `listener(inputs, frame)` with the sender's
+        input signal dict and the topic's frame, on each message sent to the
+        topic.
+      topic: string representing a comms channel.
+      signals: iterable of strings representing the sender's output signals
+        the listener receives. Slots are added to the topic's frame for them.
+    Returns:
+      The resolved `Topic`.
+    """
+    topic = self.get_topic(topic)
+    if listener not in topic.listeners:
+      topic.listeners.append(listener)
+    for signal in signals:
+      topic.frame.setdefault(signal, math.nan)
+
+    return topic
+
+  def unsubscribe(self, listener, topic):
+    """Unsubscribes a listener from a topic, if subscribed."""
+    listeners = self.get_topic(topic).listeners
+    if listener in listeners:
+      listeners.remove(listener)
+
+  def send(self, topic, inputs, outputs):
+    """Sends signals to the listeners of a topic, name or `Topic`.
+
+    Args:
+      topic: string representing a comms channel, or its `Topic`.
+      inputs: dict representing the sender's input signals.
+      outputs: dict representing the sender's output signals. Those with a
+        slot in the topic's frame are written to it.
+    """
+    if not isinstance(topic, Topic):
+      topic = self.get_topic(topic)
+
+    frame = topic.frame
+    for signal in frame:
+      if signal in outputs:
+        frame[signal] = outputs[signal]
+
+    for listener in topic.listeners:
+      listener(inputs, frame)
+
+
+_DEFAULT_BUS = SignalBus()
+
+
+def get_default_bus():
+  """Returns the process-wide bus, used by ECUs created without one."""
+  return _DEFAULT_BUS
+
+
+if __name__ == "__main__":
+  """Quick functionality and overhead checks for this library."""
+  import timeit
+
+  class Receiver:
+
+    def __init__(self):
+      self.input_dict = {}
+      self.output_dict = {}
+
+    def listener(self, arg1, arg2, arg3=None):
+      for signal in ("v_bus", "i_bus"):
+        if signal in arg2:
+          self.input_dict[signal] = arg2[signal]
+
+  inputs = {"i_bus_cmd": 200.0}
+  outputs = {
+      "v_bus": 400.0, "i_bus": 200.0, "batt_soc": 99.0, "batt_losses": 800.0}
+  num_sends = 100000
+
+  bus = SignalBus()
+  receiver = Receiver()
+  topic = bus.subscribe(
+      receiver.listener, "battery-inverter", ("v_bus", "i_bus"))
+  bus.send("battery-inverter", inputs, outputs)
+  print(receiver.input_dict, topic.frame)
+
+  bus_time = timeit.timeit(
+      lambda: bus.send(topic, inputs, outputs), number=num_sends)
+  print(f"SignalBus: {bus_time / num_sends * 1e6:.3f} us/send.")
+
+  try:
+    from pubsub.core import Publisher
+  except ImportError:
+    Publisher = None
+
+  if Publisher:
+    publisher = Publisher()
+    publisher.subscribe(receiver.listener, "battery-inverter")
+    pubsub_time = timeit.timeit(
+        lambda: publisher.sendMessage(
+            "battery-inverter", arg1=inputs, arg2=outputs, arg3=None),
+        number=num_sends)
+    print(f"PyPubSub: {pubsub_time / num_sends * 1e6:.3f} us/send.")
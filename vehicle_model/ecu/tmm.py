@@ -1,15 +1,12 @@
 """Model Thermal Management Module (TMM). Extends ECU."""
 
-import random
-import datetime
-
 from vehicle_model.ecu import ecu
 
 
 class TMM(ecu.ECU):
 
-  def __init__(self):
-    super().__init__()
+  def __init__(self, rng=None, bus=None):
+    super().__init__(rng, bus)
 
   def populate_inputs(
     self, batt_losses, inverter_losses, motor_losses, fluid_velocity):
@@ -28,17 +25,7 @@ class TMM(ecu.ECU):
     self.output_dict["T_fluid"] = T_fluid
 
   def inject_fault(self):
-    if random.uniform(0, 1) < 0.5:
+    if self.fault_samples.next() < 0.5:
       self.output_dict["T_junc_batt"] = 0.0
       self.output_dict["T_junc_batt"] = 0.0
       # self.set_dtcs()
-
-  def set_dtcs(self):
-    if self.output_dict["v_q"] < 300.0 or self.output_dict["v_q"] > 405.0:
-      now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-      print(f"{now} TMM DTC: A005 - Motor Voltage Rationality Fault.")
-
-    if self.output_dict["i_q"] < 0.0 or self.output_dict["i_q"] > 225.0:
-      now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-      print(f"{now} TMM DTC: A007 - Motor Current Rationality Fault.")
-
@@ -0,0 +1,395 @@
+"""Vectorized fleet engine for stepping many vehicle powertrains at once.
+
+`FleetSimulator` mirrors the plant models stepped by `vehicle.Vehicle`, but
+holds the state of every vehicle in contiguous NumPy arrays (one entry per
+vehicle) and advances the whole fleet with a handful of array operations per
+time step, instead of walking a graph of Python objects per vehicle.
+
+NOTE: ECU diagnostics and fault injection are not modelled by the fleet engine,
+other than rationality DTC checks; use `vehicle.Vehicle` where those are needed.
+"""
+
+import math
+import time
+
+import numpy as np
+
+from common import model_math
+from vehicle_model import drive_cycle
+from vehicle_model import sim_output
+from vehicle_model import vehicle
+from vehicle_model.diagnostics import monitor
+from vehicle_model.plant import discharge_curve
+from vehicle_model.plant import motor
+
+
+# Constants.
+# Percent amplitude of white noise added to each sim output signal.
+NOISE_AMPLITUDES = vehicle.NOISE_AMPLITUDES
+# Random stream index of each vehicle's sensor noise, clear of the `make_rngs`
+# streams of a `vehicle.Vehicle` of the same ID.
+NOISE_STREAM = 1024
+
+
+def _calculate_soc(batt_soc, i_bus, dt, curve):
+  """Batched `Battery._calculate_soc`. Updates `batt_soc` in place.
+
+  Returns:
+    v_bus: array of bus voltages [V] for the updated states of charge.
+  """
+  batt_soc -= i_bus * (dt * 100.0 / (vehicle.q_nominal * 3600))
+  return curve.voltages_at(batt_soc)
+
+
+def _inverter_losses(v_bus, i_bus, i_q):
+  """Batched `Inverter._update_losses`."""
+  conduction_loss = 1.5 * i_q**2 * vehicle.r_ds_on
+  switching_loss = (
+      0.5 * v_bus * i_bus * (vehicle.t_rise + vehicle.t_fall) *
+      vehicle.f_switching)
+  return conduction_loss + switching_loss
+
+
+def _update_temps(batt_losses, inverter_losses, motor_losses, fluid_velocity,
+                  T_fluid):
+  """Batched `CoolingSystem._update_temps`.
+
+  Returns:
+    Battery, inverter and motor junction temps and the cooling fluid temp
+    [degC]. The fluid temp holds its previous value where there is no flow.
+  """
+  T_junc_batt = vehicle.T_ambient + vehicle.Rth_batt_junc * batt_losses
+  T_junc_inverter = (
+      vehicle.T_ambient + vehicle.Rth_inverter_junc * inverter_losses)
+  T_junc_motor = vehicle.T_ambient + vehicle.Rth_motor_junc * motor_losses
+
+  total_loss = batt_losses + inverter_losses + motor_losses
+  m_dot_c = (
+      vehicle.fluid_density * fluid_velocity * vehicle.pipe_area *
+      vehicle.fluid_heat_capacity)
+  flowing = m_dot_c != 0
+  T_fluid = np.where(
+      flowing,
+      vehicle.T_ambient + total_loss / np.where(flowing, m_dot_c, 1.0),
+      T_fluid)
+
+  return T_junc_batt, T_junc_inverter, T_junc_motor, T_fluid
+
+
+class FleetSimulator:
+  """Struct-of-arrays representation of a fleet of vehicle powertrains."""
+
+  def __init__(
+      self, num_vehicles, first_vehicle_id=1, seed=None, noise=True,
+      chemistry=discharge_curve.DEFAULT_CHEMISTRY, drive_cycles=None,
+      cycle_offsets=0.0):
+    """Initializes a FleetSimulator.
+
+    Args:
+      num_vehicles: int representing the number of vehicles in the fleet.
+      first_vehicle_id: int representing the ID of the first vehicle; the
+        others are numbered consecutively.
+      seed: optional int seeding the run. Together with its ID it fixes the
+        noise of each vehicle, for reproducible runs.
+      noise: bool enabling sensor noise on the sim outputs.
+      chemistry: string representing the battery chemistry.
+      drive_cycles: optional `drive_cycle.DriveCycle` feeding every vehicle's
+        inputs, or a sequence with one cycle (or `None`, for constant inputs)
+        per vehicle.
+      cycle_offsets: float or array with one time [s] per vehicle, into the
+        drive cycle at which the run starts.
+    """
+    self._num_vehicles = num_vehicles
+    self._vehicle_ids = np.arange(
+        first_vehicle_id, first_vehicle_id + num_vehicles)
+    self._elapsed_time = 0.0  # [s], simulated time since start of the run.
+    self._noise = noise
+    # One noise stream per vehicle ID, so each vehicle's outputs are the same
+    # however the fleet is sized or partitioned into chunks and processes.
+    self._white_noise = model_math.KeyedWhiteNoise(
+        model_math.make_stream_keys(self._vehicle_ids, seed, NOISE_STREAM))
+    self._discharge_curve = discharge_curve.get_discharge_curve(chemistry)
+
+    # Simulator input variables, one entry per vehicle.
+    self.i_bus_cmd = np.full(num_vehicles, 200.0)  # [A].
+    self.fluid_velocity = np.full(num_vehicles, 2.0)  # [m/s].
+    self.omega_mech = np.full(num_vehicles, 100.0)  # [rad/s].
+
+    # Vehicles grouped by drive cycle, to look up each cycle's inputs at once.
+    if drive_cycles is None or isinstance(drive_cycles, drive_cycle.DriveCycle):
+      drive_cycles = [drive_cycles] * num_vehicles
+    if len(drive_cycles) != num_vehicles:
+      raise drive_cycle.DriveCycleError(
+          "drive_cycles should have one entry per vehicle.")
+    self._cycle_offsets = np.broadcast_to(
+        np.asarray(cycle_offsets, dtype=np.float64), (num_vehicles,))
+    cycle_indices = {}
+    for index, cycle in enumerate(drive_cycles):
+      if cycle is not None:
+        cycle_indices.setdefault(cycle, []).append(index)
+    self._cycle_groups = [
+        (cycle, np.array(indices)) for cycle, indices in cycle_indices.items()]
+    self._update_inputs()
+
+    # Plant state variables, one entry per vehicle.
+    ## Battery.
+    self.v_bus = np.full(num_vehicles, 400.0)
+    self.i_bus = np.zeros(num_vehicles)
+    self.batt_soc = np.full(num_vehicles, 100.0)
+    ## Inverter.
+    self.v_d = np.zeros(num_vehicles)
+    self.v_q = np.zeros(num_vehicles)
+    self.i_d = np.zeros(num_vehicles)
+    self.i_q = np.zeros(num_vehicles)
+    ## Motor.
+    # NOTE: `Motor.i_q` is not driven by the inverter, so motor losses stay at
+    # zero in the scalar model; mirror that here.
+    self.motor_i_q = np.zeros(num_vehicles)
+    self.torque_mech = np.zeros(num_vehicles)
+    ## Cooling System.
+    self.T_junc_batt = np.zeros(num_vehicles)
+    self.T_junc_inverter = np.zeros(num_vehicles)
+    self.T_junc_motor = np.zeros(num_vehicles)
+    self.T_fluid = np.zeros(num_vehicles)
+
+    # Power loss variables.
+    self.batt_losses = np.zeros(num_vehicles)
+    self.inverter_losses = np.zeros(num_vehicles)
+    self.motor_losses = np.zeros(num_vehicles)
+
+    # Sim outputs, one row per vehicle laid out as `sim_output.SIGNALS`.
+    self._sim_out = np.zeros((num_vehicles, sim_output.NUM_SIGNALS))
+    self._sim_out[:, sim_output.SIGNAL_INDEX["vehicle_id"]] = self._vehicle_ids
+    self._sim_out[:, sim_output.SIGNAL_INDEX["v_bus"]] = self.v_bus
+    self._sim_out[:, sim_output.SIGNAL_INDEX["batt_soc"]] = self.batt_soc
+    self._sim_out[:, sim_output.SIGNAL_INDEX["omega_mech"]] = self.omega_mech
+    # The sim outputs are assembled signal by signal in this transposed copy,
+    # where each signal's column is contiguous.
+    self._sim_out_columns = self._sim_out.T.copy()
+    # Only the noisy columns are drawn, of the noise of every column.
+    self._noisy_columns = np.array(sorted(
+        sim_output.SIGNAL_INDEX[signal] for signal in NOISE_AMPLITUDES))
+    self._noisy_amplitudes = np.array([
+        NOISE_AMPLITUDES[sim_output.SIGNALS[column]]
+        for column in self._noisy_columns])
+    self._recorders = []
+
+    # Rationality DTC checks, and the bitmasks of those failing at the last
+    # `check_rationality` call, one per vehicle.
+    self._monitor = monitor.get_rationality_monitor()
+    self._rationality_masks = np.zeros(num_vehicles, dtype=np.uint64)
+
+  def get_num_vehicles(self):
+    """Returns the number of vehicles in the fleet."""
+    return self._num_vehicles
+
+  def get_vehicle_ids(self):
+    """Returns the array of vehicle IDs, in sim output row order."""
+    return self._vehicle_ids
+
+  def get_elapsed_time(self):
+    """Returns the simulated time [s] elapsed since the start of the run."""
+    return self._elapsed_time
+
+  def step(self, dt=vehicle.DATA_RATE):
+    """Runs a fixed time step of the simulation for every vehicle.
+
+    Args:
+      dt: float representing simulated time [s] to advance the fleet by.
+    """
+    self._elapsed_time += dt
+    self._update_inputs()
+
+    # Update battery models, assuming perfect tracking of bus current command.
+    self.i_bus[:] = self.i_bus_cmd
+    self.v_bus = _calculate_soc(
+        self.batt_soc, self.i_bus, dt, self._discharge_curve)
+    self.batt_losses = self.i_bus**2 * vehicle.r_internal
+
+    # Update inverter models.
+    theta_elec = (
+        (self.omega_mech * vehicle.n_pp * self._elapsed_time) % (2 * math.pi))
+    basis = model_math.phase_basis(theta_elec)
+    self.v_d, self.v_q = model_math.park_transform_basis(
+        *model_math.three_phase(self.v_bus, basis), basis)
+    self.i_d, self.i_q = model_math.park_transform_basis(
+        *model_math.three_phase(self.i_bus, basis), basis)
+    self.inverter_losses = _inverter_losses(self.v_bus, self.i_bus, self.i_q)
+
+    # Update motor models.
+    self.motor_losses = 1.5 * self.motor_i_q**2 * vehicle.Rs
+    self.torque_mech = motor.calculate_torque(
+        self.v_bus * self.i_bus - self.motor_losses, self.omega_mech)
+
+    # Update cooling system models.
+    (self.T_junc_batt, self.T_junc_inverter,
+     self.T_junc_motor, self.T_fluid) = _update_temps(
+         self.batt_losses, self.inverter_losses, self.motor_losses,
+         self.fluid_velocity, self.T_fluid)
+
+    self._update_sim_outputs()
+
+  def _update_inputs(self):
+    """Reads the simulator inputs of vehicles on drive cycles."""
+    for cycle, indices in self._cycle_groups:
+      (self.i_bus_cmd[indices], self.omega_mech[indices],
+       self.fluid_velocity[indices]) = cycle.values_at(
+           self._elapsed_time + self._cycle_offsets[indices])
+
+  def run_for(self, sim_seconds, dt=vehicle.DATA_RATE, callback=None):
+    """Runs the fleet for a span of simulated time, as fast as possible.
+
+    Args:
+      sim_seconds: float representing simulated time [s] to run for.
+      dt: float representing the fixed simulation time step [s].
+      callback: optional callable invoked with the sim outputs after each step.
+    Returns:
+      num_steps: int representing the number of time steps taken.
+    """
+    num_steps = int(round(sim_seconds / dt))
+
+    for _ in range(num_steps):
+      self.step(dt)
+      if callback:
+        callback(self._sim_out)
+
+    return num_steps
+
+  def _update_sim_outputs(self):
+    """Copies the latest fleet state, with sensor noise, to the sim outputs."""
+    columns = self._sim_out_columns
+    index = sim_output.SIGNAL_INDEX
+    columns[index["elapsed_time"]] = self._elapsed_time
+    columns[index["v_bus"]] = self.v_bus
+    columns[index["i_bus"]] = self.i_bus
+    columns[index["batt_soc"]] = self.batt_soc
+    columns[index["v_d"]] = self.v_d
+    columns[index["v_q"]] = self.v_q
+    columns[index["i_d"]] = self.i_d
+    columns[index["i_q"]] = self.i_q
+    columns[index["torque_mech"]] = self.torque_mech
+    columns[index["omega_mech"]] = self.omega_mech
+    columns[index["T_junc_batt"]] = self.T_junc_batt
+    columns[index["T_junc_inverter"]] = self.T_junc_inverter
+    columns[index["T_junc_motor"]] = self.T_junc_motor
+    columns[index["T_fluid"]] = self.T_fluid
+
+    if self._noise:
+      gains = self._white_noise.uniform(
+          sim_output.NUM_SIGNALS, self._noisy_columns).T
+      for column, amplitude, column_gains in zip(
+          self._noisy_columns, self._noisy_amplitudes, gains):
+        column_gains *= amplitude
+        column_gains += 1.0
+        columns[column] *= column_gains
+
+    sim_out = self._sim_out
+    np.copyto(sim_out, columns.T)
+
+    for recorder in self._recorders:
+      recorder.record(sim_out)
+
+  def attach_recorder(self, recorder):
+    """Attaches a recorder, e.g. a `TelemetryRecorder`, to the sim outputs.
+
+    Args:
+      recorder: object with a `record(rows)` method, called with the
+        (num_vehicles, sim_output.NUM_SIGNALS) sim outputs after every step.
+    """
+    self._recorders.append(recorder)
+
+  def get_sim_outputs(self):
+    """Gets the sim outputs of every vehicle at the current time.
+
+    Returns:
+      A (num_vehicles, sim_output.NUM_SIGNALS) array, updated in place on each
+      step.
+    """
+    return self._sim_out
+
+  def check_rationality(self):
+    """Evaluates the rationality DTCs of every vehicle on the sim outputs.
+
+    Returns:
+      set_masks: uint64 array of the bitmasks of the DTCs set since the last
+        check, one per vehicle, with bits as in `monitor.RationalityMonitor`.
+      cleared_masks: uint64 array of the bitmasks of the DTCs cleared since
+        the last check, one per vehicle.
+    """
+    self._rationality_masks, set_masks, cleared_masks = self._monitor.update(
+        self._sim_out, self._rationality_masks)
+    return set_masks, cleared_masks
+
+  def get_rationality_masks(self):
+    """Returns the bitmasks of the failing rationality DTCs, per vehicle."""
+    return self._rationality_masks
+
+  def get_vehicle_outputs(self, index):
+    """Gets the sim outputs of a single vehicle.
+
+    Args:
+      index: int representing the row of the vehicle in the sim outputs.
+    Returns:
+      A `sim_output.SimOutput` record viewing (not copying) the vehicle's row.
+    """
+    return sim_output.SimOutput(self._sim_out[index])
+
+
+if __name__ == "__main__":
+  """Quick functionality and throughput checks for this library."""
+  num_vehicles = 10000
+  sim_seconds = 10
+
+  vehicle_1 = vehicle.Vehicle(vehicle_id=1)
+  start_time = time.perf_counter()
+  num_steps = vehicle_1.run_for(sim_seconds)
+  scalar_rate = num_steps / (time.perf_counter() - start_time)
+
+  fleet = FleetSimulator(num_vehicles)
+  start_time = time.perf_counter()
+  num_steps = fleet.run_for(sim_seconds)
+  fleet_rate = num_vehicles * num_steps / (time.perf_counter() - start_time)
+
+  print(f"Scalar: {scalar_rate:.0f} vehicle-steps/s.")
+  print(f"Fleet: {fleet_rate:.0f} vehicle-steps/s "
+        f"({fleet_rate / scalar_rate:.0f}x).")
+
+  scalar_out = vehicle_1.get_sim_outputs()
+  fleet_out = fleet.get_vehicle_outputs(0)
+  for signal in sim_output.SIGNALS:
+    print(f"{signal}: scalar={scalar_out[signal]} fleet={fleet_out[signal]}")
+
+  vehicle_1.check_rationality()
+  fleet.check_rationality()
+  print(f"Rationality DTCs: scalar={vehicle_1.get_rationality_dtcs()} "
+        f"fleet={int(fleet.get_rationality_masks()[0]):#x}")
+
+  # A drive cycle starting from standstill, where torque is held at 0.
+  import os
+  import tempfile
+
+  temp_dir = tempfile.mkdtemp()
+  profile_path = os.path.join(temp_dir, "standstill.npy")
+  cycle_path = os.path.join(temp_dir, "standstill.trace")
+  np.save(profile_path, np.array(
+      [[0.0, 0.0, 0.0, 2.0], [1.0, 100.0, 0.0, 2.0], [2.0, 200.0, 50.0, 2.0]]))
+  drive_cycle.convert_profile(profile_path, cycle_path)
+  cycle = drive_cycle.get_drive_cycle(cycle_path)
+  standstill_vehicle = vehicle.Vehicle(vehicle_id=1, drive_cycle=cycle)
+  standstill_fleet = FleetSimulator(2, noise=False, drive_cycles=cycle)
+  standstill_vehicle.run_for(0.5)
+  standstill_fleet.run_for(0.5)
+  print(f"Standstill torque: scalar="
+        f"{standstill_vehicle.get_sim_outputs()['torque_mech']} "
+        f"fleet={standstill_fleet.torque_mech}")
+
+  # Each vehicle's noise is the same whichever chunk of the fleet it is in.
+  whole_fleet = FleetSimulator(4, seed=7)
+  chunks = [FleetSimulator(2, first_vehicle_id, seed=7)
+            for first_vehicle_id in (1, 3)]
+  whole_fleet.run_for(0.1)
+  for chunk in chunks:
+    chunk.run_for(0.1)
+  print("Chunked noise matches: " + str(np.array_equal(
+      whole_fleet.get_sim_outputs(),
+      np.concatenate([chunk.get_sim_outputs() for chunk in chunks]))))
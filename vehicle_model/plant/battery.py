@@ -1,16 +1,21 @@
 """Model of the HV battery."""
 
+import numpy as np
+
 from vehicle_model.ecu import bmm
+from vehicle_model.plant import discharge_curve
 
-import numpy as np
 
+# Attributes making up the battery state, see `Battery.get_state`.
+_STATE_ATTRIBUTES = ("i_bus_cmd", "v_bus", "i_bus", "batt_soc", "batt_losses")
 
 class Battery:
 
   def __init__(
-    self, v_nominal, q_nominal, r_internal, fault_injection_mode=False):
+    self, v_nominal, q_nominal, r_internal, fault_injection_mode=False,
+    chemistry=discharge_curve.DEFAULT_CHEMISTRY, rng=None, bus=None):
     # Instance of Battery Management Module (BMM).
-    self.bmm = bmm.BMM()
+    self.bmm = bmm.BMM(rng, bus)
 
     # Battery parameters.
     self._v_nominal = v_nominal
@@ -18,16 +23,10 @@ class Battery:
     self._r_internal = r_internal
     self._fault_injection_mode = fault_injection_mode
 
-    # Discharge curve.
-    self.batt_socs = [
-        0, 5, 10, 15, 20, 25, 30, 35, 40, 45, 50, 55, 60, 65, 70, 75, 80, 85,
-        90, 95, 100
-    ]
-    self.batt_voltages = [
-      285.7, 291.4, 297.1, 302.9, 308.6, 314.3, 320.0, 325.7, 331.4, 337.1,
-      342.9, 348.6, 354.3, 360.0, 365.7, 371.4, 377.2, 382.9, 388.6, 394.3,
-      400.0
-    ]
+    # Discharge curve, compiled once per chemistry and shared.
+    self.discharge_curve = discharge_curve.get_discharge_curve(chemistry)
+    self.batt_socs = self.discharge_curve.socs
+    self.batt_voltages = self.discharge_curve.voltages
 
     # Battery inputs.
     self.i_bus_cmd = 0.0
@@ -67,14 +66,20 @@ class Battery:
     self.batt_soc -= self.i_bus / (self._q_nominal * 3600) * dt * 100.0
 
     # Calculate resultant bus voltage for the time step.
-    self.v_bus = np.interp(self.batt_soc, self.batt_socs, self.batt_voltages)
+    self.v_bus = self.discharge_curve.voltage(self.batt_soc)
 
   def _update_losses(self):
     """Updates battery electrical losses for each time step."""
     self.batt_losses = self.i_bus**2 * self._r_internal
 
-  def update_outputs(self, dt):
-    """Updates battery outputs for each time step."""
+  def update_outputs(self, dt, run_diagnostics=True):
+    """Updates battery outputs for each time step.
+
+    Args:
+      dt: float representing the time step [s].
+      run_diagnostics: bool, if `False` the BMM diagnostics are left to be run
+        separately, at their own rate, with `run_diagnostics`.
+    """
     self._calculate_soc(dt)
     self._update_losses()
 
@@ -85,14 +90,69 @@ class Battery:
         batt_losses=self.batt_losses
     )
 
-    if self._fault_injection_mode:
+    if run_diagnostics and self._fault_injection_mode:
       self.bmm.inject_fault()
   
     self.bmm.send('battery-inverter')
 
+    return self.get_outputs()
+
+  def fast_forward(self, offsets):
+    """Jumps the battery ahead in closed form under the current inputs.
+
+    With a constant bus current command, SOC falls linearly in time, so it can
+    be evaluated directly at any future time rather than stepped to.
+
+    Args:
+      offsets: increasing array of times [s] from now to evaluate outputs at.
+        The battery is left in its state at the last one.
+    Returns:
+      Arrays of v_bus, i_bus, batt_soc and batt_losses at each offset.
+    """
+    # Assume perfect tracking of bus current command.
+    i_bus = np.full(len(offsets), float(self.i_bus_cmd))
+    batt_soc = self.batt_soc - (
+        self.i_bus_cmd / (self._q_nominal * 3600) * offsets * 100.0)
+    v_bus = self.discharge_curve.voltages_at(batt_soc)
+    batt_losses = i_bus**2 * self._r_internal
+
+    self.i_bus = float(i_bus[-1])
+    self.batt_soc = float(batt_soc[-1])
+    self.v_bus = float(v_bus[-1])
+    self.batt_losses = float(batt_losses[-1])
+    self.bmm.populate_outputs(
+        v_bus=self.v_bus,
+        i_bus=self.i_bus,
+        batt_soc=self.batt_soc,
+        batt_losses=self.batt_losses
+    )
+
+    return v_bus, i_bus, batt_soc, batt_losses
+
+  def run_diagnostics(self):
+    """Runs BMM diagnostics on the latest battery outputs."""
+    if self._fault_injection_mode:
+      self.bmm.inject_fault()
+
+    return self.get_outputs()
+
+  def get_outputs(self):
+    """Returns the battery outputs, as reported by the BMM."""
     return (
       self.bmm.get_output("v_bus"),
       self.bmm.get_output("i_bus"),
       self.bmm.get_output("batt_soc"),
       self.bmm.get_output("batt_losses"),
     )
+
+  def get_state(self):
+    """Returns the battery and BMM state, as a dict of plain values."""
+    state = {name: getattr(self, name) for name in _STATE_ATTRIBUTES}
+    state["bmm"] = self.bmm.get_state()
+    return state
+
+  def set_state(self, state):
+    """Restores a state returned by `get_state`."""
+    for name in _STATE_ATTRIBUTES:
+      setattr(self, name, state[name])
+    self.bmm.set_state(state["bmm"])
@@ -1,5 +1,12 @@
 """Model of the cooling system."""
 
+
+# Attributes making up the cooling system state, see
+# `CoolingSystem.get_state`.
+_STATE_ATTRIBUTES = (
+    "batt_losses", "inverter_losses", "motor_losses", "fluid_velocity",
+    "T_junc_batt", "T_junc_inverter", "T_junc_motor", "T_fluid")
+
 class CoolingSystem:
 
   def __init__(
@@ -67,3 +74,11 @@ class CoolingSystem:
     return (
         self.T_junc_batt, self.T_junc_inverter, self.T_junc_motor, self.T_fluid)
 
+  def get_state(self):
+    """Returns the cooling system state, as a dict of plain values."""
+    return {name: getattr(self, name) for name in _STATE_ATTRIBUTES}
+
+  def set_state(self, state):
+    """Restores a state returned by `get_state`."""
+    for name in _STATE_ATTRIBUTES:
+      setattr(self, name, state[name])
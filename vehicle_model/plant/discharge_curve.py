@@ -0,0 +1,158 @@
+"""Compiled HV battery discharge curves, loaded per cell chemistry."""
+
+import functools
+
+import numpy as np
+
+from common import runfiles_util
+
+
+# Constants.
+DISCHARGE_CURVES_YAML_RUNFILE = (
+    "automotive-diagnostics/vehicle_model/plant/discharge_curves.yaml")
+DEFAULT_CHEMISTRY = "nca"
+
+
+class DischargeCurveError(Exception):
+  pass
+
+
+class DischargeCurve:
+  """Piecewise linear lookup of bus voltage against state of charge (SOC).
+
+  Slopes are precomputed once. Curves on a uniform SOC grid are indexed
+  directly; otherwise the scalar lookup starts its search from the segment
+  used by the previous call, which is almost always the right one since SOC
+  moves slowly and monotonically. Lookups clamp to the end points of the curve,
+  as `np.interp` does.
+  """
+
+  def __init__(self, socs, voltages):
+    socs = np.asarray(socs, dtype=float)
+    voltages = np.asarray(voltages, dtype=float)
+
+    if socs.ndim != 1 or socs.shape != voltages.shape or len(socs) < 2:
+      raise DischargeCurveError(
+          "`socs` and `voltages` should be 1-D and of equal length >= 2.")
+    if np.any(np.diff(socs) <= 0):
+      raise DischargeCurveError("`socs` should be strictly increasing.")
+
+    self.socs = socs
+    self.voltages = voltages
+    self.slopes = np.diff(voltages) / np.diff(socs)
+
+    steps = np.diff(socs)
+    self._is_uniform = bool(np.allclose(steps, steps[0]))
+    self._inv_step = 1.0 / steps[0]
+    self._last_segment = len(socs) - 2
+    self._segment_hint = self._last_segment
+
+    # Python floats for the scalar path, to avoid NumPy scalar overhead.
+    self._soc_list = socs.tolist()
+    self._voltage_list = voltages.tolist()
+    self._slope_list = self.slopes.tolist()
+
+  def _find_segment(self, soc):
+    """Returns the index of the curve segment containing `soc`."""
+    if self._is_uniform:
+      return min(
+          int((soc - self._soc_list[0]) * self._inv_step), self._last_segment)
+
+    segment = self._segment_hint
+    while segment > 0 and soc < self._soc_list[segment]:
+      segment -= 1
+    while segment < self._last_segment and soc >= self._soc_list[segment + 1]:
+      segment += 1
+    self._segment_hint = segment
+
+    return segment
+
+  def voltage(self, soc):
+    """Returns the bus voltage [V] at a given state of charge [%]."""
+    if soc <= self._soc_list[0]:
+      return self._voltage_list[0]
+    if soc >= self._soc_list[-1]:
+      return self._voltage_list[-1]
+
+    segment = self._find_segment(soc)
+
+    return self._voltage_list[segment] + self._slope_list[segment] * (
+        soc - self._soc_list[segment])
+
+  def voltages_at(self, socs):
+    """Returns bus voltages [V] for an array of states of charge [%]."""
+    if not self._is_uniform:
+      return np.interp(socs, self.socs, self.voltages)
+
+    socs = np.clip(socs, self.socs[0], self.socs[-1])
+    segments = ((socs - self.socs[0]) * self._inv_step).astype(np.intp)
+    np.minimum(segments, self._last_segment, out=segments)
+
+    return self.voltages[segments] + self.slopes[segments] * (
+        socs - self.socs[segments])
+
+
+def get_discharge_curves_yaml_path():
+  """Returns the path of the discharge curves YAML file."""
+  return runfiles_util.rlocation(DISCHARGE_CURVES_YAML_RUNFILE)
+
+
+# `DISCHARGE_CURVES_YAML_PATH` is resolved lazily, on first access.
+__getattr__ = runfiles_util.lazy_runfile(
+    "DISCHARGE_CURVES_YAML_PATH", DISCHARGE_CURVES_YAML_RUNFILE)
+
+
+def load_yaml(yaml_path=None):
+  """Loads a yaml file into a dictionary, the discharge curves by default."""
+  import yaml
+
+  yaml_path = yaml_path or get_discharge_curves_yaml_path()
+  yaml_dict = {}
+
+  with open(yaml_path, "r") as f:
+    try:
+      yaml_dict = yaml.safe_load(f)
+    except yaml.YAMLError as e:
+      print(e)
+
+  return yaml_dict
+
+
+@functools.lru_cache(maxsize=None)
+def get_discharge_curve(chemistry=DEFAULT_CHEMISTRY, yaml_path=None):
+  """Returns the compiled discharge curve for a cell chemistry.
+
+  Curves are loaded and compiled once per process, then shared.
+
+  Args:
+    chemistry: string representing a cell chemistry defined in `yaml_path`.
+    yaml_path: optional string representing path to a discharge curves YAML
+      file. Defaults to the bundled one.
+  """
+  yaml_path = yaml_path or get_discharge_curves_yaml_path()
+  curves_dict = load_yaml(yaml_path)
+
+  if chemistry not in curves_dict:
+    raise DischargeCurveError(
+        f"{chemistry} is not defined in: `{yaml_path}`.")
+
+  metadata = curves_dict[chemistry]
+
+  return DischargeCurve(metadata["socs"], metadata["voltages"])
+
+
+if __name__ == "__main__":
+  """Quick functionality tests for this library."""
+  curve = get_discharge_curve()
+
+  test_socs = np.linspace(-5.0, 105.0, 1001)
+  expected = np.interp(test_socs, curve.socs, curve.voltages)
+
+  print(np.allclose([curve.voltage(soc) for soc in test_socs], expected))
+  print(np.allclose(curve.voltages_at(test_socs), expected))
+
+  irregular = DischargeCurve([0, 10, 50, 100], [280.0, 300.0, 350.0, 400.0])
+  expected = np.interp(test_socs, irregular.socs, irregular.voltages)
+  print(np.allclose([irregular.voltage(soc) for soc in test_socs], expected))
+  print(np.allclose(
+      [irregular.voltage(soc) for soc in test_socs[::-1]], expected[::-1]))
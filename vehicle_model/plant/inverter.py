@@ -1,17 +1,21 @@
 """Model of the motor controller / inverter."""
 
-import math
-
 from common import model_math
 from vehicle_model.ecu import pmm
 
 
+# Attributes making up the inverter state, see `Inverter.get_state`.
+_STATE_ATTRIBUTES = (
+    "v_bus", "i_bus", "theta_elec", "v_a", "v_b", "v_c", "i_a", "i_b", "i_c",
+    "v_d", "v_q", "i_d", "i_q", "inverter_losses")
+
 class Inverter:
 
   def __init__(
-    self, r_ds_on, f_switching, t_rise, t_fall, fault_injection_mode=False):
+    self, r_ds_on, f_switching, t_rise, t_fall, fault_injection_mode=False,
+    rng=None, bus=None):
     # Instance of Powertrain Management Module (PMM).
-    self.pmm = pmm.PMM()
+    self.pmm = pmm.PMM(rng, bus)
 
     # Inverter parameters.
     self._r_ds_on = r_ds_on
@@ -34,6 +38,7 @@ class Inverter:
     # Inverter intermediate variables.
     self.v_a, self.v_b, self.v_c = (0.0, 0.0, 0.0)
     self.i_a, self.i_b, self.i_c = (0.0, 0.0, 0.0)
+    self._phase_basis = model_math.phase_basis(self.theta_elec)
 
     # Inverter outputs.
     self.v_d, self.v_q = (0.0, 0.0)
@@ -56,8 +61,7 @@ class Inverter:
     self.v_bus = v_bus
     self.i_bus = i_bus
     self.theta_elec = theta_elec
-    # self.pmm.populate_inputs(v_bus, i_bus, theta_elec)
-    self.pmm.populate_inputs(0.0, 0.0, 0.0)
+    self.pmm.populate_inputs(theta_elec)
 
   def  _calculate_3_phase(self):
     """Computes 3 phase voltage and current waveforms."""
@@ -67,17 +71,10 @@ class Inverter:
     #   self.pmm.get_output("v_bus") * math.sin(self.theta_elec + (2 * math.pi / 3)),
     # )
 
-    self.v_a, self.v_b, self.v_c = (
-      self.v_bus * math.sin(self.theta_elec),
-      self.v_bus * math.sin(self.theta_elec - (2 * math.pi / 3)),
-      self.v_bus * math.sin(self.theta_elec + (2 * math.pi / 3)),
-    )
-
-    self.i_a, self.i_b, self.i_c = (
-      self.i_bus * math.sin(self.theta_elec),
-      self.i_bus * math.sin(self.theta_elec - (2 * math.pi / 3)),
-      self.i_bus * math.sin(self.theta_elec + (2 * math.pi / 3)),
-    )
+    self.v_a, self.v_b, self.v_c = model_math.three_phase(
+        self.v_bus, self._phase_basis)
+    self.i_a, self.i_b, self.i_c = model_math.three_phase(
+        self.i_bus, self._phase_basis)
 
   def _update_losses(self):
     """Updates inverter electrical losses for each time step."""
@@ -90,26 +87,44 @@ class Inverter:
           self._t_rise + self._t_fall) * self._f_switching)
     self.inverter_losses = conduction_loss + switching_loss
 
-  def update_outputs(self):
-    """Updates motor outputs for each time step."""
+  def update_outputs(self, run_diagnostics=True):
+    """Updates motor outputs for each time step.
+
+    Args:
+      run_diagnostics: bool, if `False` the PMM diagnostics are left to be run
+        separately, at their own rate, with `run_diagnostics`.
+    """
+    # Share one sin/cos evaluation between the waveforms and park transforms.
+    self._phase_basis = model_math.phase_basis(self.theta_elec)
     self._calculate_3_phase()
 
-    self.v_d, self.v_q = model_math.park_transform(
-      self.v_a, self.v_b, self.v_c, self.theta_elec)
-    self.i_d, self.i_q = model_math.park_transform(
-      self.i_a, self.i_b, self.i_c, self.theta_elec)
+    self.v_d, self.v_q = model_math.park_transform_basis(
+      self.v_a, self.v_b, self.v_c, self._phase_basis)
+    self.i_d, self.i_q = model_math.park_transform_basis(
+      self.i_a, self.i_b, self.i_c, self._phase_basis)
 
     self._update_losses()
 
     self.pmm.populate_outputs(
         self.v_d, self.v_q, self.i_d, self.i_q, self.inverter_losses)
 
-    if self._fault_injection_mode:
+    if run_diagnostics and self._fault_injection_mode:
       self.pmm.inject_fault()
   
     self.pmm.send('inverter-motor')
 
     # return self.v_d, self.v_q, self.i_d, self.i_q, self.inverter_losses
+    return self.get_outputs()
+
+  def run_diagnostics(self):
+    """Runs PMM diagnostics on the latest inverter outputs."""
+    if self._fault_injection_mode:
+      self.pmm.inject_fault()
+
+    return self.get_outputs()
+
+  def get_outputs(self):
+    """Returns the inverter outputs, as reported by the PMM."""
     return (
       self.pmm.get_output("v_d"),
       self.pmm.get_output("v_q"),
@@ -117,3 +132,16 @@ class Inverter:
       self.pmm.get_output("i_q"),
       self.pmm.get_output("inverter_losses"),
     )
+
+  def get_state(self):
+    """Returns the inverter and PMM state, as a dict of plain values."""
+    state = {name: getattr(self, name) for name in _STATE_ATTRIBUTES}
+    state["pmm"] = self.pmm.get_state()
+    return state
+
+  def set_state(self, state):
+    """Restores a state returned by `get_state`."""
+    for name in _STATE_ATTRIBUTES:
+      setattr(self, name, state[name])
+    self._phase_basis = model_math.phase_basis(self.theta_elec)
+    self.pmm.set_state(state["pmm"])
@@ -1,5 +1,34 @@
 """Model of the electric motor."""
 
+import numpy as np
+
+
+# Constants.
+MIN_OMEGA_MECH = 1e-3  # [rad/s], speed below which torque is held at 0.
+# Attributes making up the motor state, see `Motor.get_state`.
+_STATE_ATTRIBUTES = (
+    "iq_cmd", "v_bus", "i_bus", "omega_mech", "omega_elec", "i_q",
+    "torque_mech", "motor_losses")
+
+
+def calculate_torque(power, omega_mech):
+  """Returns the mechanical torque [Nm] delivering a power at a speed.
+
+  Torque is undefined at standstill, so it is 0 below `MIN_OMEGA_MECH`.
+
+  Args:
+    power: float or array representing the mechanical power [W].
+    omega_mech: float or array representing the mechanical speed [rad/s].
+  """
+  if np.ndim(omega_mech) == 0:
+    if abs(omega_mech) < MIN_OMEGA_MECH:
+      return 0.0 * power
+    return power / omega_mech
+
+  stalled = np.abs(omega_mech) < MIN_OMEGA_MECH
+  return np.where(stalled, 0.0, power / np.where(stalled, 1.0, omega_mech))
+
+
 class Motor:
 
   def __init__(
@@ -49,9 +78,19 @@ class Motor:
     self._update_losses()
 
     # TODO(jmbagara): Make generic function for injecting noise.
-    self.torque_mech = (elec_power - self.motor_losses) / self.omega_mech
+    self.torque_mech = calculate_torque(
+        elec_power - self.motor_losses, self.omega_mech)
 
   def update_outputs(self):
     """Updates motor outputs for each time step."""
     self._calculate_step()
     return self.torque_mech, self.motor_losses
+
+  def get_state(self):
+    """Returns the motor state, as a dict of plain values."""
+    return {name: getattr(self, name) for name in _STATE_ATTRIBUTES}
+
+  def set_state(self, state):
+    """Restores a state returned by `get_state`."""
+    for name in _STATE_ATTRIBUTES:
+      setattr(self, name, state[name])
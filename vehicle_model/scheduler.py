@@ -0,0 +1,112 @@
+"""Multi-rate scheduler for stepping subsystems on a shared simulated clock."""
+
+import heapq
+
+
+# Constants.
+_TIME_TOLERANCE = 1e-9  # [s], deadlines this close to the target time are due.
+
+
+class SchedulerError(Exception):
+  pass
+
+
+class _Task:
+  """A periodic task. Deadlines are counted in whole periods, so they do not
+  accumulate floating point drift over long runs."""
+
+  __slots__ = ("name", "period", "callback", "num_runs")
+
+  def __init__(self, name, period, callback):
+    self.name = name
+    self.period = period
+    self.callback = callback
+    self.num_runs = 0
+
+  def next_deadline(self):
+    return (self.num_runs + 1) * self.period
+
+
+class MultiRateScheduler:
+  """Runs periodic tasks, each at its own update period.
+
+  Each task runs whenever the clock reaches one of its deadlines, and is handed
+  the time and its period. Tasks due at the same instant run in the order they
+  were added, so adding producers before consumers lets consumers see fresh
+  values. Between runs, a task's outputs are held by whoever reads them i.e. a
+  zero-order hold; consumers wanting averages over their own period, e.g. of
+  power losses, accumulate them from the producer.
+  """
+
+  def __init__(self):
+    self._tasks = {}
+    self._deadlines = []  # Heap of (deadline, order, task).
+    self._time = 0.0
+
+  def add_task(self, name, period, callback):
+    """Adds a periodic task.
+
+    Args:
+      name: string representing a unique task name.
+      period: float representing the task update period [s].
+      callback: callable invoked as `callback(time, period)` at each deadline.
+    """
+    if name in self._tasks:
+      raise SchedulerError(f"Task {name} already exists.")
+    if period <= 0:
+      raise SchedulerError(f"Task {name} period should be positive.")
+
+    task = _Task(name, period, callback)
+    task.num_runs = int(self._time / period + _TIME_TOLERANCE)
+    self._tasks[name] = task
+    heapq.heappush(
+        self._deadlines, (task.next_deadline(), len(self._tasks), task))
+
+  def get_time(self):
+    """Returns the current time [s] of the scheduler clock."""
+    return self._time
+
+  def get_period(self, name):
+    """Returns the update period [s] of a task."""
+    return self._tasks[name].period
+
+  def get_state(self):
+    """Returns the clock and task run counts, as a dict of plain values."""
+    return {
+        "time": self._time,
+        "num_runs": {name: task.num_runs for name, task in self._tasks.items()},
+    }
+
+  def set_state(self, state):
+    """Restores a state returned by `get_state`, for the same set of tasks."""
+    if set(state["num_runs"]) != set(self._tasks):
+      raise SchedulerError(
+          f"State tasks {sorted(state['num_runs'])} do not match "
+          f"{sorted(self._tasks)}.")
+
+    self._time = state["time"]
+    self._deadlines = []
+    for order, (name, task) in enumerate(self._tasks.items(), start=1):
+      task.num_runs = state["num_runs"][name]
+      heapq.heappush(self._deadlines, (task.next_deadline(), order, task))
+
+  def advance(self, duration):
+    """Advances the clock by `duration` [s], running every task that is due.
+
+    Returns:
+      num_runs: int representing the number of task runs.
+    """
+    end_time = self._time + duration
+    deadlines = self._deadlines
+    num_runs = 0
+
+    while deadlines and deadlines[0][0] <= end_time + _TIME_TOLERANCE:
+      deadline, order, task = heapq.heappop(deadlines)
+      self._time = deadline
+      task.callback(deadline, task.period)
+      task.num_runs += 1
+      num_runs += 1
+      heapq.heappush(deadlines, (task.next_deadline(), order, task))
+
+    self._time = end_time
+    return num_runs
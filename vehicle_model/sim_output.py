@@ -0,0 +1,92 @@
+"""Fixed-layout record of vehicle simulation outputs."""
+
+import collections.abc
+
+import numpy as np
+
+
+# Constants.
+# Sim output signals, in their stable column order.
+SIGNALS = (
+    # Vehicle ID.
+    "vehicle_id",
+    # Time.
+    "elapsed_time",
+    # Battery.
+    "v_bus", "i_bus", "batt_soc",
+    # Inverter.
+    "v_d", "v_q", "i_d", "iq_cmd",
+    # Motor.
+    "torque_mech", "omega_mech",
+    # Cooling System.
+    "T_junc_batt", "T_junc_inverter", "T_junc_motor", "T_fluid",
+)
+NUM_SIGNALS = len(SIGNALS)
+# Names used by ECU diagnostics (`dtcs.yaml`) for some of the signals above.
+SIGNAL_ALIASES = {
+    "i_q": "iq_cmd",
+}
+SIGNAL_INDEX = {signal: index for index, signal in enumerate(SIGNALS)}
+SIGNAL_INDEX.update(
+    {alias: SIGNAL_INDEX[signal] for alias, signal in SIGNAL_ALIASES.items()})
+# Structured dtype with one named float64 field per signal, in column order.
+RECORD_DTYPE = np.dtype([(signal, np.float64) for signal in SIGNALS])
+
+
+class SimOutput(collections.abc.Mapping):
+  """Sim outputs of a vehicle at one time step.
+
+  Values live in a flat float64 array laid out as `SIGNALS`, which is updated
+  in place every step rather than reallocated. Consumers can take zero-copy
+  views of it with `as_array` / `as_structured`, stack rows of many records into
+  larger arrays, or read it like the dictionary it replaces e.g.
+  `sim_out["v_bus"]`. NOTE: `vehicle_id` is stored as a float, like all signals.
+  """
+
+  __slots__ = ("_array",)
+
+  def __init__(self, array=None):
+    """Initializes a SimOutput.
+
+    Args:
+      array: optional float64 array of length `NUM_SIGNALS` to use as storage,
+        e.g. a row of a larger array. A zeroed array is allocated if `None`.
+    """
+    if array is None:
+      array = np.zeros(NUM_SIGNALS)
+    self._array = array
+
+  def __getitem__(self, signal):
+    return float(self._array[SIGNAL_INDEX[signal]])
+
+  def __setitem__(self, signal, value):
+    self._array[SIGNAL_INDEX[signal]] = value
+
+  def __iter__(self):
+    return iter(SIGNALS)
+
+  def __len__(self):
+    return NUM_SIGNALS
+
+  def __repr__(self):
+    return repr(self.to_dict())
+
+  def as_array(self):
+    """Returns a zero-copy float64 view of the record, in `SIGNALS` order."""
+    return self._array
+
+  def as_structured(self):
+    """Returns a zero-copy view of the record as a `RECORD_DTYPE` array."""
+    return self._array.view(RECORD_DTYPE)
+
+  def set_values(self, values):
+    """Overwrites all signal values, given in `SIGNALS` order."""
+    self._array[:] = values
+
+  def copy(self):
+    """Returns a snapshot of the record that is not updated in place."""
+    return SimOutput(self._array.copy())
+
+  def to_dict(self):
+    """Returns the record as a dictionary keyed by signal name."""
+    return dict(zip(SIGNALS, self._array.tolist()))
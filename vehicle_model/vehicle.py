@@ -1,11 +1,22 @@
 """Model of a vehicle Powertrain."""
 
+import json
 import math
-# TODO(jmbagara): Remove this import.
-import random
+import threading
 import time
+import zlib
+
+import numpy as np
 
 from common import model_math
+from digital_twin_model import fault_injection
+from telemetry import event_log
+from vehicle_model import scheduler, sim_output
+from vehicle_model.diagnostics import debounce
+from vehicle_model.diagnostics import dtc_util
+from vehicle_model.diagnostics import monitor
+from vehicle_model.diagnostics import watchdog
+from vehicle_model.ecu import signal_bus
 from vehicle_model.plant import cooling_system, battery, inverter, motor
 
 
@@ -13,6 +24,46 @@ from vehicle_model.plant import cooling_system, battery, inverter, motor
 RUN_TIME = 20  # [Sec], simulation runtime.
 DATA_RATE = 0.01  # [Sec], interval at which to yield simulation data.
 
+# Plant update periods for multi-rate simulation, see `Vehicle`. ECU diagnostics
+# run at the `frequency` of their DTCs in `dtcs.yaml`.
+UPDATE_PERIODS = {
+    "battery": 1e-2,  # [s], SOC changes slowly.
+    "inverter": 1e-4,  # [s], i.e. 10 kHz electrical sub-steps.
+    "motor": 1e-3,  # [s].
+    "cooling_system": 1e-1,  # [s], thermal time constants are seconds.
+}
+
+# Percent amplitude of white noise added to sim output signals, if any.
+NOISE_AMPLITUDES = {
+    "v_bus": 0.01,
+    "i_bus": 0.01,
+    "torque_mech": 0.02,
+    "omega_mech": 0.02,
+    "T_junc_batt": 0.01,
+    "T_junc_inverter": 0.01,
+    "T_junc_motor": 0.01,
+    "T_fluid": 0.01,
+}
+_TIME_TOLERANCE = 1e-9  # [s].
+# Shortest span of constant drive cycle inputs fast-forwarded by `advance`,
+# shorter ones being cheaper to step.
+_MIN_JUMP = 0.1  # [s].
+
+# Checkpoints are a magic/version header followed by zlib compressed JSON state.
+CHECKPOINT_MAGIC = b"VCKP"
+CHECKPOINT_VERSION = 7
+# Vehicle attributes (less their leading underscore) making up its state.
+_STATE_ATTRIBUTES = (
+    "elapsed_time", "i_bus_cmd", "fluid_velocity", "cycle_offset",
+    "v_bus", "i_bus", "batt_soc", "v_d", "v_q", "i_d", "iq_cmd",
+    "torque_mech", "omega_mech", "theta_elec",
+    "T_junc_batt", "T_junc_inverter", "T_junc_motor", "T_fluid",
+    "batt_losses", "inverter_losses", "motor_losses", "rationality_mask",
+    "checked_rationality_mask", "next_rationality_check", "rationality_settled",
+    "injected_faults", "injected_dtcs_settled")
+_LOSS_ENERGY_ATTRIBUTES = (
+    "batt_loss_energy", "inverter_loss_energy", "motor_loss_energy")
+
 # TODO(jmbagara): Move these parameters to a YAML file.
 
 # Battery parameters.
@@ -47,15 +98,50 @@ pipe_area = 2e-4  # [m^2], assumes 5/8 inch diameter cooling pipes.
 fluid_heat_capacity = 3283  # [J/kg.K], specific heat capacity of cooling fluid.
 
 
+class CheckpointError(Exception):
+  pass
+
+
 class Vehicle:
   """Representation of a vehicle powertrain."""
 
-  def __init__(self, vehicle_id=1, fault_injection_mode=False):
+  def __init__(
+      self, vehicle_id=1, fault_injection_mode=False, seed=None,
+      update_periods=None, drive_cycle=None, cycle_offset=0.0):
+    """Initializes a Vehicle.
+
+    Args:
+      vehicle_id: int representing the vehicle ID.
+      fault_injection_mode: bool enabling random fault injection in the ECUs.
+      seed: optional int seeding the run. Together with `vehicle_id` it fixes
+        every random draw of the vehicle, for reproducible runs.
+      update_periods: optional dict mapping subsystems ("battery", "inverter",
+        "motor", "cooling_system") and ECUs ("bmm", "pmm") to update periods
+        [s], overriding `UPDATE_PERIODS` and the ECU defaults. If `None`, all
+        subsystems update once per time step instead, at a single rate.
+      drive_cycle: optional `drive_cycle.DriveCycle` feeding `i_bus_cmd`,
+        `omega_mech` and `fluid_velocity`. Inputs are constant if `None`.
+      cycle_offset: float representing the time [s] into the drive cycle at
+        which the run starts.
+    """
     self._vehicle_id = vehicle_id
+    self._seed = seed
+    self._fault_injection_mode = fault_injection_mode
+    noise_rng, bmm_rng, pmm_rng = model_math.make_rngs(
+        vehicle_id, seed, num_streams=3)
+
+    # ECU messages stay within the vehicle, however many share the process.
+    self._bus = signal_bus.SignalBus()
+
     self._battery = battery.Battery(
-        v_nominal, q_nominal, r_internal, fault_injection_mode)
+        v_nominal, q_nominal, r_internal, fault_injection_mode, rng=bmm_rng,
+        bus=self._bus)
     self._inverter = inverter.Inverter(
-        r_ds_on, f_switching, t_rise, t_fall, fault_injection_mode)
+        r_ds_on, f_switching, t_rise, t_fall, fault_injection_mode,
+        rng=pmm_rng, bus=self._bus)
+    self._ecus = {"bmm": self._battery.bmm, "pmm": self._inverter.pmm}
+    for ecu_instance in self._ecus.values():
+      ecu_instance.vehicle_id = vehicle_id
     self._motor = motor.Motor(
         Ld, Lq, Ke, Rs, n_pp, flux_linkage, fault_injection_mode)
     self._cooling_sys = cooling_system.CoolingSystem(
@@ -66,12 +152,14 @@ class Vehicle:
     self._loop_start_timestamp = None
     self._loop_end_timestamp = None
     self._loop_dt = None
-    self._elapsed_time = None
+    self._elapsed_time = 0.0  # [s], simulated time since start of the run.
 
     # TODO(jmbagara): Make these "dynamic" as they should be.
     # Simulator input variables.
     self._i_bus_cmd = 200  # [A].
     self._fluid_velocity = 2  # [m/s], typical 6-8 ft/s (1.8-2.4 m/s) flow rate.
+    self._drive_cycle = drive_cycle
+    self._cycle_offset = cycle_offset
 
     # TODO(jmbagara): Make these "dynamic" as they should be.
     # Simulator output variables.
@@ -88,124 +176,853 @@ class Vehicle:
     self._torque_mech = 0
     self._omega_mech = 100.0  # [rad/s].
     self._theta_elec = 0  # TODO(jmbagara): Clean up usage of this variable.
-    ## Cooling System.
-    self._T_junc_batt = 0.0
-    self._T_junc_inverter = 0.0
-    self._T_junc_motor = 0.0
-    self._T_fluid = 0.0
+    if self._drive_cycle:
+      self._update_inputs()
+    ## Cooling System, at ambient until the first update.
+    self._T_junc_batt = float(T_ambient)
+    self._T_junc_inverter = float(T_ambient)
+    self._T_junc_motor = float(T_ambient)
+    self._T_fluid = float(T_ambient)
+
+    # Sensor noise, generated in blocks.
+    self._noise = model_math.WhiteNoise(noise_rng)
 
     # Power loss variables.
     self._batt_losses = 0.0
     self._inverter_losses = 0.0
     self._motor_losses = 0.0
 
-    self._sim_out = {
+    # Sim outputs, as a fixed-layout record updated in place every step.
+    self._sim_out = sim_output.SimOutput()
+    self._sim_out.set_values((
       # Vehicle ID.
-      "vehicle_id": self.get_vehicle_id(),
+      self.get_vehicle_id(),
       # Time.
-      "elapsed_time": self._elapsed_time,
+      self._elapsed_time,
       # Battery.
-      "v_bus": self._v_bus,
-      "i_bus": self._i_bus,
-      "batt_soc": self._batt_soc,
+      self._v_bus, self._i_bus, self._batt_soc,
       # Inverter.
-      "v_d": self._v_d,
-      "v_q": self._v_q,
-      "i_d": self._i_d,
-      "iq_cmd": self._iq_cmd,
+      self._v_d, self._v_q, self._i_d, self._iq_cmd,
       # Motor.
-      "torque_mech": self._torque_mech,
-      "omega_mech": self._omega_mech,
+      self._torque_mech, self._omega_mech,
       # Cooling System.
-      "T_junc_batt": self._T_junc_batt,
-      "T_junc_inverter": self._T_junc_inverter,
-      "T_junc_motor": self._T_junc_motor,
-      "T_fluid": self._T_fluid,
-    }
+      self._T_junc_batt, self._T_junc_inverter, self._T_junc_motor,
+      self._T_fluid,
+    ))
+    self._sim_out_array = self._sim_out.as_array()
+    self._noise_amplitudes = np.array(
+        [NOISE_AMPLITUDES.get(signal, 0.0) for signal in sim_output.SIGNALS])
+    # (Sim output index less 1, amplitude) of the noisy signals, in layout
+    # order, for the stepped outputs.
+    self._noisy_signals = tuple(sorted(
+        (sim_output.SIGNAL_INDEX[signal] - 1, amplitude)
+        for signal, amplitude in NOISE_AMPLITUDES.items()))
+    self._recorders = []
+
+    # Rationality DTC checks, and the bitmask of those failing at their last
+    # run. They run on the sim outputs at the ECU diagnostics rate, and their
+    # debounced transitions are logged. `check_rationality` keeps its own mask,
+    # of the DTCs failing at its last call.
+    self._monitor = monitor.get_rationality_monitor()
+    self._rationality_mask = 0
+    self._checked_rationality_mask = 0
+    self._rationality_period = 1 / max(
+        dtc_util.get_ecu_frequency(ecu, ecu_instance.dtcs_dict)
+        for ecu, ecu_instance in self._ecus.items())
+    self._next_rationality_check = 0.0  # [s].
+    self._rationality_bits = np.array(
+        [1 << bit for bit in range(self._monitor.get_num_dtcs())],
+        dtype=np.uint64)
+    self._rationality_debouncer = debounce.DTCDebouncer(
+        (vehicle_id,), self._monitor.dtcs)
+    # Whether the debounced DTCs matched the last check, i.e. none is pending.
+    # Checks are only debounced when their results change, or until settled.
+    self._rationality_settled = True
+    # The debounced rationality DTCs, as `DTCEntry`s.
+    self._rationality_dtcs = ()
+    self._event_log = None  # The process-wide log if `None`.
+
+    # Faults injected with `inject_fault`, by ECU, and the output values they
+    # force until cleared. Their DTCs are debounced at the ECU diagnostics
+    # rate too, by the vehicle, except under random fault injection, where the
+    # BMM debounces its own along with the random ones.
+    self._injected_faults = {}
+    self._forced_outputs = {}
+    self._injected_dtcs_settled = True
+    # Comms missing DTCs of signals lost to injected faults, raised by a
+    # watchdog on the simulated clock. It only runs from the injection of a
+    # fault forcing missing (NaN) outputs until its DTCs are cleared.
+    self._watchdog = None
+    self._comms_dtcs = ()
+    self._injected_dtc_ecus = [
+        ecu_instance for ecu, ecu_instance in self._ecus.items()
+        if not (fault_injection_mode and ecu == "bmm")]
+
+    self._update_periods = update_periods
+    self._scheduler = None
+    if update_periods is not None:
+      self._init_scheduler(update_periods)
+
+  def _init_scheduler(self, update_periods):
+    """Schedules each subsystem and ECU to update at its own period.
+
+    Tasks run in dependency order at coinciding deadlines, and each consumer
+    holds the latest value of its inputs in between (a zero-order hold), except
+    the cooling system, which averages the power losses over its period.
+    """
+    periods = dict(UPDATE_PERIODS)
+    for ecu, ecu_instance in (
+        ("bmm", self._battery.bmm), ("pmm", self._inverter.pmm)):
+      periods[ecu] = 1 / dtc_util.get_ecu_frequency(
+          ecu, ecu_instance.dtcs_dict)
+    periods.update(update_periods)
+
+    # Power loss energies [J] accumulated since the last cooling system update.
+    self._batt_loss_energy = 0.0
+    self._inverter_loss_energy = 0.0
+    self._motor_loss_energy = 0.0
+
+    self._scheduler = scheduler.MultiRateScheduler()
+    self._scheduler.add_task("battery", periods["battery"], self._update_battery)
+    self._scheduler.add_task("bmm", periods["bmm"], self._run_bmm)
+    self._scheduler.add_task(
+        "inverter", periods["inverter"], self._update_inverter)
+    self._scheduler.add_task("pmm", periods["pmm"], self._run_pmm)
+    self._scheduler.add_task("motor", periods["motor"], self._update_motor)
+    self._scheduler.add_task(
+        "cooling_system", periods["cooling_system"], self._update_cooling_sys)
 
   def get_vehicle_id(self):
     """Returns vehicle ID."""
     return self._vehicle_id
 
+  def get_seed(self):
+    """Returns the seed of the run, or `None` if unseeded."""
+    return self._seed
+
   def run_time_step(self, start_time):
-    """Runs a time step of the vehicle simulation."""
+    """Runs a time step of the vehicle simulation against the wall clock.
+
+    Args:
+      start_time: float representing wall-clock time [s] at start of the run.
+    """
     self._loop_start_timestamp = time.time()
     self._elapsed_time = self._loop_start_timestamp - start_time
 
     if self._loop_end_timestamp:  # Guard against first call.
       # Calculate loop dt.
       self._loop_dt = self._loop_start_timestamp - self._loop_end_timestamp
+      self._update_models(self._loop_dt)
+      self._update_sim_outputs()
+
+    # Capture time at completion of calculation loop.
+    self._loop_end_timestamp = time.time()
+
+  def step(self, dt=DATA_RATE):
+    """Runs a fixed time step of the vehicle simulation on a simulated clock.
+
+    Args:
+      dt: float representing simulated time [s] to advance the vehicle by.
+    """
+    self._loop_dt = dt
+    self._elapsed_time += dt
+    self._update_models(dt)
+    self._update_sim_outputs()
+
+  def run_for(self, sim_seconds, dt=DATA_RATE, callback=None):
+    """Runs the simulation for a span of simulated time, as fast as possible.
+
+    Args:
+      sim_seconds: float representing simulated time [s] to run for.
+      dt: float representing the fixed simulation time step [s].
+      callback: optional callable invoked with the sim outputs after each step.
+    Returns:
+      num_steps: int representing the number of time steps taken.
+    """
+    num_steps = int(round(sim_seconds / dt))
+
+    for _ in range(num_steps):
+      self.step(dt)
+      if callback:
+        callback(self._sim_out)
+
+    return num_steps
+
+  def advance(self, duration, output_period=1.0, callback=None):
+    """Fast-forwards the simulation over a segment of time.
+
+    While `i_bus_cmd`, `omega_mech` and `fluid_velocity` are constant, SOC falls
+    linearly in time and every other output is an algebraic function of SOC
+    and the inputs. Spans of constant inputs are therefore evaluated in closed
+    form, only at the output times and vectorized, instead of being stepped at
+    `DATA_RATE`. On a drive cycle, only the spans where the inputs vary, or
+    that are shorter than `_MIN_JUMP`, are stepped. Vehicles with random or
+    injected faults, or comms missing DTCs still set, or with multi-rate
+    updates cannot be jumped, so they are stepped throughout instead, emitting
+    the same outputs.
+
+    Args:
+      duration: finite, non-negative float representing simulated time [s] to
+        advance by.
+      output_period: finite, positive float representing the interval [s]
+        between emitted sim outputs. The last one is emitted at the end of the
+        segment.
+      callback: optional callable invoked with each emitted `SimOutput`.
+    Returns:
+      (num_outputs, `sim_output.NUM_SIGNALS`) array of the emitted sim outputs,
+      empty if `duration` is 0.
+    Raises:
+      ValueError: if `duration` or `output_period` is out of range.
+    """
+    if not (math.isfinite(duration) and duration >= 0):
+      raise ValueError(
+          f"duration should be finite and non-negative, got {duration}.")
+    if not (math.isfinite(output_period) and output_period > 0):
+      raise ValueError(
+          f"output_period should be finite and positive, got {output_period}.")
+
+    num_outputs = max(math.ceil(duration / output_period - _TIME_TOLERANCE), 0)
+    offsets = np.minimum(
+        np.arange(1, num_outputs + 1) * output_period, duration)
+
+    if not num_outputs:
+      outputs = np.empty((0, sim_output.NUM_SIGNALS))
+    elif (self._fault_injection_mode or self._scheduler or
+          self._injected_faults or self._watchdog is not None):
+      outputs = self._step_to(offsets)
+    elif self._drive_cycle:
+      outputs = self._advance_cycle(offsets)
+    else:
+      outputs = self._fast_forward(offsets)
 
-      # Update battery model.
-      self._battery.update_inputs(self._i_bus_cmd)
-      self._v_bus, self._i_bus, self._batt_soc, self._batt_losses = (
-          self._battery.update_outputs(self._loop_dt))
-
-      # Update inverter model.
-      self._theta_elec = (
-          (self._omega_mech * n_pp * self._elapsed_time) % (2 * math.pi))
-      self._inverter.update_inputs(self._v_bus, self._i_bus, self._theta_elec)
-      self._v_d, self._v_q, self._i_d, self._iq_cmd, self._inverter_losses = (
-          self._inverter.update_outputs())
-
-      # Update motor model.
-      self._motor.update_inputs(
-          self._iq_cmd, self._v_bus, self._i_bus, self._omega_mech)
-      self._torque_mech, self._motor_losses = self._motor.update_outputs()
-
-      # Update cooling system model.
-      self._cooling_sys.update_inputs(
-        self._batt_losses, self._inverter_losses, self._motor_losses,
-        self._fluid_velocity)
-      (self._T_junc_batt, self._T_junc_inverter,
-       self._T_junc_motor, self._T_fluid) = self._cooling_sys.update_outputs()
-
-      # TODO(jmbagara): Make generic function for injecting noise and inject in the plant models.
-      # Update sim outputs.
+    for row in outputs:
+      for recorder in self._recorders:
+        recorder.record(row)
+      if callback:
+        callback(sim_output.SimOutput(row))
+
+    return outputs
+
+  def _step_to(self, offsets):
+    """Steps the models at `DATA_RATE`, sampling sim outputs at `offsets`."""
+    outputs = np.empty((len(offsets), sim_output.NUM_SIGNALS))
+    start_time = self._elapsed_time
+    self._loop_dt = DATA_RATE
+
+    for row, offset in zip(outputs, offsets):
+      num_steps = round((start_time + offset - self._elapsed_time) / DATA_RATE)
+      for _ in range(num_steps):
+        self._elapsed_time += DATA_RATE
+        self._update_models(DATA_RATE)
+      self._update_sim_outputs(record=False)
+      row[:] = self._sim_out_array
+
+    return outputs
+
+  def _advance_cycle(self, offsets):
+    """Jumps the spans of constant drive cycle inputs, stepping the others."""
+    outputs = np.empty((len(offsets), sim_output.NUM_SIGNALS))
+    start_time = self._elapsed_time
+    self._loop_dt = DATA_RATE
+    row = 0
+
+    while row < len(offsets):
+      offset = self._elapsed_time - start_time
+      span_end = self._drive_cycle.get_constant_until(
+          self._elapsed_time + self._cycle_offset) - self._cycle_offset
+      span_end -= start_time
+
+      if span_end - offset >= _MIN_JUMP:
+        # Jump to the end of the span, or to the last output within it.
+        stop = int(np.searchsorted(
+            offsets, span_end + _TIME_TOLERANCE, side="right"))
+        if stop > row:
+          outputs[row:stop] = self._fast_forward(offsets[row:stop] - offset)
+          row = stop
+        else:
+          self._fast_forward(np.array([span_end - offset]))
+        continue
+
+      if offset > offsets[row] - DATA_RATE / 2:
+        self._update_sim_outputs(record=False)
+        outputs[row] = self._sim_out_array
+        row += 1
+      else:
+        self._elapsed_time += DATA_RATE
+        self._update_models(DATA_RATE)
+
+    return outputs
+
+  def _fast_forward(self, offsets):
+    """Evaluates the models in closed form at `offsets`, ending at the last."""
+    times = self._elapsed_time + offsets
+
+    # The models are algebraic in the battery outputs, so they are evaluated on
+    # arrays of them, at every output time at once.
+    self._battery.update_inputs(self._i_bus_cmd)
+    v_bus, i_bus, batt_soc, batt_losses = self._battery.fast_forward(offsets)
+    theta_elec = (self._omega_mech * n_pp * times) % (2 * math.pi)
+    self._inverter.update_inputs(v_bus, i_bus, theta_elec)
+    v_d, v_q, i_d, iq_cmd, inverter_losses = self._inverter.update_outputs()
+    self._motor.update_inputs(iq_cmd, v_bus, i_bus, self._omega_mech)
+    torque_mech, motor_losses = self._motor.update_outputs()
+    self._cooling_sys.update_inputs(
+      batt_losses, inverter_losses, motor_losses, self._fluid_velocity)
+    T_junc_batt, T_junc_inverter, T_junc_motor, T_fluid = (
+        self._cooling_sys.update_outputs())
+
+    outputs = np.empty((len(offsets), sim_output.NUM_SIGNALS))
+    for signal, values in (
+        ("vehicle_id", self.get_vehicle_id()), ("elapsed_time", times),
+        ("v_bus", v_bus), ("i_bus", i_bus), ("batt_soc", batt_soc),
+        ("v_d", v_d), ("v_q", v_q), ("i_d", i_d), ("iq_cmd", iq_cmd),
+        ("torque_mech", torque_mech), ("omega_mech", self._omega_mech),
+        ("T_junc_batt", T_junc_batt), ("T_junc_inverter", T_junc_inverter),
+        ("T_junc_motor", T_junc_motor), ("T_fluid", T_fluid)):
+      outputs[:, sim_output.SIGNAL_INDEX[signal]] = values
+    self._noise.add_array(outputs, self._noise_amplitudes, out=outputs)
+
+    # Leave every model in its (scalar) state at the end of the segment.
+    self._elapsed_time = float(times[-1])
+    self._v_bus, self._i_bus, self._batt_soc, self._batt_losses = (
+        self._battery.get_outputs())
+    self._update_driven_models()
+    self._sim_out_array[:] = outputs[-1]
+    self._run_diagnostics()  # Only on the last outputs.
+
+    return outputs
+
+  def get_elapsed_time(self):
+    """Returns the simulated time [s] elapsed since the start of the run."""
+    return self._elapsed_time
+
+  def _update_models(self, dt):
+    """Updates the plant models by a time step of `dt` seconds."""
+    if self._drive_cycle:
+      self._update_inputs()
+
+    if self._scheduler:
+      self._scheduler.advance(dt)
+      return
+
+    # Update battery model.
+    self._battery.update_inputs(self._i_bus_cmd)
+    self._v_bus, self._i_bus, self._batt_soc, self._batt_losses = (
+        self._battery.update_outputs(dt))
+    if self._forced_outputs:
+      self._apply_forced_outputs()
+
+    self._update_driven_models()
+
+  def _update_inputs(self):
+    """Reads the simulator inputs off the drive cycle at the current time."""
+    self._i_bus_cmd, self._omega_mech, self._fluid_velocity = (
+        self._drive_cycle.values(self._elapsed_time + self._cycle_offset))
+
+  def _update_driven_models(self):
+    """Updates the models driven by the battery outputs."""
+    # Update inverter model.
+    self._theta_elec = (
+        (self._omega_mech * n_pp * self._elapsed_time) % (2 * math.pi))
+    self._inverter.update_inputs(self._v_bus, self._i_bus, self._theta_elec)
+    self._v_d, self._v_q, self._i_d, self._iq_cmd, self._inverter_losses = (
+        self._inverter.update_outputs())
+
+    # Update motor model.
+    self._motor.update_inputs(
+        self._iq_cmd, self._v_bus, self._i_bus, self._omega_mech)
+    self._torque_mech, self._motor_losses = self._motor.update_outputs()
+
+    # Update cooling system model.
+    self._cooling_sys.update_inputs(
+      self._batt_losses, self._inverter_losses, self._motor_losses,
+      self._fluid_velocity)
+    (self._T_junc_batt, self._T_junc_inverter,
+     self._T_junc_motor, self._T_fluid) = self._cooling_sys.update_outputs()
+    if self._forced_outputs:
+      self._apply_forced_outputs()
+
+  def _update_battery(self, unused_time, period):
+    """Multi-rate task updating the battery model."""
+    self._battery.update_inputs(self._i_bus_cmd)
+    self._v_bus, self._i_bus, self._batt_soc, self._batt_losses = (
+        self._battery.update_outputs(period, run_diagnostics=False))
+    self._batt_loss_energy += self._batt_losses * period
+    if self._forced_outputs:
+      self._apply_forced_outputs()
+
+  def _run_bmm(self, unused_time, unused_period):
+    """Multi-rate task running BMM diagnostics."""
+    self._v_bus, self._i_bus, self._batt_soc, self._batt_losses = (
+        self._battery.run_diagnostics())
+    if self._forced_outputs:
+      self._apply_forced_outputs()
+
+  def _update_inverter(self, time_now, period):
+    """Multi-rate task updating the inverter model."""
+    self._theta_elec = (self._omega_mech * n_pp * time_now) % (2 * math.pi)
+    self._inverter.update_inputs(self._v_bus, self._i_bus, self._theta_elec)
+    self._v_d, self._v_q, self._i_d, self._iq_cmd, self._inverter_losses = (
+        self._inverter.update_outputs(run_diagnostics=False))
+    self._inverter_loss_energy += self._inverter_losses * period
+    if self._forced_outputs:
+      self._apply_forced_outputs()
+
+  def _run_pmm(self, unused_time, unused_period):
+    """Multi-rate task running PMM diagnostics."""
+    self._v_d, self._v_q, self._i_d, self._iq_cmd, self._inverter_losses = (
+        self._inverter.run_diagnostics())
+    if self._forced_outputs:
+      self._apply_forced_outputs()
+
+  def _update_motor(self, unused_time, period):
+    """Multi-rate task updating the motor model."""
+    self._motor.update_inputs(
+        self._iq_cmd, self._v_bus, self._i_bus, self._omega_mech)
+    self._torque_mech, self._motor_losses = self._motor.update_outputs()
+    self._motor_loss_energy += self._motor_losses * period
+
+  def _update_cooling_sys(self, unused_time, period):
+    """Multi-rate task updating the cooling system on average losses."""
+    self._cooling_sys.update_inputs(
+      self._batt_loss_energy / period, self._inverter_loss_energy / period,
+      self._motor_loss_energy / period, self._fluid_velocity)
+    (self._T_junc_batt, self._T_junc_inverter,
+     self._T_junc_motor, self._T_fluid) = self._cooling_sys.update_outputs()
+
+    self._batt_loss_energy = 0.0
+    self._inverter_loss_energy = 0.0
+    self._motor_loss_energy = 0.0
+    if self._forced_outputs:
+      self._apply_forced_outputs()
+
+  def _apply_forced_outputs(self):
+    """Overrides the model and ECU outputs forced by injected faults."""
+    for signal, value in self._forced_outputs.items():
+      setattr(self, "_" + signal, value)
+      for ecu_instance in self._ecus.values():
+        if signal in ecu_instance.output_dict:
+          ecu_instance.output_dict[signal] = value
+
+  def _update_sim_outputs(self, record=True):
+    """Copies the latest model state, with sensor noise, to the sim outputs.
+
+    Args:
+      record: bool, if `True` the sim outputs are passed to the recorders.
+    """
+    # TODO(jmbagara): Make generic function for injecting noise and inject in the plant models.
+    values = [
       ## Time.
-      self._sim_out["elapsed_time"] = self._elapsed_time
+      self._elapsed_time,
       ## Battery.
-      self._sim_out["v_bus"] = model_math.add_white_noise(self._v_bus, 0.01)
-      self._sim_out["i_bus"] = model_math.add_white_noise(self._i_bus, 0.01)
-      self._sim_out["batt_soc"] = self._batt_soc
+      self._v_bus,
+      self._i_bus,
+      self._batt_soc,
       ## Inverter.
-      self._sim_out["v_d"] = self._v_d
-      self._sim_out["v_q"] = self._v_q
-      self._sim_out["i_d"] = self._i_d
-      self._sim_out["iq_cmd"] = self._iq_cmd
+      self._v_d,
+      self._v_q,
+      self._i_d,
+      self._iq_cmd,
       ## Motor.
-      self._sim_out["torque_mech"] = model_math.add_white_noise(
-          self._torque_mech, 0.02)
-      self._sim_out["omega_mech"] = model_math.add_white_noise(
-          self._omega_mech, 0.02)
+      self._torque_mech,
+      self._omega_mech,
       ## Cooling System.
-      self._sim_out["T_junc_batt"] = model_math.add_white_noise(
-          self._T_junc_batt, 0.01)
-      self._sim_out["T_junc_inverter"] = model_math.add_white_noise(
-          self._T_junc_inverter, 0.01)
-      self._sim_out["T_junc_motor"] = model_math.add_white_noise(
-          self._T_junc_motor, 0.01)
-      self._sim_out["T_fluid"] = model_math.add_white_noise(
-          self._T_fluid, 0.01)
+      self._T_junc_batt,
+      self._T_junc_inverter,
+      self._T_junc_motor,
+      self._T_fluid,
+    ]
+    # Same `NOISE_AMPLITUDES` as the jumped outputs of `_fast_forward`.
+    noise = self._noise
+    for index, amplitude in self._noisy_signals:
+      values[index] = noise.add(values[index], amplitude)
+    self._sim_out_array[1:] = values
 
-    # Capture time at completion of calculation loop.
-    self._loop_end_timestamp = time.time()
+    self._run_diagnostics()
+
+    if record:
+      for recorder in self._recorders:
+        recorder.record(self._sim_out_array)
+
+  def attach_recorder(self, recorder):
+    """Attaches a recorder, e.g. a `TelemetryRecorder`, to the sim outputs.
+
+    Args:
+      recorder: object with a `record(row)` method, called with a view of the
+        sim outputs array after every time step.
+    """
+    self._recorders.append(recorder)
 
   def get_sim_outputs(self):
-    """Gets the sim outputs at the current time."""
-    time.sleep(DATA_RATE)  # Limit period of data retrieval.
+    """Gets the sim outputs at the current time.
+
+    Returns:
+      A `sim_output.SimOutput` record, updated in place on each time step; use
+      its `copy` method to keep a snapshot.
+    """
     return self._sim_out
 
+  def get_active_dtcs(self):
+    """Returns a dict mapping each ECU to the list of its active DTCs.
+
+    The lists hold the DTCs of the ECUs' own diagnostics, then the debounced
+    rationality and the comms missing DTCs the vehicle checks on their behalf,
+    which may add ECUs.
+    """
+    active_dtcs = {ecu: list(ecu_instance.get_dtcs())
+                   for ecu, ecu_instance in self._ecus.items()}
+    for entry in (*self._rationality_dtcs, *self._comms_dtcs):
+      active_dtcs.setdefault(entry.ecu, []).append(entry.dtc)
+
+    return active_dtcs
+
+  def check_rationality(self):
+    """Evaluates the rationality DTCs of `dtcs.yaml` on the sim outputs.
+
+    Returns:
+      set_mask: int bitmask of the DTCs set since the last check, with bits
+        as in `monitor.RationalityMonitor`.
+      cleared_mask: int bitmask of the DTCs cleared since the last check.
+    """
+    self._checked_rationality_mask, set_mask, cleared_mask = (
+        self._monitor.update(
+            self._sim_out_array, self._checked_rationality_mask))
+    return set_mask, cleared_mask
+
+  def _run_diagnostics(self):
+    """Runs the vehicle's diagnostics, at the ECU diagnostics rate, if due."""
+    if self._elapsed_time < self._next_rationality_check - _TIME_TOLERANCE:
+      return
+    self._next_rationality_check = self._elapsed_time + self._rationality_period
+
+    if not self._injected_dtcs_settled:
+      self._update_injected_dtcs()
+    if self._watchdog is not None:
+      self._run_comms_watchdog()
+    self._run_rationality_checks()
+
+  def _update_injected_dtcs(self):
+    """Debounces the DTCs of injected faults, until cleared and settled."""
+    settled = True
+    for ecu_instance in self._injected_dtc_ecus:
+      ecu_instance.update_dtcs(now=self._elapsed_time)
+      settled = settled and not ecu_instance.held_dtcs and (
+          ecu_instance.debouncer.is_settled())
+    self._injected_dtcs_settled = settled
+
+  def _run_comms_watchdog(self):
+    """Runs the comms missing checks, logging DTC transitions."""
+    events = np.concatenate((
+        self._watchdog.observe(self._sim_out_array, self._elapsed_time),
+        self._watchdog.advance(self._elapsed_time)))
+    if len(events):
+      self._comms_dtcs = self._watchdog.get_dtcs(self._vehicle_id)
+      dtc_event_log = self._event_log or event_log.get_default_log()
+      dtc_event_log.log(events, self._sim_out_array)
+
+    if not (self._comms_dtcs or self._forces_missing_outputs()):
+      self._watchdog = None
+
+  def _forces_missing_outputs(self):
+    """Returns whether injected faults force missing (NaN) outputs."""
+    return any(math.isnan(value) for value in self._forced_outputs.values())
+
+  def _run_rationality_checks(self):
+    """Runs the rationality checks, logging debounced transitions."""
+    previous_mask = self._rationality_mask
+    self._rationality_mask = self._monitor.evaluate(self._sim_out_array)
+    if self._rationality_settled and self._rationality_mask == previous_mask:
+      return  # The debounced DTCs already match.
+
+    failing = (np.uint64(self._rationality_mask) & self._rationality_bits) != 0
+    events = self._rationality_debouncer.update(failing, self._elapsed_time, 0)
+    self._rationality_settled = self._rationality_debouncer.is_settled()
+    if len(events):
+      self._rationality_dtcs = self._rationality_debouncer.get_active_dtcs()
+      dtc_event_log = self._event_log or event_log.get_default_log()
+      dtc_event_log.log(events, self._sim_out_array)
+
+  def set_event_log(self, dtc_event_log):
+    """Sets the `event_log.DTCEventLog` of the vehicle's DTC events.
+
+    Args:
+      dtc_event_log: `event_log.DTCEventLog`, or `None` for the process-wide
+        one.
+    """
+    self._event_log = dtc_event_log
+    for ecu_instance in self._ecus.values():
+      ecu_instance.set_event_log(dtc_event_log)
+
+  def get_rationality_dtcs(self):
+    """Returns a dict mapping ECUs to their failing rationality DTCs.
+
+    DTCs are as of the last `check_rationality` call.
+    """
+    rationality_dtcs = {}
+    for entry in self._monitor.get_dtcs(self._checked_rationality_mask):
+      rationality_dtcs.setdefault(entry.ecu, []).append(entry.dtc)
+
+    return rationality_dtcs
+
+  def inject_fault(self, ecu, fault_type):
+    """Injects a fault in an ECU, until it is cleared with `clear_fault`.
+
+    The fault forces the sim outputs of its type, e.g. zero bus voltage and
+    current for a short circuit, in place of the model outputs. Its DTCs fail
+    every ECU diagnostics evaluation, and are set once debounced. The comms
+    missing DTCs of missing outputs are set by a watchdog, once they time out.
+
+    Args:
+      ecu: string representing the ECU, "bmm" or "pmm". A fault injected
+        earlier in the ECU is replaced.
+      fault_type: string, one of `fault_injection.FAULT_TYPES`.
+    """
+    ecu_instance = self._ecus[ecu]
+    ecu_instance.fault_injector.inject_fault(fault_type)
+    ecu_instance.held_dtcs = tuple(
+        ecu_instance.fault_injector.get_active_dtcs())
+    self._injected_faults[ecu] = fault_type
+    self._injected_dtcs_settled = False
+    self._update_forced_outputs()
+    self._apply_forced_outputs()
+    if self._watchdog is None and self._forces_missing_outputs():
+      # Every signal was last seen at the injection.
+      self._watchdog = watchdog.CommsWatchdog(
+          (self._vehicle_id,), now=self._elapsed_time)
+
+  def clear_fault(self, ecu):
+    """Clears the fault injected in an ECU, if any.
+
+    The model outputs are restored from the next update, and the fault's DTCs
+    are cleared once debounced.
+
+    Args:
+      ecu: string representing the ECU, "bmm" or "pmm".
+    """
+    fault_type = self._injected_faults.pop(ecu, None)
+    if fault_type is None:
+      return
+
+    ecu_instance = self._ecus[ecu]
+    ecu_instance.fault_injector.clear_fault(fault_type)
+    ecu_instance.held_dtcs = ()
+    self._update_forced_outputs()
+
+  def _update_forced_outputs(self):
+    """Collects the output values forced by the injected faults."""
+    self._forced_outputs = {}
+    for fault_type in self._injected_faults.values():
+      # A separate injector, as random fault injection reuses the ECUs' own.
+      injector = fault_injection.FaultInjector()
+      injector.inject_fault(fault_type)
+      self._forced_outputs.update(
+          (signal, value)
+          for signal, value in injector.get_vehicle_output().items()
+          if value is not None and signal != "vehicle_id")
+
+  def get_state(self):
+    """Returns the full simulation state, as a dict of plain values.
+
+    The state covers the inputs, every plant model and ECU, incl. injected
+    faults and active DTCs, the multi-rate schedule and every random stream, so
+    a vehicle restored from it continues exactly as this one would. Recorders
+    are not part of the state.
+    """
+    state = {
+        "config": {
+            "vehicle_id": self._vehicle_id,
+            "seed": self._seed,
+            "fault_injection_mode": self._fault_injection_mode,
+            "update_periods": self._update_periods,
+            "drive_cycle": (
+                self._drive_cycle.get_path() if self._drive_cycle else None),
+        },
+        "vehicle": {
+            name: getattr(self, "_" + name) for name in _STATE_ATTRIBUTES},
+        "sim_outputs": self._sim_out_array.tolist(),
+        "noise": self._noise.get_state(),
+        "battery": self._battery.get_state(),
+        "inverter": self._inverter.get_state(),
+        "motor": self._motor.get_state(),
+        "cooling_system": self._cooling_sys.get_state(),
+        "rationality_debouncer": self._rationality_debouncer.get_state(),
+        "watchdog": self._watchdog and self._watchdog.get_state(),
+    }
+
+    if self._scheduler:
+      state["scheduler"] = self._scheduler.get_state()
+      state["loss_energies"] = {
+          name: getattr(self, "_" + name) for name in _LOSS_ENERGY_ATTRIBUTES}
+
+    return state
+
+  def set_state(self, state):
+    """Restores a state returned by `get_state`, of a vehicle of same config."""
+    for name in _STATE_ATTRIBUTES:
+      setattr(self, "_" + name, state["vehicle"][name])
+    self._injected_faults = dict(self._injected_faults)
+    self._update_forced_outputs()
+    self._sim_out_array[:] = state["sim_outputs"]
+    self._noise.set_state(state["noise"])
+
+    self._battery.set_state(state["battery"])
+    self._inverter.set_state(state["inverter"])
+    self._motor.set_state(state["motor"])
+    self._cooling_sys.set_state(state["cooling_system"])
+    self._rationality_debouncer.set_state(state["rationality_debouncer"])
+    self._rationality_dtcs = self._rationality_debouncer.get_active_dtcs()
+    self._watchdog = None
+    self._comms_dtcs = ()
+    if state["watchdog"]:
+      self._watchdog = watchdog.CommsWatchdog((self._vehicle_id,), now=0.0)
+      self._watchdog.set_state(state["watchdog"])
+      self._comms_dtcs = self._watchdog.get_dtcs(self._vehicle_id)
+
+    if self._scheduler:
+      self._scheduler.set_state(state["scheduler"])
+      for name in _LOSS_ENERGY_ATTRIBUTES:
+        setattr(self, "_" + name, state["loss_energies"][name])
+
+    self._loop_start_timestamp = None
+    self._loop_end_timestamp = None
+
+  @classmethod
+  def from_state(cls, state):
+    """Creates a vehicle from a state returned by `get_state`."""
+    config = state["config"]
+    drive_cycle = None
+    if config["drive_cycle"]:
+      from vehicle_model import drive_cycle as drive_cycle_lib
+      drive_cycle = drive_cycle_lib.get_drive_cycle(config["drive_cycle"])
+
+    vehicle_instance = cls(
+        vehicle_id=config["vehicle_id"],
+        fault_injection_mode=config["fault_injection_mode"],
+        seed=config["seed"], update_periods=config["update_periods"],
+        drive_cycle=drive_cycle,
+        cycle_offset=state["vehicle"]["cycle_offset"])
+    vehicle_instance.set_state(state)
+    return vehicle_instance
+
+  def checkpoint(self):
+    """Returns a compact binary checkpoint of the full simulation state."""
+    return (CHECKPOINT_MAGIC + bytes((CHECKPOINT_VERSION,)) +
+            zlib.compress(json.dumps(self.get_state()).encode()))
+
+  @classmethod
+  def restore(cls, checkpoint):
+    """Creates a vehicle from a checkpoint returned by `checkpoint`."""
+    header = CHECKPOINT_MAGIC + bytes((CHECKPOINT_VERSION,))
+    if checkpoint[:len(header)] != header:
+      raise CheckpointError(
+          f"Not a version {CHECKPOINT_VERSION} vehicle checkpoint.")
+
+    return cls.from_state(
+        json.loads(zlib.decompress(checkpoint[len(header):])))
+
+  def fork(self, vehicle_id=None, seed=None):
+    """Branches off an independent copy of the vehicle in its current state.
+
+    Forking a warmed-up vehicle, then e.g. injecting a different fault in each
+    branch, avoids re-simulating their shared prefix.
+
+    Args:
+      vehicle_id: optional int representing the ID of the branch.
+      seed: optional int re-deriving the random streams of the branch, with
+        its vehicle ID. If `None`, the branch replays the draws of this vehicle.
+    Returns:
+      A new `Vehicle`.
+    """
+    state = self.get_state()
+    if vehicle_id is not None:
+      state["config"]["vehicle_id"] = vehicle_id
+      state["sim_outputs"][sim_output.SIGNAL_INDEX["vehicle_id"]] = vehicle_id
+
+    branch = Vehicle.from_state(state)
+    if seed is not None:
+      branch._reseed(seed)
+
+    return branch
+
+  def _reseed(self, seed):
+    """Re-derives every random stream from the vehicle ID and `seed`."""
+    self._seed = seed
+    noise_rng, bmm_rng, pmm_rng = model_math.make_rngs(
+        self._vehicle_id, seed, num_streams=3)
+    self._noise = model_math.WhiteNoise(noise_rng)
+    self._battery.bmm.fault_samples = model_math.UniformBlock(rng=bmm_rng)
+    self._inverter.pmm.fault_samples = model_math.UniformBlock(rng=pmm_rng)
+
+
+class RealTimePacer:
+  """Opt-in wrapper that paces a vehicle simulation against the wall clock.
+
+  The wrapped vehicle still advances on its simulated clock, so traces remain
+  reproducible; the pacer only sleeps so that each step of `period` simulated
+  seconds takes (at least) `period` wall-clock seconds, as the plotter expects.
+  Readers of the sim outputs, e.g. on another thread, wait for the steps
+  rather than pacing themselves.
+  """
+
+  def __init__(self, vehicle_instance, period=DATA_RATE):
+    self._vehicle = vehicle_instance
+    self._period = period
+    self._next_deadline = None
+    # Steps taken, and those seen by `get_sim_outputs`, notified on each step.
+    self._num_steps = 0
+    self._num_read_steps = 0
+    self._stepped = threading.Condition()
+
+  def get_vehicle(self):
+    """Returns the wrapped vehicle instance."""
+    return self._vehicle
+
+  def step(self):
+    """Advances the vehicle by one period, then sleeps until its deadline."""
+    if self._next_deadline is None:
+      self._next_deadline = time.monotonic()
+
+    self._vehicle.step(self._period)
+    with self._stepped:
+      self._num_steps += 1
+      self._stepped.notify_all()
+
+    self._next_deadline += self._period
+    remaining = self._next_deadline - time.monotonic()
+    if remaining > 0:
+      time.sleep(remaining)
+    else:
+      # Running behind; re-anchor rather than bursting to catch up.
+      self._next_deadline = time.monotonic()
+
+  def get_sim_outputs(self):
+    """Gets the sim outputs, once the vehicle has stepped since the last call.
+
+    Returns immediately if it has, and waits at most a period otherwise, so
+    the rate of data retrieval follows `step`.
+    """
+    with self._stepped:
+      self._stepped.wait_for(
+          lambda: self._num_steps != self._num_read_steps, self._period)
+      self._num_read_steps = self._num_steps
+
+    return self._vehicle.get_sim_outputs()
+
+
 def run_vehicle():
   """Runs a standalone vehicle simulation i.e. without plotting."""
   vehicle_1 = Vehicle(vehicle_id=1)
-  start_time = time.time()
-
-  while (time.time() - start_time) <= RUN_TIME:
-    vehicle_1.run_time_step(start_time)
-    msg = vehicle_1.get_sim_outputs()
-    print(msg)
+  vehicle_1.run_for(RUN_TIME, callback=print)
 
 
 if __name__ == "__main__":
   run_vehicle()
+
+  # A fault-free vehicle raises no DTCs, at a single or at multiple rates.
+  for periods in (None, {}):
+    with event_log.DTCEventLog() as dtc_event_log:
+      healthy_vehicle = Vehicle(seed=1, update_periods=periods)
+      healthy_vehicle.set_event_log(dtc_event_log)
+      healthy_vehicle.run_for(RUN_TIME)
+    print(f"Fault-free DTC events: {dtc_event_log.get_num_logged()}, "
+          f"active: {healthy_vehicle.get_active_dtcs()}")